@@ -0,0 +1,221 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Audio Hub
+Legge il ring di jack-ring-socket-server una sola volta e ridistribuisce i blocchi nuovi
+a un numero qualsiasi di consumatori locali (detector, recorder, dashboard...) via Unix socket.
+Ogni subscriber ha il proprio cursore (coda) e la propria politica di backpressure,
+così un consumatore lento non rallenta gli altri né la lettura del ring.
+
+Protocollo (per client vedi HubClient in ring_client.py):
+- il subscriber invia una riga ``SUB <policy> <max_queue_sec> [<history>]\\n``
+  (policy: drop_oldest | drop_newest | disconnect; max_queue_sec: audio massimo accodato;
+  history: 1 = riceve subito l'audio recente già letto dal ring (default), 0 = solo i blocchi successivi)
+- l'hub risponde con HUB_INFO (nframes, len, rate, seconds)
+- poi invia messaggi HUB_CHUNK (first_seq, nblocks) seguiti da nblocks blocchi float32 stereo;
+  un salto nei progressivi indica blocchi scartati.
+"""
+
+import asyncio
+import collections
+import os
+import signal
+import time
+
+from config import (
+    AUDIO_HUB_SOCKET, AUDIO_HUB_SOURCE_TRANSPORT, AUDIO_HUB_POLL_SEC,
+    AUDIO_HUB_DROP_POLICY, AUDIO_HUB_MAX_QUEUE_SEC, AUDIO_HUB_STATS_SEC, AUDIO_HUB_STALE_SEC
+)
+from ring_client import open_ring, HUB_INFO, HUB_CHUNK
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+
+class Subscriber:
+    """
+    Coda di un singolo consumatore. I chunk sono condivisi tra tutti i subscriber
+    (nessuna copia per consumatore): la coda contiene solo riferimenti.
+    """
+
+    def __init__(self, writer, policy, max_blocks, name):
+        self.writer = writer
+        self.policy = policy if policy in DROP_POLICIES else AUDIO_HUB_DROP_POLICY
+        self.max_blocks = max(1, max_blocks)
+        self.name = name
+        self.queue = collections.deque()
+        self.queued_blocks = 0
+        self.sent_blocks = 0
+        self.dropped_blocks = 0
+        self.closed = False
+        self.event = asyncio.Event()
+
+    def offer(self, first_seq, nblocks, payload):
+        """Accoda un chunk applicando la politica di drop se la coda è piena."""
+        if self.closed:
+            return
+        if self.queued_blocks + nblocks > self.max_blocks:
+            if self.policy == "disconnect":
+                self.closed = True
+                self.event.set()
+                return
+            if self.policy == "drop_newest":
+                self.dropped_blocks += nblocks
+                return
+            while self.queue and self.queued_blocks + nblocks > self.max_blocks:
+                _, old_n, _ = self.queue.popleft()
+                self.queued_blocks -= old_n
+                self.dropped_blocks += old_n
+        self.queue.append((first_seq, nblocks, payload))
+        self.queued_blocks += nblocks
+        self.event.set()
+
+    async def run(self):
+        """Invia i chunk in coda finché il consumatore resta connesso."""
+        while not self.closed:
+            await self.event.wait()
+            self.event.clear()
+            while self.queue and not self.closed:
+                first_seq, nblocks, payload = self.queue.popleft()
+                self.queued_blocks -= nblocks
+                self.writer.write(HUB_CHUNK.pack(first_seq, nblocks))
+                self.writer.write(payload)
+                await self.writer.drain()
+                self.sent_blocks += nblocks
+
+
+class AudioHub:
+    """
+    Legge il ring (TCP o shm) e pubblica i blocchi nuovi a tutti i subscriber.
+    """
+
+    def __init__(self, socket_path=AUDIO_HUB_SOCKET, transport=AUDIO_HUB_SOURCE_TRANSPORT,
+                 poll_sec=AUDIO_HUB_POLL_SEC):
+        self.socket_path = socket_path
+        self.transport = transport
+        self.source = open_ring(transport)
+        self.poll_sec = poll_sec
+        self.subscribers = []
+        # Storico dell'ultimo ring letto: un nuovo subscriber riceve subito l'audio recente
+        self.history = collections.deque()
+        self.history_blocks = 0
+        self.blocks_read = 0
+        self.running = True
+        self._next_id = 0
+
+    def _publish(self, first_seq, nblocks, payload):
+        self.history.append((first_seq, nblocks, payload))
+        self.history_blocks += nblocks
+        while self.history and self.history_blocks - self.history[0][1] >= self.source.nblocks:
+            _, old_n, _ = self.history.popleft()
+            self.history_blocks -= old_n
+        for sub in self.subscribers:
+            sub.offer(first_seq, nblocks, payload)
+
+    def _reopen_source(self):
+        """
+        Riapre il ring se il server lo ha ricreato (shm: il segmento mappato è stato rimosso
+        e l'header non avanza più). I progressivi ripartono: i subscriber li vedono come un nuovo flusso.
+        """
+        if not getattr(self.source, 'replaced', lambda: False)():
+            return
+        print("Ring source replaced (server restarted?), reopening")
+        source = open_ring(self.transport)
+        source.connect()
+        self.source.close()
+        self.source = source
+        self.history.clear()
+        self.history_blocks = 0
+
+    async def handle_subscriber(self, reader, writer):
+        """Registra un nuovo subscriber e gli invia i chunk finché resta connesso."""
+        sub = None
+        try:
+            line = await reader.readline()
+            parts = line.decode().split()
+            if len(parts) < 1 or parts[0] != "SUB":
+                writer.close()
+                return
+            policy = parts[1] if len(parts) > 1 else AUDIO_HUB_DROP_POLICY
+            max_queue_sec = float(parts[2]) if len(parts) > 2 else AUDIO_HUB_MAX_QUEUE_SEC
+            send_history = parts[3] != "0" if len(parts) > 3 else True
+            max_blocks = int(max_queue_sec * self.source.samplerate / self.source.nframes)
+            self._next_id += 1
+            sub = Subscriber(writer, policy, max_blocks, f"sub{self._next_id}")
+            writer.write(HUB_INFO.pack(self.source.nframes, self.source.nblocks,
+                                       self.source.samplerate, self.source.seconds))
+            if send_history:
+                for chunk in self.history:
+                    sub.offer(*chunk)
+            self.subscribers.append(sub)
+            print(f"Subscriber {sub.name} connected (policy={sub.policy}, max_blocks={sub.max_blocks})")
+            await sub.run()
+        except (ConnectionError, OSError, ValueError) as e:
+            print(f"Subscriber error: {e}")
+        finally:
+            if sub is not None:
+                sub.closed = True
+                if sub in self.subscribers:
+                    self.subscribers.remove(sub)
+                print(f"Subscriber {sub.name} disconnected (sent {sub.sent_blocks}, dropped {sub.dropped_blocks})")
+            writer.close()
+
+    async def pump(self):
+        """Legge periodicamente il ring e pubblica i blocchi nuovi."""
+        last_stats = time.monotonic()
+        last_block = time.monotonic()
+        while self.running:
+            try:
+                _, stereo_data, first_seq, dropped = self.source.read_new()
+            except Exception as e:
+                print(f"Ring read error: {e}")
+                await asyncio.sleep(0.5)
+                continue
+            nblocks = len(stereo_data) // self.source.nframes
+            if nblocks:
+                # Una sola conversione in bytes, condivisa da tutti i subscriber
+                self._publish(first_seq, nblocks, stereo_data.tobytes())
+                self.blocks_read += nblocks
+                last_block = time.monotonic()
+            elif time.monotonic() - last_block >= AUDIO_HUB_STALE_SEC:
+                # Nessun blocco nuovo: il ring server potrebbe essere stato riavviato su un nuovo segmento
+                last_block = time.monotonic()
+                try:
+                    self._reopen_source()
+                except Exception as e:
+                    print(f"Ring reopen error: {e}")
+            if time.monotonic() - last_stats >= AUDIO_HUB_STATS_SEC:
+                last_stats = time.monotonic()
+                subs = ", ".join(f"{s.name}: queued={s.queued_blocks} dropped={s.dropped_blocks}"
+                                 for s in self.subscribers)
+                print(f"Hub: read {self.blocks_read} blocks, ring dropped {self.source.dropped_blocks} | {subs}")
+            await asyncio.sleep(self.poll_sec)
+
+    async def serve(self):
+        """Avvia il server Unix socket e il ciclo di lettura del ring."""
+        # Primo contatto col ring: definisce nframes/len/rate per l'header dei subscriber
+        self.source.connect()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_subscriber, path=self.socket_path)
+        os.chmod(self.socket_path, 0o666)
+        print(f"Audio hub serving on {self.socket_path}")
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        async with server:
+            await self.pump()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def stop(self):
+        self.running = False
+
+
+def main():
+    hub = AudioHub()
+    asyncio.run(hub.serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Background Writer
+Thread di scrittura su disco con coda limitata: il loop asyncio del detector accoda il salvataggio
+(WAV/JSON) e prosegue subito, così una SD lenta non rallenta la detection.
+
+Quando la coda è piena si applica la politica di scarto (WRITER_DROP_POLICY):
+- "drop_newest": il nuovo salvataggio viene scartato
+- "drop_oldest": viene scartato il salvataggio scartabile più vecchio in coda
+- "block":       il chiamante attende che si liberi un posto
+I salvataggi con ``droppable=False`` (es. detection sopra soglia) non vengono mai scartati:
+se la coda è piena vengono accodati oltre il limite.
+"""
+
+import collections
+import threading
+import time
+
+from config import WRITER_QUEUE_SIZE, WRITER_DROP_POLICY
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class BackgroundWriter:
+    """
+    Esegue le funzioni di salvataggio accodate con ``submit`` in un thread dedicato, in ordine di arrivo.
+    Contatori: queued (accodati), written (completati), dropped (scartati), errors (eccezioni),
+    pending (in coda ora) e high_water (massima coda osservata).
+    """
+
+    def __init__(self, max_queue=WRITER_QUEUE_SIZE, drop_policy=WRITER_DROP_POLICY,
+                 name="background-writer", on_error=None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy} (expected one of {DROP_POLICIES})")
+        self.max_queue = max(1, int(max_queue))
+        self.drop_policy = drop_policy
+        self.on_error = on_error
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.high_water = 0
+        self.busy_sec = 0.0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        return len(self._items)
+
+    def submit(self, func, *args, droppable=True, **kwargs):
+        """
+        Accoda ``func(*args, **kwargs)``.
+
+        Args:
+            func: Funzione di salvataggio (eseguita nel thread di scrittura)
+            droppable (bool): False = mai scartato anche a coda piena
+
+        Returns:
+            bool: True se accodato, False se scartato (coda piena o writer chiuso)
+        """
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return False
+            if droppable and len(self._items) >= self.max_queue:
+                if self.drop_policy == "block":
+                    while len(self._items) >= self.max_queue and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        self.dropped += 1
+                        return False
+                elif not (self.drop_policy == "drop_oldest" and self._drop_oldest()):
+                    self.dropped += 1
+                    return False
+            self._items.append((func, args, kwargs, droppable))
+            self.queued += 1
+            self.high_water = max(self.high_water, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def _drop_oldest(self):
+        """Scarta il salvataggio scartabile più vecchio in coda (chiamato con il lock)."""
+        for i, item in enumerate(self._items):
+            if item[3]:
+                del self._items[i]
+                self.dropped += 1
+                return True
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if not self._items:
+                    return
+                func, args, kwargs, _ = self._items.popleft()
+                self._cond.notify_all()
+            start = time.monotonic()
+            try:
+                func(*args, **kwargs)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                if self.on_error is not None:
+                    self.on_error(e)
+                else:
+                    print(f"Background writer error in {getattr(func, '__name__', func)}: {e}")
+            self.busy_sec += time.monotonic() - start
+
+    def stats(self):
+        """Contatori del writer."""
+        return {
+            'queued': self.queued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'pending': self.pending,
+            'high_water': self.high_water,
+            'busy_sec': round(self.busy_sec, 3),
+        }
+
+    def close(self, timeout=None):
+        """Completa i salvataggi in coda e ferma il thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
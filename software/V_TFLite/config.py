@@ -16,16 +16,42 @@ MODEL_PATH = f"{APP_DIR}/V_TFLite/model_6_ott.tflite"
 
 # Logs and detections
 LOG_FILE_PATH = f"{LOGS_DIR}/detection_log.txt"
+# Log del detector (detector_log.py): coda + thread di scrittura, rotazione del file
+LOG_FORMAT = "%(asctime)s - %(message)s"
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotazione per dimensione (0 = mai)
+LOG_BACKUP_COUNT = 5              # File ruotati conservati (detection_log.txt.1 ...)
+LOG_ROTATE_WHEN = None            # Rotazione temporale al posto di quella per dimensione (es. "midnight")
+LOG_FLUSH_SEC = 1.0               # Intervallo massimo tra due flush su disco
+LOG_JSON_PATH = None              # Es. f"{LOGS_DIR}/detection_log.jsonl" per i record in JSON lines
 DETECTIONS_DIR = f"{LOGS_DIR}/Detections"
 
 # --- Power Trigger ---
 PROMINENCE_BAND_MIN_HZ = 4000
 PROMINENCE_BAND_MAX_HZ = 26000
 PROMINENCE_THRESHOLD_DB = 16.0
+# Rumore di fondo adattivo: per canale e sottobanda, media esponenziale (dB) del livello di picco
+# delle finestre non triggerate. Il trigger richiede anche NOISE_FLOOR_THRESHOLD_DB sopra il profilo
+# (None = disattivato, solo prominenza sulla mediana della finestra).
+NOISE_FLOOR_THRESHOLD_DB = 10.0
+NOISE_FLOOR_SUBBANDS = 32
+NOISE_FLOOR_ALPHA = 0.05            # finestre non triggerate (hop 0.4s -> costante di tempo ~8s)
+NOISE_FLOOR_ALPHA_TRIGGERED = 0.005 # finestre triggerate: adattamento lento a rumori persistenti (barche)
+NOISE_FLOOR_WARMUP = 10             # finestre prima di usare il profilo
+# Localizzazione dell'evento nella finestra triggerata: energia di banda per sotto-frame
+TRIGGER_SUBFRAME_SEC = 0.01
 
 # --- TDOA / Direction ---
 TDOA_TIMEOUT_SEC = 10
 TDOA_WIN_SEC = 0.04
+# TDOA a più frame: la finestra TDOA_BATCH_WIN_SEC (centrata sull'evento) è divisa in frame
+# di TDOA_FRAME_SEC (hop TDOA_FRAME_HOP_SEC) valutati con una sola FFT 2-D; i ritardi dei frame
+# sono aggregati con una mediana pesata. "single" = un solo GCC-PHAT su TDOA_WIN_SEC.
+TDOA_MODE = "batch"  # Options: "single" or "batch"
+TDOA_BATCH_WIN_SEC = 0.08
+TDOA_FRAME_SEC = 0.02
+TDOA_FRAME_HOP_SEC = 0.01
+TDOA_CONFIDENCE_TOLERANCE = 1  # campioni: frame "concordi" con il ritardo aggregato
+TDOA_SUBSAMPLE = True  # Interpolazione parabolica del picco di correlazione (ritardo frazionario)
 SPEED_OF_SOUND = 1460  # Velocità del suono in aria 330, in acqua 1460 (m/s)
 MICROPHONE_DISTANCE = 0.33  # Distanza tra i microfoni (metri)
 HIGH_PASS_CUTOFF_HZ = 1000
@@ -47,8 +73,25 @@ ENABLE_UART = False  # altrimenti False
 # --- Networking / IPC ---
 RING_HOST = "127.0.0.1"
 RING_PORT = 8888
+# Ring transport for the consumers (detector, recorder):
+# "tcp" (socket, comando since), "shm" (server started with --shm RING_SHM_NAME) or "hub" (audio_hub.py)
+RING_TRANSPORT = "hub"
+RING_SHM_NAME = "/delfi_ring"
+
+# --- Audio hub (audio_hub.py): reads the ring once, fans out new blocks to local subscribers ---
+AUDIO_HUB_SOCKET = "/tmp/delfi_audio_hub.sock"
+AUDIO_HUB_SOURCE_TRANSPORT = "shm"  # How the hub itself reads the ring: "shm" or "tcp"
+AUDIO_HUB_POLL_SEC = 0.05
+AUDIO_HUB_DROP_POLICY = "drop_oldest"  # Per-subscriber backpressure: "drop_oldest", "drop_newest", "disconnect"
+AUDIO_HUB_MAX_QUEUE_SEC = 4.0  # Audio queued per subscriber before the drop policy applies
+AUDIO_HUB_STATS_SEC = 30
+AUDIO_HUB_STALE_SEC = 2.0  # No new blocks for this long: reopen the shm ring if the server recreated it
 SERVER_PORT_BASE = 12001
-# SERVER_PORTS = [12001, 12002, 12003]
+TASK_MAX_BATCH = 8  # Max windows per interpreter.invoke() in task1_v3 (larger requests are split)
+# Where the detector runs inference: "server" (TaskPool over TCP to the task1_v3.py workers)
+# or "local" (TFLite interpreter in a worker thread inside the detector, no task servers needed)
+INFERENCE_MODE = "server"
+TASK_WORKERS = 3  # task1_v3.py worker processes on SERVER_PORT_BASE + i (one interpreter each); run.sh reads this
 
 # --- Detection threshold (current pipeline) ---
 DETECTION_THRESHOLD = 0.7  # Threshold for "positive" detection
@@ -59,6 +102,8 @@ DETECTIONS_BELOW_THRESHOLD_DIR = f"{LOGS_DIR}/Detections_below_threshold"  # Low
 SAMPLE_RATE_DEFAULT = 192000
 WINDOW_SEC = 0.8
 HALF_WINDOW = WINDOW_SEC / 2
+MAX_CATCHUP_HOPS = 4  # Max pending windows analysed after a slow iteration; older ones are dropped (counted)
+SCHEDULER_STATS_EVERY = 25  # Windows between "Scheduler stats" log lines
 IMG_WIDTH = 300
 IMG_HEIGHT = 150
 MIN_FREQ = 5000
@@ -74,8 +119,37 @@ LOG_DATE_FMT = "%Y%m%d"
 # --- Continuous Recording ---
 CONTINUOUS_RECORDING_ENABLED = True  # Set to False to disable continuous recording
 CONTINUOUS_RECORDING_DIR = f"{LOGS_DIR}/continuous_recordings"
+RECORDER_POLL_SEC = 0.1  # Ring polling period (must stay well below the ring length, 2 s)
+# Segmented recording (segmented_recording.py): one directory per run in CONTINUOUS_RECORDING_DIR
+RECORDING_SEGMENT_SEC = 600  # New WAV segment every 10 minutes (~440 MB at 192 kHz stereo int16)
+RECORDING_SEGMENT_MAX_BYTES = 1024 * 1024 * 1024  # Also rotate above this size (None = duration only)
+RECORDING_PREALLOCATE = True  # Reserve the whole segment on disk when it is opened
+RECORDING_INDEX_SEC = 1.0  # Max interval between index records (ring frame / wall clock -> file, offset)
+RECORDING_FORMAT = "wav"  # Options: "wav", "flac" (lossless, needs the soundfile package)
+# Disk writer thread (recording_writer.py): preallocated int16 buffer between acquisition and disk
+RECORDING_BUFFER_SEC = 20  # Audio the writer may lag behind before new blocks are dropped (~15 MB at 192 kHz)
+RECORDING_FSYNC_SEC = 2.0  # Header update + fsync interval of the current segment
 
 # --- Window Saving (Debug/Analysis) ---
-# Modes: "none" (default), "all" (save all analyzed windows), "trigger" (save only triggered windows)
-WINDOW_SAVE_MODE = "all"  # Options: "none", "all", "trigger"
-WINDOW_SAVES_DIR = f"{LOGS_DIR}/window_saves"  # Directory for saved analysis windows
\ No newline at end of file
+# Modes: "none" (default), "all" (save all analyzed windows), "trigger" (save only triggered windows),
+# "archive" (all windows, each hop written once into append-only segments + index, see window_archive.py)
+WINDOW_SAVE_MODE = "all"  # Options: "none", "all", "trigger", "archive"
+WINDOW_SAVES_DIR = f"{LOGS_DIR}/window_saves"  # Directory for saved analysis windows
+WINDOW_ARCHIVE_SEGMENT_SEC = 300  # Audio per archive segment file (~230 MB at 192 kHz stereo int16)
+
+# --- Background writer (background_writer.py): WAV/JSON saves off the detector loop ---
+WRITER_QUEUE_SIZE = 32  # Pending saves (~0.8 s stereo WAV + JSON each)
+WRITER_DROP_POLICY = "drop_oldest"  # Options: "drop_oldest", "drop_newest", "block"
+
+# --- Event store (event_store.py): indexed SQLite (WAL) archive of scored windows ---
+EVENT_DB_PATH = f"{LOGS_DIR}/events.db"
+EVENT_STORE_BATCH = 20  # Events per transaction
+EVENT_STORE_FLUSH_SEC = 5.0  # Max time an event waits in memory before being written
+DETECTION_JSON_FILES = False  # Also write the per-detection JSON next to the WAV (superseded by the event store)
+
+# --- Detection clips (event_clips.py) ---
+# "event": WAV of CLIP_PRE_ROLL_SEC + CLIP_POST_ROLL_SEC around the event frame (window start + trigger event_offset),
+# written once the post-roll has arrived; "window": the whole analysed window (WINDOW_SEC)
+DETECTION_CLIP_MODE = "event"  # Options: "event", "window"
+CLIP_PRE_ROLL_SEC = 0.3
+CLIP_POST_ROLL_SEC = 0.5
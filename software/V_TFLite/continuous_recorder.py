@@ -2,23 +2,31 @@
 """
 Continuous Audio Recorder with Streaming WAV Writer
 Registra continuamente l'audio dal jack-ring-socket-server scrivendo direttamente su disco.
+Legge il ring in modo incrementale (solo i blocchi nuovi), quindi la registrazione è un flusso
+continuo senza sovrapposizioni; i blocchi persi vengono contati.
+L'audio è diviso in segmenti WAV a rotazione con un indice frame/tempo -> (file, offset)
+(vedi segmented_recording.py, lettura con RecordingReader / read_range).
+La scrittura su disco (e la compressione con RECORDING_FORMAT = "flac") avviene in un thread dedicato
+(RecordingWriter): il loop di acquisizione copia solo i blocchi int16 in un buffer preallocato e non
+attende mai write o fsync.
 """
 
-import socket
-import struct
-import numpy as np
-import wave
 import signal
 import sys
-import os
+import time
 from datetime import datetime
 from pathlib import Path
 
 # Import configurazioni
 from config import (
     RING_HOST, RING_PORT, SAMPLE_RATE_DEFAULT,
-    LOGS_DIR, TIMESTAMP_FMT
+    CONTINUOUS_RECORDING_DIR, TIMESTAMP_FMT, RECORDER_POLL_SEC,
+    RECORDING_SEGMENT_SEC, RECORDING_FORMAT
 )
+from recording_writer import RecordingWriter
+from ring_client import open_ring
+import segmented_recording
+from segmented_recording import SegmentedRecording
 
 class ContinuousRecorder:
     def __init__(self):
@@ -28,14 +36,27 @@ class ContinuousRecorder:
         self.recording = True
         self.sample_rate = SAMPLE_RATE_DEFAULT
         self.channels = 2  # Stereo
-        self.wav_file = None
-        self.filepath = None
+        self.segments = None
+        self.next_frame = None  # frame del ring atteso dopo l'ultimo blocco
         self.blocks_written = 0
+        self.frames_written = 0
+        self.dropped_blocks = 0
         self.start_time = datetime.now()
+        # Con l'hub l'audio precedente all'avvio non viene richiesto (history=False): come per tcp/shm,
+        # la registrazione parte dai blocchi successivi alla prima lettura
+        self.ring = open_ring(history=False)
         
-        # Percorso di salvataggio
-        self.logs_dir = Path(LOGS_DIR)
-        self.logs_dir.mkdir(parents=True, exist_ok=True)
+        # Formato dei segmenti: FLAC solo se soundfile è installato
+        self.format = RECORDING_FORMAT
+        if self.format == "flac" and segmented_recording.soundfile is None:
+            print("⚠️  soundfile not installed, FLAC recording unavailable: falling back to WAV")
+            self.format = "wav"
+        # Thread di scrittura con buffer preallocato (creato con la registrazione)
+        self.writer = None
+        
+        # Percorso di salvataggio (una directory di segmenti per avvio)
+        self.recordings_dir = Path(CONTINUOUS_RECORDING_DIR)
+        self.recordings_dir.mkdir(parents=True, exist_ok=True)
         
         # Registra i segnali di terminazione
         signal.signal(signal.SIGTERM, self._signal_handler)
@@ -44,179 +65,169 @@ class ContinuousRecorder:
         print("=" * 60)
         print("🎙️  Continuous Audio Recorder (Streaming Mode)")
         print("=" * 60)
-        print(f"📁 Logs directory: {self.logs_dir}")
+        print(f"📁 Recordings directory: {self.recordings_dir}")
         print(f"🎵 Sample rate: {self.sample_rate} Hz")
         print(f"🔊 Channels: {self.channels} (stereo)")
-        print(f"💾 Mode: Direct disk write (no memory buffer)")
+        print(f"💾 Mode: Background disk writer, {RECORDING_SEGMENT_SEC} s {self.format.upper()} segments")
         print("=" * 60)
     
     def _signal_handler(self, signum, frame):
-        """Gestisce i segnali di terminazione per chiudere il file WAV correttamente."""
+        """Gestisce i segnali di terminazione per chiudere il segmento WAV correttamente."""
         print(f"\n📥 Received signal {signum}, finalizing recording...")
         self.recording = False
     
-    def _open_wav_file(self):
+    def _open_recording(self):
         """
-        Apre un nuovo file WAV per la registrazione streaming.
+        Apre una nuova registrazione segmentata (directory con segmenti WAV e indice).
+        I segmenti vengono creati al primo blocco scritto e a ogni rotazione.
         """
-        # Crea il nome del file con timestamp di inizio
+        # Crea il nome della directory con timestamp di inizio
         timestamp = self.start_time.strftime(TIMESTAMP_FMT)
-        filename = f"continuous_recording_{timestamp}.wav"
-        self.filepath = self.logs_dir / filename
+        directory = self.recordings_dir / f"recording_{timestamp}"
+        self.segments = SegmentedRecording(self.sample_rate, directory=str(directory), fmt=self.format)
+        self.writer = RecordingWriter(self.segments)
         
-        try:
-            # Apri il file WAV in modalità write
-            self.wav_file = wave.open(str(self.filepath), 'wb')
-            self.wav_file.setnchannels(self.channels)
-            self.wav_file.setsampwidth(2)  # 16-bit = 2 bytes
-            self.wav_file.setframerate(self.sample_rate)
-            
-            print(f"✅ Opened WAV file: {filename}")
-            print(f"🔴 Recording started...")
-            print("=" * 60)
-            
-        except Exception as e:
-            print(f"❌ Error opening WAV file: {e}")
-            raise
+        print(f"✅ Recording to: {directory}")
+        print(f"🔴 Recording started...")
+        print("=" * 60)
     
-    def _close_wav_file(self):
+    def _close_recording(self):
         """
-        Chiude il file WAV e stampa le statistiche.
+        Finalizza l'ultimo segmento e stampa le statistiche.
         """
-        if self.wav_file is None:
+        if self.segments is None:
             return
         
         try:
-            # Chiudi il file (questo aggiorna automaticamente l'header con la dimensione)
-            self.wav_file.close()
+            # Scrive i blocchi ancora nel buffer, poi header definitivo dell'ultimo segmento
+            # (la coda preallocata viene rimossa)
+            self.writer.close()
             
             # Calcola statistiche
-            if self.filepath.exists():
-                size_mb = self.filepath.stat().st_size / (1024 * 1024)
-                duration_sec = (datetime.now() - self.start_time).total_seconds()
-                
-                print("\n" + "=" * 60)
-                print("✅ RECORDING COMPLETED")
-                print("=" * 60)
-                print(f"📄 File: {self.filepath.name}")
-                print(f"📁 Path: {self.filepath}")
-                print(f"⏱️  Duration: {duration_sec:.2f} seconds ({duration_sec/60:.1f} minutes)")
-                print(f"💾 Size: {size_mb:.2f} MB")
-                print(f"📦 Blocks written: {self.blocks_written}")
-                print(f"🔊 Sample rate: {self.sample_rate} Hz")
-                print(f"🎵 Channels: {self.channels}")
-                print("=" * 60)
+            stats = self.segments.stats()
+            wstats = self.writer.stats()
+            size_mb = stats['bytes_written'] / (1024 * 1024)
+            duration_sec = (datetime.now() - self.start_time).total_seconds()
             
+            print("\n" + "=" * 60)
+            print("✅ RECORDING COMPLETED")
+            print("=" * 60)
+            print(f"📁 Path: {self.segments.directory}")
+            print(f"📄 Segments: {stats['segments']}")
+            print(f"⏱️  Duration: {duration_sec:.2f} seconds ({duration_sec/60:.1f} minutes)")
+            print(f"💾 Size: {size_mb:.2f} MB (PCM), {stats['disk_bytes'] / (1024 * 1024):.2f} MB on disk"
+                  f" (compression x{stats['compression_ratio']})")
+            print(f"📦 Blocks written: {self.blocks_written}")
+            print(f"🎞️  Frames written: {self.frames_written} ({self.frames_written / self.sample_rate:.2f} s of audio)")
+            print(f"⚠️  Ring blocks dropped: {self.dropped_blocks}")
+            print(f"⚠️  Writer blocks dropped: {wstats['dropped_blocks']} (buffer high water "
+                  f"{wstats['high_water_sec']:.2f}/{wstats['capacity_sec']:.0f} s, errors {wstats['errors']})")
+            print(f"⏳ Writer latency: avg {wstats['latency_avg_ms']} ms, max {wstats['latency_max_ms']} ms "
+                  f"(write max {wstats['write_max_ms']} ms, fsync max {wstats['sync_max_ms']} ms)")
+            print(f"🔊 Sample rate: {self.sample_rate} Hz")
+            print(f"🎵 Channels: {self.channels}")
+            print("=" * 60)
+        
         except Exception as e:
-            print(f"❌ Error closing WAV file: {e}")
+            print(f"❌ Error closing recording: {e}")
             import traceback
             traceback.print_exc()
     
-    def _write_audio_block(self, stereo_data):
+    def _write_audio_block(self, stereo_data, first_frame):
         """
-        Scrive un blocco audio direttamente nel file WAV.
+        Accoda un blocco audio al thread di scrittura (conversione int16 nel buffer preallocato).
         
         Args:
             stereo_data: numpy array (N, 2) con dati float32
+            first_frame: frame assoluto del ring del primo campione (per l'indice)
+
+        Returns:
+            bool: True se accodato, False se scartato dal writer (buffer pieno)
         """
-        # Convert float32 to int16 for WAV storage
-        # Assuming float32 is in range [-1, 1]
-        stereo_int16 = (stereo_data * 32767).astype(np.int16)
-        
-        # Flatten to interleaved format [L, R, L, R, ...]
-        interleaved = stereo_int16.flatten()
+        if self.next_frame is not None and first_frame < self.next_frame:
+            # Contatore del ring ripartito (server riavviato): nuova registrazione, l'indice resta monotono
+            print("⚠️  Ring frame counter restarted, starting a new recording")
+            self._close_recording()
+            self.start_time = datetime.now()
+            self._open_recording()
+        self.next_frame = first_frame + len(stereo_data)
         
-        # Scrivi nel file WAV
-        self.wav_file.writeframes(interleaved.tobytes())
-        
-        # Ogni 10 blocchi, forza la scrittura fisica su disco
-        self.blocks_written += 1
-        if self.blocks_written % 10 == 0:
-            # Flush del buffer Python
-            self.wav_file._file.flush()
-            # Forza la scrittura fisica su disco (importante per spegnimenti improvvisi)
-            os.fsync(self.wav_file._file.fileno())
+        # Scrittura, compressione, rotazione, indice e fsync a tempo (RECORDING_FSYNC_SEC) nel writer;
+        # a buffer pieno il blocco viene scartato (contato dal writer in dropped_blocks) e resta un buco nell'indice
+        queued = self.writer.push(stereo_data, first_frame)
+        if queued:
+            self.frames_written += len(stereo_data)
+            self.blocks_written += 1
+        return queued
     
     def _get_audio_block(self):
         """
-        Ottiene un blocco audio dal ring server usando il protocollo corretto.
-        Ritorna: (sample_rate, stereo_data) dove stereo_data è un numpy array (N, 2)
+        Ottiene dal ring i soli blocchi arrivati dopo l'ultima lettura.
+        Ritorna: (sample_rate, stereo_data, first_frame, dropped) dove stereo_data è un numpy array (N, 2),
+        first_frame il frame assoluto del primo campione e dropped il numero di blocchi persi
+        (sovrascritti nel ring prima di essere letti).
         """
-        size_of_float = 4
-        
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((RING_HOST, RING_PORT))
-            
-            # Query nframes
-            s.sendall(b"nframes")
-            nframes = int(s.recv(256).decode("utf8").split("\n")[0])
-            
-            # Query len (number of blocks)
-            s.sendall(b"len")
-            nblocks = int(s.recv(256).decode('utf8').split("\n")[0])
-            
-            # Query rate (sample rate)
-            s.sendall(b"rate")
-            samplerate = int(s.recv(256).decode('utf8').split("\n")[0])
-            
-            # Query seconds (not strictly needed but keeps protocol consistent)
-            s.sendall(b"seconds")
-            
-            # Request audio dump
-            blocksize = size_of_float * nframes * 2  # stereo
-            s.sendall(b"dump")
-            
-            # Receive all blocks
-            data = b''
-            for i in range(nblocks):
-                chunk = s.recv(blocksize)
-                data += chunk
-        
-        # Convert to numpy array (float32 stereo interleaved)
-        myblock = np.frombuffer(data, dtype=np.float32)
-        stereo_data = myblock.reshape(-1, 2)
-        
-        return samplerate, stereo_data
+        samplerate, stereo_data, first_seq, dropped = self.ring.read_new()
+        first_frame = (first_seq - 1) * (self.ring.nframes or 0)
+        return samplerate, stereo_data, first_frame, dropped
     
     def start(self):
         """Avvia la registrazione continua."""
         try:
             print("🔗 Connecting to jack-ring-socket-server...")
             
-            # Test connection
+            # Test connection (il contenuto già presente nel ring viene scartato, con tcp/shm da questa
+            # prima lettura, con l'hub perché non viene inviato: la registrazione parte dal blocco successivo)
             try:
-                sr, _ = self._get_audio_block()
+                sr, _, _, _ = self._get_audio_block()
                 self.sample_rate = sr
                 print(f"✅ Connected! Sample rate: {sr} Hz\n")
             except Exception as e:
                 raise ConnectionRefusedError(f"Cannot connect: {e}")
             
-            # Apri il file WAV
-            self._open_wav_file()
+            # Apri la registrazione segmentata
+            self._open_recording()
             
             # Loop di registrazione
             while self.recording:
                 try:
-                    sr, stereo_data = self._get_audio_block()
+                    sr, stereo_data, first_frame, dropped = self._get_audio_block()
+                    if dropped:
+                        self.dropped_blocks += dropped
+                        print(f"⚠️  {dropped} ring blocks dropped (total {self.dropped_blocks})")
+                    
+                    if len(stereo_data) == 0:
+                        time.sleep(RECORDER_POLL_SEC)
+                        continue
                     
-                    # Scrivi il blocco direttamente su disco
-                    self._write_audio_block(stereo_data)
+                    # Scrivi solo i blocchi nuovi direttamente su disco
+                    queued = self._write_audio_block(stereo_data, first_frame)
                     
                     # Log periodico (ogni 50 blocchi, circa ogni 5 secondi)
-                    if self.blocks_written % 50 == 0:
+                    if queued and self.blocks_written % 50 == 0:
                         elapsed = (datetime.now() - self.start_time).total_seconds()
-                        size_mb = self.filepath.stat().st_size / (1024 * 1024) if self.filepath.exists() else 0
-                        print(f"🎙️  Recording... {elapsed:.1f}s | {self.blocks_written} blocks | {size_mb:.1f} MB")
+                        stats = self.segments.stats()
+                        size_mb = stats['bytes_written'] / (1024 * 1024)
+                        wstats = self.writer.stats()
+                        line = (f"🎙️  Recording... {elapsed:.1f}s | {self.blocks_written} blocks | {size_mb:.1f} MB | "
+                                f"segment {stats['segments']} | dropped {self.dropped_blocks} | "
+                                f"writer backlog {wstats['pending_sec']:.1f}s (max {wstats['high_water_sec']:.1f}s) | "
+                                f"latency max {wstats['latency_max_ms']:.0f} ms | fsync max {wstats['sync_max_ms']:.0f} ms")
+                        if self.format == "flac":
+                            line += f" | compression x{stats['compression_ratio']}"
+                        print(line)
+                    
+                    # Il ring contiene alcuni secondi: basta leggerlo a intervalli regolari
+                    time.sleep(RECORDER_POLL_SEC)
                 
                 except Exception as e:
                     if self.recording:
                         print(f"⚠️  Error getting/writing block: {e}")
                         # Continue trying
-                        import time
                         time.sleep(0.5)
             
-            # Chiudi il file WAV (finalizza l'header)
-            self._close_wav_file()
+            # Chiudi l'ultimo segmento (finalizza l'header)
+            self._close_recording()
             
         except ConnectionRefusedError:
             print("❌ Cannot connect to jack-ring-socket-server.")
@@ -226,8 +237,8 @@ class ContinuousRecorder:
             print(f"❌ Error during recording: {e}")
             import traceback
             traceback.print_exc()
-            # Prova comunque a chiudere il file
-            self._close_wav_file()
+            # Prova comunque a chiudere il segmento
+            self._close_recording()
             sys.exit(1)
 
 def main():
@@ -6,12 +6,14 @@ Interfaccia web semplice per controllare il sistema di rilevamento delfini.
 
 from flask import Flask, Response, jsonify, render_template, request
 import subprocess
+import collections
 import os
 import time
 import threading
 
 # Import config per i path
-from config import LOG_FILE_PATH, LOGS_DIR
+from config import LOG_FILE_PATH, LOGS_DIR, EVENT_DB_PATH
+from event_store import query_events
 
 app = Flask(__name__)
 
@@ -91,28 +93,51 @@ def stream_logs():
         # Invia le ultime 50 righe come contesto iniziale
         try:
             with open(LOG_FILE_PATH, 'r') as f:
-                lines = f.readlines()
-                last_lines = lines[-50:] if len(lines) > 50 else lines
-                for line in last_lines:
+                for line in collections.deque(f, maxlen=50):
                     yield f"data: {line.strip()}\n\n"
         except Exception as e:
             yield f"data: Errore lettura log: {e}\n\n"
         
         # Poi fai tail del file in tempo reale
+        f = None
         try:
-            with open(LOG_FILE_PATH, 'r') as f:
-                # Vai alla fine del file
-                f.seek(0, 2)
-                while True:
-                    line = f.readline()
-                    if line:
-                        yield f"data: {line.strip()}\n\n"
-                    else:
-                        time.sleep(0.3)
+            f = open(LOG_FILE_PATH, 'r')
+            # Vai alla fine del file
+            f.seek(0, 2)
+            inode = os.fstat(f.fileno()).st_ino
+            partial = ""
+            while True:
+                line = f.readline()
+                if line.endswith("\n"):
+                    yield f"data: {(partial + line).strip()}\n\n"
+                    partial = ""
+                elif line:
+                    # Riga scritta a metà dal flush bufferizzato del detector: attendi il resto
+                    partial += line
+                else:
+                    time.sleep(0.3)
+                    # Rotazione (nuovo file con lo stesso nome) o svuotamento (clear-logs): riparti dall'inizio
+                    try:
+                        st = os.stat(LOG_FILE_PATH)
+                    except FileNotFoundError:
+                        continue
+                    if st.st_ino != inode:
+                        # Prima le ultime righe scritte nel file ruotato
+                        for line in f:
+                            yield f"data: {(partial + line).strip()}\n\n"
+                            partial = ""
+                    if st.st_ino != inode or st.st_size < f.tell():
+                        f.close()
+                        f = open(LOG_FILE_PATH, 'r')
+                        inode = os.fstat(f.fileno()).st_ino
+                        partial = ""
         except GeneratorExit:
             pass
         except Exception as e:
             yield f"data: Errore streaming: {e}\n\n"
+        finally:
+            if f is not None:
+                f.close()
     
     return Response(
         generate(),
@@ -125,6 +150,34 @@ def stream_logs():
     )
 
 
+@app.route('/events')
+def get_events():
+    """
+    Eventi dall'archivio delle detection (event_store.py), dal più recente.
+    Parametri: start, end (epoch), min_score, max_score, direction, detected (0/1), limit.
+    """
+    def number(name):
+        value = request.args.get(name)
+        return float(value) if value not in (None, "") else None
+
+    if not os.path.exists(EVENT_DB_PATH):
+        return jsonify({"events": []})
+    try:
+        detected = request.args.get('detected')
+        events = query_events(
+            EVENT_DB_PATH, start=number('start'), end=number('end'),
+            min_score=number('min_score'), max_score=number('max_score'),
+            direction=request.args.get('direction') or None,
+            detected=None if detected in (None, "") else detected == "1",
+            limit=min(int(request.args.get('limit', 200)), 5000)
+        )
+        return jsonify({"events": events})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @app.route('/clear-logs', methods=['POST'])
 def clear_logs():
     """Pulisce il file di log."""
@@ -0,0 +1,142 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Detector Log
+Log del detector (e del power trigger) tramite coda: il loop chiama solo ``logger.info`` (QueueHandler),
+un thread in background scrive sul file con rotazione e flush al più ogni LOG_FLUSH_SEC secondi.
+Niente apertura/chiusura del file per riga sulla SD e file di dimensione limitata.
+
+Opzionalmente (LOG_JSON_PATH) ogni record viene scritto anche come riga JSON, con i campi
+strutturati passati via ``extra=fields(...)``.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+from config import (
+    LOG_FILE_PATH, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_WHEN,
+    LOG_FLUSH_SEC, LOG_JSON_PATH
+)
+
+
+def fields(**values):
+    """Campi strutturati di un record per i JSON lines: ``logger.info(msg, extra=fields(score=0.9))``."""
+    return {'fields': values}
+
+
+class _BufferedFlushMixin:
+    """Flush reale su disco al più ogni ``flush_sec`` secondi (o quando il listener è inattivo)."""
+
+    flush_sec = LOG_FLUSH_SEC
+    _last_flush = 0.0
+
+    def flush(self):
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_sec:
+            self.force_flush()
+
+    def force_flush(self):
+        self._last_flush = time.monotonic()
+        super().flush()
+
+
+class BufferedRotatingFileHandler(_BufferedFlushMixin, logging.handlers.RotatingFileHandler):
+    """Rotazione per dimensione (maxBytes, backupCount) con flush bufferizzato."""
+
+
+class BufferedTimedRotatingFileHandler(_BufferedFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    """Rotazione temporale (when, es. "midnight") con flush bufferizzato."""
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Un oggetto JSON per riga: timestamp, livello, logger, messaggio e campi strutturati."""
+
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        data.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """QueueListener che, quando la coda resta vuota per ``flush_sec``, forza il flush dei file."""
+
+    def __init__(self, log_queue, *handlers, flush_sec=LOG_FLUSH_SEC):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_sec = flush_sec
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_sec if block else None)
+            except queue.Empty:
+                if not block:
+                    raise
+                self.flush()
+
+    def flush(self):
+        for handler in self.handlers:
+            if hasattr(handler, 'force_flush'):
+                handler.force_flush()
+            else:
+                handler.flush()
+
+    def stop(self):
+        super().stop()
+        self.flush()
+
+
+def _file_handler(path, formatter, max_bytes, backup_count, rotate_when, flush_sec):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if rotate_when:
+        handler = BufferedTimedRotatingFileHandler(path, when=rotate_when, backupCount=backup_count)
+    else:
+        handler = BufferedRotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+    handler.flush_sec = flush_sec
+    handler.setFormatter(formatter)
+    return handler
+
+
+def setup_logging(logger_names=("detector", "power_trigger"), log_file_path=LOG_FILE_PATH,
+                  json_path=LOG_JSON_PATH, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                  rotate_when=LOG_ROTATE_WHEN, flush_sec=LOG_FLUSH_SEC):
+    """
+    Collega i logger indicati a una coda servita da un thread di scrittura.
+
+    Args:
+        logger_names (tuple): Logger che scrivono sul file (solo tramite la coda: non propagano al root logger)
+        log_file_path (str): File di log testuale (LOG_FORMAT)
+        json_path (str): File JSON lines aggiuntivo (None = disattivato)
+        max_bytes (int): Rotazione per dimensione (0 = mai), ignorata se ``rotate_when``
+        backup_count (int): File ruotati conservati
+        rotate_when (str): Rotazione temporale (es. "midnight", "H"), None = per dimensione
+        flush_sec (float): Intervallo massimo tra due flush su disco
+
+    Returns:
+        FlushingQueueListener: già avviato; ``stop()`` svuota la coda e chiude i file
+    """
+    handlers = [_file_handler(log_file_path, logging.Formatter(LOG_FORMAT),
+                              max_bytes, backup_count, rotate_when, flush_sec)]
+    if json_path:
+        handlers.append(_file_handler(json_path, JsonLinesFormatter(),
+                                      max_bytes, backup_count, rotate_when, flush_sec))
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        logger.addHandler(queue_handler)
+        logger.setLevel(logging.INFO)
+        # Niente handler del root (es. console) chiamati in modo sincrono dal loop
+        logger.propagate = False
+    listener = FlushingQueueListener(log_queue, *handlers, flush_sec=flush_sec)
+    listener.start()
+    return listener
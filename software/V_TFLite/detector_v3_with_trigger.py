@@ -6,35 +6,50 @@ Integra il power trigger nel flusso di detection esistente.
 
 import asyncio
 from scipy.io import wavfile
-from socket import *
 import numpy as np
 import logging
 import time
 import os
+import signal
 import sys
 import json
 
 # Importa il modulo power trigger
-from power_trigger import PowerTrigger, compute_tdoa_direct, get_nearest_channel
-
-from config import RING_HOST, RING_PORT, WINDOW_SEC, HALF_WINDOW, SERVER_PORT_BASE, DETECTION_THRESHOLD, DETECTION_MIN_THRESHOLD, DETECTIONS_BELOW_THRESHOLD_DIR, LOG_FILE_PATH, DETECTIONS_DIR, TDOA_WIN_SEC, WINDOW_SAVE_MODE, WINDOW_SAVES_DIR
-
-# Funzione per ottenere il nome del file di log
-def get_log_file_path():
-    date_str = time.strftime("%Y-%m-%d_%H:%M:%S")
-    log_file_path = LOG_FILE_PATH
-    # Ensure directory exists
-    os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
-    if not os.path.exists(log_file_path):
-        with open(log_file_path, "w") as log_file:
-            log_file.write("Detection Log Created on: {}\n\n".format(date_str))
-    
-    return log_file_path
+from power_trigger import PowerTrigger, compute_tdoa_direct, get_nearest_channel, event_slice
+from ring_client import open_ring
+from window_scheduler import WindowScheduler
+from task_protocol import TaskPool
+from background_writer import BackgroundWriter
+from event_store import EventStore
+from window_archive import WindowArchive
+from event_clips import ClipExtractor
+
+from detector_log import setup_logging, fields
+from config import RING_HOST, SERVER_PORT_BASE, TASK_WORKERS, INFERENCE_MODE, DETECTION_THRESHOLD, DETECTION_MIN_THRESHOLD, DETECTIONS_BELOW_THRESHOLD_DIR, DETECTIONS_DIR, TDOA_WIN_SEC, TDOA_MODE, TDOA_BATCH_WIN_SEC, WINDOW_SAVE_MODE, WINDOW_SAVES_DIR, SCHEDULER_STATS_EVERY, DETECTION_JSON_FILES, DETECTION_CLIP_MODE
+
+# Log su LOG_FILE_PATH tramite coda e thread di scrittura (rotazione, flush bufferizzato, JSON lines opzionale).
+# Anche il power trigger ("power_trigger") scrive qui.
+log_listener = setup_logging()
+logger = logging.getLogger("detector")
 
-log_file_path = get_log_file_path()
 
+def detection_direction(trigger_result, tdoa_result=None):
+    """
+    Direzione della sorgente: dal TDOA se disponibile, altrimenti dal canale che ha attivato il trigger.
 
-def save_detection_json(filepath_base: str, trigger_result: dict, tdoa_result: dict = None, score: float = None, detected: bool = False):
+    Returns:
+        tuple: (direction, angle_deg, tdoa_confidence), None se non determinabili
+    """
+    if tdoa_result:
+        return tdoa_result.get('direction', None), tdoa_result.get('angle', None), tdoa_result.get('confidence', None)
+    elif trigger_result.get('action') == 'left_only':
+        return "sinistra", -90.0, None
+    elif trigger_result.get('action') == 'right_only':
+        return "destra", 90.0, None
+    return None, None, None
+
+
+def save_detection_json(filepath_base: str, trigger_result: dict, tdoa_result: dict = None, score: float = None, detected: bool = False, capture_time: float = None, clip: dict = None):
     """
     Salva un file JSON con i risultati della detection accanto al WAV.
     
@@ -44,44 +59,37 @@ def save_detection_json(filepath_base: str, trigger_result: dict, tdoa_result: d
         tdoa_result: Risultato TDOA (opzionale)
         score: Score della detection TFLite
         detected: True se la soglia è stata superata
+        capture_time: Istante (epoch) della finestra; None = ora (il salvataggio può avvenire più tardi)
+        clip: Posizione della clip attorno all'evento (DETECTION_CLIP_MODE = "event"), None = finestra intera
     """
-    # Determina direction e angle
-    if tdoa_result:
-        direction = tdoa_result.get('direction', None)
-        angle_deg = tdoa_result.get('angle', None)
-    elif trigger_result.get('action') == 'left_only':
-        direction = "sinistra"
-        angle_deg = -90.0
-    elif trigger_result.get('action') == 'right_only':
-        direction = "destra"
-        angle_deg = 90.0
-    else:
-        direction = None
-        angle_deg = None
+    direction, angle_deg, confidence = detection_direction(trigger_result, tdoa_result)
     
     data = {
-        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(capture_time)),
         "trigger": {
             "left": trigger_result.get('left_triggered', False),
             "right": trigger_result.get('right_triggered', False),
-            "action": trigger_result.get('action', 'none')
+            "action": trigger_result.get('action', 'none'),
+            "event_offset": trigger_result.get('event_offset')
         },
         "direction": direction,
         "angle_deg": angle_deg,
+        "tdoa_confidence": confidence,
         "detected": detected,
         "score": round(score, 4) if score is not None else None
     }
+    if clip:
+        data["clip"] = clip
     
     json_path = filepath_base + ".json"
     try:
         with open(json_path, 'w') as f:
             json.dump(data, f, indent=2)
     except Exception as e:
-        with open(log_file_path, "a") as log_file:
-            log_file.write(f"Error saving JSON: {e}\n")
+        logger.info(f"Error saving JSON: {e}")
 
 
-def save_analysis_window(left_block, right_block, sample_rate, window_counter, trigger_result=None):
+def save_analysis_window(left_block, right_block, sample_rate, window_counter, trigger_result=None, capture_time=None):
     """
     Salva una finestra di analisi come file WAV con metadati.
     
@@ -91,12 +99,13 @@ def save_analysis_window(left_block, right_block, sample_rate, window_counter, t
         sample_rate: Sample rate in Hz
         window_counter: Contatore progressivo della finestra
         trigger_result: Risultato del trigger (opzionale, per metadata)
+        capture_time: Istante (epoch) della finestra; None = ora
     """
     try:
         os.makedirs(WINDOW_SAVES_DIR, exist_ok=True)
         
         # Timestamp + counter per nome file univoco
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        timestamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(capture_time))
         filename_base = f"window_{timestamp}_{window_counter:06d}"
         filepath_base = os.path.join(WINDOW_SAVES_DIR, filename_base)
         
@@ -119,7 +128,7 @@ def save_analysis_window(left_block, right_block, sample_rate, window_counter, t
         
         # Salva metadata JSON
         metadata = {
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(capture_time)),
             "window_counter": window_counter,
             "duration_sec": len(left_block) / sample_rate,
             "sample_rate": sample_rate,
@@ -137,328 +146,485 @@ def save_analysis_window(left_block, right_block, sample_rate, window_counter, t
             json.dump(metadata, f, indent=2)
             
     except Exception as e:
-        with open(log_file_path, "a") as log_file:
-            log_file.write(f"Error saving analysis window: {e}\n")
+        logger.info(f"Error saving analysis window: {e}")
+
+
+def save_detection(directory, iteration_timestamp, sample_rate, left_block, right_block,
+                   trigger_result, tdoa_result, score, detected, capture_time, clip=None):
+    """
+    Salva il WAV stereo di una detection (finestra o clip attorno all'evento) in ``directory``
+    (eseguita dal background writer), più il JSON accanto se DETECTION_JSON_FILES
+    (i metadati sono comunque nell'event store).
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+        filepath_base = os.path.join(directory, iteration_timestamp)
+        wavfile.write(filepath_base + ".wav", sample_rate, np.stack((left_block, right_block), axis=-1))
+        if DETECTION_JSON_FILES:
+            save_detection_json(filepath_base, trigger_result, tdoa_result, score, detected, capture_time, clip)
+    except Exception as e:
+        logger.info(f"Error saving detection: {e}")
+
+
+def submit_clip(clip, sample_rate):
+    """
+    Accoda al writer il salvataggio di una clip pronta di ClipExtractor.pop_ready
+    e registra nell'event store l'evento della detection (rimandato fino a questo punto).
+    """
+    clip_start, event_frame, left, right, meta = clip
+    event = meta['event']
+    if len(left) == 0:
+        logger.info(f"Detection clip {meta['iteration_timestamp']} lost (audio no longer available)")
+        event_store.add(**event)
+        return
+    clip_info = {
+        "start_frame": clip_start,
+        "event_frame": event_frame,
+        "pre_roll_sec": round((event_frame - clip_start) / sample_rate, 4),
+        "duration_sec": round(len(left) / sample_rate, 4),
+    }
+    queued = writer.submit(save_detection, meta['directory'], meta['iteration_timestamp'], sample_rate,
+                           left, right, meta['trigger_result'], meta['tdoa_result'], meta['score'],
+                           meta['detected'], meta['capture_time'], clip_info, droppable=meta['droppable'])
+    if queued:
+        event['audio_path'] = os.path.join(meta['directory'], meta['iteration_timestamp'] + ".wav")
+    else:
+        logger.info(f"Detection clip {meta['iteration_timestamp']} not saved, writer queue full")
+    # L'evento punta al WAV solo se la clip è stata accodata
+    event_store.add(**event)
+
+
+# Lettore persistente del ring (TCP o memoria condivisa, vedi RING_TRANSPORT), riusato ad ogni iterazione
+ring_client = open_ring()
+
+# Identificativi di flusso per la cache STFT del task server (un flusso per canale)
+LEFT_STREAM = 0
+RIGHT_STREAM = 1
+
+# Inferenza: pool di task server TFLite (TASK_WORKERS processi su SERVER_PORT_BASE + i, connessioni
+# persistenti) oppure interprete nel processo del detector (INFERENCE_MODE = "local")
+if INFERENCE_MODE == "local":
+    from task1_v3 import LocalInference
+    task_pool = LocalInference()
+else:
+    task_pool = TaskPool(RING_HOST, SERVER_PORT_BASE, TASK_WORKERS)
+
+# Salvataggi WAV/JSON in un thread con coda limitata (WRITER_QUEUE_SIZE, WRITER_DROP_POLICY):
+# il loop accoda e prosegue, una SD lenta non blocca la detection
+writer = BackgroundWriter()
+
+# Archivio indicizzato delle finestre valutate (SQLite WAL, EVENT_DB_PATH), scritto a blocchi dal writer
+event_store = EventStore(writer)
 
 
 def get_sample():
-    """Ottiene i campioni audio dai due canali."""
-    size_of_float = 4
-    
-    with socket(AF_INET, SOCK_STREAM) as s:
-        s.connect((RING_HOST, RING_PORT))
-        s.sendall(b"nframes")
-        nframes = int(s.recv(256).decode("utf8").split("\n")[0])
-        s.sendall(b"len")
-        nblocks = int(s.recv(256).decode('utf8').split("\n")[0])
-        s.sendall(b"rate")
-        samplerate = int(s.recv(256).decode('utf8').split("\n")[0])
-        s.sendall(b"seconds")
-        blocksize = size_of_float * nframes * 2
-        s.sendall(b"dump")
-        
-        for i in range(nblocks):
-            if i == 0:
-                data = s.recv(blocksize)
-            else:
-                data = data + s.recv(blocksize)
-    
-    myblock = np.frombuffer(data, dtype=np.float32)
-    stereo_data = myblock.reshape(-1, 2)
+    """
+    Ottiene i nuovi campioni audio (arrivati dopo l'ultima lettura) dai due canali.
+    Ritorna anche il frame assoluto del primo campione, dal progressivo dei blocchi del ring.
+    """
+    samplerate, stereo_data, first_seq, dropped = ring_client.read_new()
     
-    with open(log_file_path, "a") as log_file:
-        log_file.write(f"LEN: {len(stereo_data)}\n")
+    logger.info(f"LEN: {len(stereo_data)}")
+    if dropped:
+        logger.info(f"Ring blocks dropped: {dropped} (total {ring_client.dropped_blocks})",
+                    extra=fields(dropped_blocks=dropped, total_dropped_blocks=ring_client.dropped_blocks))
     
     left_channel = stereo_data[:, 0]
     right_channel = stereo_data[:, 1]
+    first_frame = (first_seq - 1) * ring_client.nframes
     
-    return samplerate, left_channel, right_channel
+    return samplerate, left_channel, right_channel, first_frame
 
 
-async def send_wavefile(num, wave, bitrate, result):
-    """Invia il file audio al server per la detection."""
-    global RING_HOST
-    global SERVER_PORT_BASE
-    
+async def perform_detection_batch(blocks, br, stream_id, start_frames):
+    """
+    Esegue la detection di più finestre dello stesso canale con una sola richiesta
+    (un solo invoke del modello): sul pool di task server (worker meno carico, connessioni persistenti)
+    o in locale, secondo INFERENCE_MODE.
+    stream_id (canale) e start_frames (frame assoluti del ring) permettono di riusare
+    l'STFT della finestra precedente dello stesso canale.
+    Ritorna uno score (float) per finestra, None per tutte in caso di errore.
+    """
     try:
-        data_size = wave.itemsize
-        wave_content = wave.tobytes()
-        port = SERVER_PORT_BASE + int(num)
-        
-        with open(log_file_path, "a") as log_file:
-            log_file.write(f"CONNECTION PORT: {port}\n")
-        
-        file_size = len(wave_content)
-        reader, writer = await asyncio.open_connection(RING_HOST, port)
-        
-        writer.write(f"{bitrate},{file_size},{data_size}".encode())
-        await writer.drain()
-        
-        ack = await reader.read(3)
-        if ack != b'ACK':
-            print("Errore: ACK non ricevuto")
-            writer.close()
-            return
-        
-        writer.write(wave_content)
-        await writer.drain()
-        
-        response = await reader.read()
-        result[num] = response
-        
-        writer.close()
-        await writer.wait_closed()
+        scores = await task_pool.score_batch(np.stack(blocks), br, stream_id, start_frames)
+        return [float(score) for score in scores]
     except Exception as e:
-        with open(log_file_path, "a") as log_file:
-            log_file.write(f"ERRORE send_wavefile: {e}\n")
+        logger.info(f"ERRORE perform_detection_batch: {e}")
+        return [None] * len(blocks)
 
 
-    
+async def score_windows(pending, br):
+    """
+    Score delle finestre di un passaggio del loop (normalmente una, di più in recupero):
+    una richiesta batch per canale, i due canali in parallelo.
 
+    Args:
+        pending (list): dizionari con 'block', 'stream' e 'start_frame' (in ordine di frame)
+        br (int): Frequenza di campionamento (Hz)
 
-async def perform_detection_block(block, br):
+    Returns:
+        list: score (o None) nello stesso ordine di ``pending``
     """
-    Esegue la detection inviando un singolo blocco al task server.
-    Ritorna la risposta grezza del server (bytes).
+    by_stream = {}
+    for i, item in enumerate(pending):
+        by_stream.setdefault(item['stream'], []).append(i)
+    results = await asyncio.gather(*(
+        perform_detection_batch([pending[i]['block'] for i in indices], br, stream_id,
+                                [pending[i]['start_frame'] for i in indices])
+        for stream_id, indices in by_stream.items()
+    ))
+    scores = [None] * len(pending)
+    for indices, stream_scores in zip(by_stream.values(), results):
+        for i, score in zip(indices, stream_scores):
+            scores[i] = score
+    return scores
+
+
+def log_processing_latency(scheduler, start_time):
+    """Logga la latenza di processing di una finestra, la registra nello scheduler e la ritorna (ms)."""
+    end_time = time.time()
+    latency_ms = (end_time - start_time) * 1000
+    scheduler.record_latency(end_time - start_time)
+    logger.info(f"Processing latency: {latency_ms:.0f} ms", extra=fields(latency_ms=round(latency_ms, 1)))
+    return latency_ms
+
+
+def detect_and_save(resp, br, stream_id, start_frame, detect_left_block, detect_right_block,
+                    trigger_result, tdoa_result, iteration_timestamp, scheduler, start_time, clips=None):
     """
-    results = [None]
-    await send_wavefile(0, block, br, results)
-    return results[0]
+    Applica le soglie allo score di una finestra (calcolato da score_windows), salva il WAV
+    e registra l'evento nell'event store.
+
+    Args:
+        resp: Score del modello (None = errore del task server)
+        br: Frequenza di campionamento (Hz)
+        stream_id: Canale valutato (LEFT_STREAM / RIGHT_STREAM)
+        start_frame: Frame assoluto del ring del primo campione della finestra
+        detect_left_block, detect_right_block: Finestra stereo (salvata nel WAV con DETECTION_CLIP_MODE = "window")
+        trigger_result: Risultato del power trigger
+        tdoa_result: Risultato TDOA (None per trigger su un solo canale)
+        iteration_timestamp: Timestamp della finestra (nome dei file)
+        scheduler: WindowScheduler per la registrazione della latenza
+        start_time: Istante di inizio elaborazione della finestra
+        clips: ClipExtractor (DETECTION_CLIP_MODE = "event"): salva la clip attorno all'evento,
+            scritta quando arriva il post-roll (evento registrato da submit_clip); None = salva la finestra intera
+    """
+    detection = None
+    save_dir = None
+
+    # Applica la soglia su un unico score
+    if resp is not None:
+        try:
+            detection = float(resp)
+            logger.info(f"Detection ({iteration_timestamp}): {detection:.2f}",
+                        extra=fields(window=iteration_timestamp, start_frame=start_frame, stream=stream_id,
+                                     score=round(detection, 4)))
+            if detection >= DETECTION_THRESHOLD:
+                # Above threshold - positive detection (mai scartata dal writer)
+                save_dir = DETECTIONS_DIR
+            elif detection >= DETECTION_MIN_THRESHOLD:
+                # Below threshold but above minimum - save for analysis
+                save_dir = DETECTIONS_BELOW_THRESHOLD_DIR
+        except Exception as e:
+            logger.info(f"Error parsing detection result: {e}")
+    else:
+        logger.info("Detection: ERROR (no response from server)")
+
+    # Calcola e logga la latenza di processing (per tdoa, left_only, right_only)
+    latency_ms = log_processing_latency(scheduler, start_time)
+
+    detected = detection is not None and detection >= DETECTION_THRESHOLD
+    direction, angle_deg, confidence = detection_direction(trigger_result, tdoa_result)
+    # audio_path viene impostato solo quando il WAV è stato accodato al writer
+    event = dict(
+        ts=start_time, window=iteration_timestamp, start_frame=start_frame, stream=stream_id,
+        score=detection, detected=None if detection is None else detected,
+        action=trigger_result['action'], left_triggered=trigger_result['left_triggered'],
+        right_triggered=trigger_result['right_triggered'], event_offset=trigger_result.get('event_offset'),
+        direction=direction, angle=angle_deg, tdoa_sec=tdoa_result.get('tdoa_sec') if tdoa_result else None,
+        tdoa_confidence=confidence, latency_ms=round(latency_ms, 1), audio_path=None
+    )
+
+    if save_dir is not None and clips is not None:
+        # Frame dell'evento localizzato dal trigger (centro finestra se non localizzato);
+        # l'evento viene registrato da submit_clip, quando la clip è pronta
+        event_offset = trigger_result.get('event_offset')
+        if event_offset is None:
+            event_offset = len(detect_left_block) // 2
+        clips.request(start_frame + event_offset, directory=save_dir, iteration_timestamp=iteration_timestamp,
+                      trigger_result=trigger_result, tdoa_result=tdoa_result, score=detection,
+                      detected=detected, capture_time=start_time, droppable=not detected, event=event)
+        return
+
+    if save_dir is not None:
+        queued = writer.submit(save_detection, save_dir, iteration_timestamp, br,
+                               detect_left_block, detect_right_block, trigger_result, tdoa_result,
+                               detection, detected, start_time, droppable=not detected)
+        if queued:
+            event['audio_path'] = os.path.join(save_dir, iteration_timestamp + ".wav")
+            if not detected:
+                logger.info(f"Saved below-threshold detection (score: {detection:.2f})")
+        else:
+            logger.info(f"Detection not saved, writer queue full (score: {detection:.2f})")
+    event_store.add(**event)
 
 
 async def main_loop_with_trigger():
     """
     Loop principale con power trigger integration.
+    Le finestre (WINDOW_SEC, hop HALF_WINDOW) sono costruite dal contatore di frame del ring:
+    ogni hop viene analizzato una sola volta e i ritardi diventano contatori (vedi WindowScheduler).
     """
+    window_archive = None
+    clips = None
+    # SIGTERM (stop_all.sh) e SIGINT cancellano il loop: il finally e la chiusura in __main__
+    # completano i salvataggi, gli eventi e il log ancora in coda
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, main_task.cancel)
     try:
         # Inizializza il power trigger
-        br, _, _ = get_sample()
-        trigger = PowerTrigger(br, log_file_path=log_file_path)
-        # Rolling tails (last HALF_WINDOW seconds) per canale per allineare hop=HALF_WINDOW
-        prev_left_tail = np.array([], dtype=np.float32)
-        prev_right_tail = np.array([], dtype=np.float32)
+        br, init_left, init_right, init_frame = get_sample()
+        # Il logger "power_trigger" scrive già sul log del detector (setup_logging)
+        trigger = PowerTrigger(br)
+        # La prima lettura (tutto il ring) ancora la griglia: la prima finestra termina sul suo ultimo frame
+        scheduler = WindowScheduler(br)
+        scheduler.push(np.stack((init_left, init_right), axis=-1), init_frame)
         
         # Contatore per le finestre salvate
         window_counter = 0
+        # WINDOW_SAVE_MODE "archive": ogni hop scritto una sola volta (segmenti + indice), dal writer
+        if WINDOW_SAVE_MODE == "archive":
+            window_archive = WindowArchive(br)
+        # DETECTION_CLIP_MODE "event": storia breve del ring per le clip pre/post-roll attorno agli eventi
+        if DETECTION_CLIP_MODE == "event":
+            clips = ClipExtractor(br)
+            clips.push(np.stack((init_left, init_right), axis=-1), init_frame)
         
-        with open(log_file_path, "a") as log_file:
-            log_file.write("=== Starting detector with power trigger ===\n")
-            log_file.write(f"Window save mode: {WINDOW_SAVE_MODE}\n")
+        logger.info("=== Starting detector with power trigger ===")
+        logger.info(f"Window save mode: {WINDOW_SAVE_MODE}")
         
         while True:
-            br, left_channel, right_channel = get_sample()
-            # Costruisce finestre rolling 0.8s con hop 0.4s usando le code precedenti
-            w = int(br * WINDOW_SEC)
-            h = int(br * HALF_WINDOW)
-            # LEFT
-            eff_left = left_channel if prev_left_tail.size == 0 else np.concatenate([prev_left_tail, left_channel])
-            detect_left_block = eff_left[-w:] if eff_left.size >= w else eff_left
-            prev_left_tail = eff_left[-h:] if eff_left.size >= h else eff_left
-            # RIGHT
-            eff_right = right_channel if prev_right_tail.size == 0 else np.concatenate([prev_right_tail, right_channel])
-            detect_right_block = eff_right[-w:] if eff_right.size >= w else eff_right
-            prev_right_tail = eff_right[-h:] if eff_right.size >= h else eff_right
-            
-            
-            # Genera timestamp per questa iterazione (usato per log e file)
-            # Questo garantisce che il timestamp nel log corrisponda al timestamp nei file salvati
-            iteration_timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+            windows = scheduler.pop_windows()
+            if len(windows) > 1:
+                logger.info(f"Catching up: {len(windows)} windows pending", extra=fields(pending_windows=len(windows)))
             
-            # Cattura il tempo di inizio per calcolare la latenza del processing
-            start_time = time.time()
+            # Finestre con trigger del passaggio corrente: valutate insieme dopo il ciclo (score_windows)
+            pending = []
+            for start_frame, detect_left_block, detect_right_block in windows:
+                # Cattura il tempo di inizio per calcolare la latenza del processing
+                start_time = time.time()
+
+                # Genera timestamp per questa finestra (usato per log e file)
+                # Questo garantisce che il timestamp nel log corrisponda al timestamp nei file salvati.
+                # Il frame di inizio rende il nome univoco: in recupero più finestre (hop di 0.4 s)
+                # sono elaborate nello stesso secondo
+                iteration_timestamp = f"{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(start_time))}_{start_frame}"
             
-            # Esegui il power trigger sulla stessa finestra usata per la detection (0.8s rolling)
-            trigger_result = trigger.process_stereo_buffer(detect_left_block, detect_right_block)
+                # Esegui il power trigger sulla stessa finestra usata per la detection (0.8s rolling)
+                trigger_result = trigger.process_stereo_buffer(detect_left_block, detect_right_block)
             
-            with open(log_file_path, "a") as log_file:
-                log_file.write(f"\n--- Trigger Result ---\n")
-                log_file.write(f"Timestamp: {iteration_timestamp}\n")
-                log_file.write(f"Action: {trigger_result['action']}\n")
-                log_file.write(f"Channel to analyze: {trigger_result['channel_to_analyze']}\n")
+                logger.info("--- Trigger Result ---",
+                            extra=fields(window=iteration_timestamp, start_frame=start_frame,
+                                         action=trigger_result['action'], event_offset=trigger_result['event_offset']))
+                logger.info(f"Timestamp: {iteration_timestamp}")
+                logger.info(f"Window start frame: {start_frame}")
+                logger.info(f"Action: {trigger_result['action']}")
+                logger.info(f"Channel to analyze: {trigger_result['channel_to_analyze']}")
+                if trigger_result['event_offset'] is not None:
+                    logger.info(f"Event offset: {trigger_result['event_offset']} samples")
             
-            # Window saving logic based on configured mode
-            should_save_window = False
+                # Window saving logic based on configured mode
+                should_save_window = False
             
-            if WINDOW_SAVE_MODE == "all":
-                # Save all analyzed windows
-                should_save_window = True
-            elif WINDOW_SAVE_MODE == "trigger" and trigger_result['action'] != 'none':
-                # Save only windows that activate the trigger
-                should_save_window = True
+                if WINDOW_SAVE_MODE in ("all", "archive"):
+                    # Save all analyzed windows
+                    should_save_window = True
+                elif WINDOW_SAVE_MODE == "trigger" and trigger_result['action'] != 'none':
+                    # Save only windows that activate the trigger
+                    should_save_window = True
             
-            if should_save_window:
-                window_counter += 1
-                save_analysis_window(
-                    detect_left_block, 
-                    detect_right_block, 
-                    br, 
-                    window_counter, 
-                    trigger_result
-                )
-                with open(log_file_path, "a") as log_file:
-                    log_file.write(f"Saved analysis window #{window_counter} (mode: {WINDOW_SAVE_MODE})\n")
+                if should_save_window and window_archive is not None:
+                    window_counter += 1
+                    queued = writer.submit(
+                        window_archive.append,
+                        start_frame,
+                        detect_left_block,
+                        detect_right_block,
+                        window_counter,
+                        trigger_result,
+                        start_time
+                    )
+                    if not queued:
+                        logger.info(f"Analysis window #{window_counter} not archived, writer queue full")
+                elif should_save_window:
+                    window_counter += 1
+                    queued = writer.submit(
+                        save_analysis_window,
+                        detect_left_block, 
+                        detect_right_block, 
+                        br, 
+                        window_counter, 
+                        trigger_result,
+                        start_time
+                    )
+                    if queued:
+                        logger.info(f"Saved analysis window #{window_counter} (mode: {WINDOW_SAVE_MODE})")
+                    else:
+                        logger.info(f"Analysis window #{window_counter} not saved, writer queue full")
             
-            # Determina quale canale analizzare
-            if trigger_result['action'] == 'none':
-                # Nessun trigger attivato, salta la detection
-                end_time = time.time()
-                latency_ms = (end_time - start_time) * 1000
-                with open(log_file_path, "a") as log_file:
-                    log_file.write("No triggers activated, skipping detection\n")
-                    log_file.write("Detection: N/A\n") # Completa il log per consistenza
-                    log_file.write(f"Processing latency: {latency_ms:.0f} ms\n")
-                # IMPORTANTE: Aspetta prima di continuare, altrimenti il loop gira troppo veloce
-                # e riceve sempre gli stessi dati dal ring buffer
-                await asyncio.sleep(HALF_WINDOW)  # Aspetta l'hop time prima di prendere il prossimo blocco
-                continue
+                # Determina quale canale analizzare
+                if trigger_result['action'] == 'none':
+                    # Nessun trigger attivato, salta la detection
+                    end_time = time.time()
+                    latency_ms = (end_time - start_time) * 1000
+                    logger.info("No triggers activated, skipping detection")
+                    logger.info("Detection: N/A") # Completa il log per consistenza
+                    logger.info(f"Processing latency: {latency_ms:.0f} ms", extra=fields(latency_ms=round(latency_ms, 1)))
+                    scheduler.record_latency(end_time - start_time)
+                    continue
             
-            if trigger_result['action'] == 'tdoa':
-                # Entrambi i trigger attivati: esegui TDOA
-                with open(log_file_path, "a") as log_file:
-                    log_file.write("Performing TDOA analysis...\n")
+                # Canale su cui eseguire la detection (None = nessuna detection)
+                detection_block = None
+                detection_stream = None
+                tdoa_result = None
+
+                if trigger_result['action'] == 'tdoa':
+                    # Entrambi i trigger attivati: esegui TDOA
+                    logger.info("Performing TDOA analysis...")
                 
-                # Estrae finestra per TDOA (ultimi TDOA_WIN_SEC secondi)
-                tdoa_win_sec = TDOA_WIN_SEC
-                n_tdoa = max(1, int(br * tdoa_win_sec))
-                lc = detect_left_block[-n_tdoa:] if detect_left_block.size > n_tdoa else detect_left_block
-                rc = detect_right_block[-n_tdoa:] if detect_right_block.size > n_tdoa else detect_right_block
+                    # Estrae finestra per TDOA centrata sull'evento localizzato dal trigger
+                    # (TDOA_WIN_SEC, o TDOA_BATCH_WIN_SEC divisa in frame in modalità "batch")
+                    tdoa_win_sec = TDOA_BATCH_WIN_SEC if TDOA_MODE == "batch" else TDOA_WIN_SEC
+                    n_tdoa = max(1, int(br * tdoa_win_sec))
+                    tdoa_slice = event_slice(detect_left_block.size, trigger_result['event_offset'], n_tdoa)
+                    lc = detect_left_block[tdoa_slice]
+                    rc = detect_right_block[tdoa_slice]
                 
-                # Esegui TDOA direttamente sui buffer (no subprocess)
-                tdoa_result = compute_tdoa_direct(lc, rc, br)
+                    # Esegui TDOA direttamente sui buffer (no subprocess)
+                    tdoa_result = compute_tdoa_direct(lc, rc, br)
                 
-                with open(log_file_path, "a") as log_file:
-                    log_file.write(f"TDOA Result: {tdoa_result}\n")
+                    logger.info(f"TDOA Result: {tdoa_result}", extra=fields(tdoa=tdoa_result))
                 
-                if tdoa_result['success']:
-                    # Ottieni il canale più vicino
-                    nearest_channel = get_nearest_channel(
-                        left_channel, right_channel, tdoa_result['direction']
-                    )
+                    if tdoa_result['success']:
+                        # Ottieni il canale più vicino
+                        nearest_channel = get_nearest_channel(
+                            detect_left_block, detect_right_block, tdoa_result['direction']
+                        )
                     
-                    # Esegui la detection sul canale più vicino usando la finestra rolling
-                    if tdoa_result['direction'].lower() in ['sinistra', 'left']:
-                        resp = await perform_detection_block(detect_left_block, br)
+                        # Esegui la detection sul canale più vicino usando la finestra rolling
+                        if tdoa_result['direction'].lower() in ['sinistra', 'left']:
+                            detection_block, detection_stream = detect_left_block, LEFT_STREAM
+                        else:
+                            detection_block, detection_stream = detect_right_block, RIGHT_STREAM
                     else:
-                        resp = await perform_detection_block(detect_right_block, br)
-
-                    # Applica la soglia su un unico score
-                    if resp is not None:
-                        try:
-                            detection = float(resp.decode().strip())
-                            with open(log_file_path, "a") as log_file:
-                                log_file.write(f"Detection: {detection:.2f}\n")
-                            if detection >= DETECTION_THRESHOLD:
-                                # Above threshold - positive detection
-                                os.makedirs(DETECTIONS_DIR, exist_ok=True)
-                                filepath_base = os.path.join(DETECTIONS_DIR, iteration_timestamp)
-                                wavfile.write(filepath_base + ".wav", br, np.stack((left_channel, right_channel), axis=-1))
-                                save_detection_json(filepath_base, trigger_result, tdoa_result, detection, True)
-                            elif detection >= DETECTION_MIN_THRESHOLD:
-                                # Below threshold but above minimum - save for analysis
-                                os.makedirs(DETECTIONS_BELOW_THRESHOLD_DIR, exist_ok=True)
-                                filepath_base = os.path.join(DETECTIONS_BELOW_THRESHOLD_DIR, iteration_timestamp)
-                                wavfile.write(filepath_base + ".wav", br, np.stack((left_channel, right_channel), axis=-1))
-                                save_detection_json(filepath_base, trigger_result, tdoa_result, detection, False)
-                                with open(log_file_path, "a") as log_file:
-                                    log_file.write(f"Saved below-threshold detection (score: {detection:.2f})\n")
-                        except Exception as e:
-                            with open(log_file_path, "a") as log_file:
-                                log_file.write(f"Error parsing detection result: {e}\n")
-                else:
-                    with open(log_file_path, "a") as log_file:
-                        log_file.write("TDOA analysis failed\n")
+                        logger.info("TDOA analysis failed")
             
-            elif trigger_result['action'] == 'left_only':
-                # Solo il trigger sinistro attivato
-                with open(log_file_path, "a") as log_file:
-                    log_file.write("Left trigger only, detecting on left channel\n")
-                    log_file.write("TDOA Result: N/A (single channel trigger)\n")
-                
-                resp = await perform_detection_block(detect_left_block, br)
-                if resp is not None:
-                    try:
-                        detection = float(resp.decode().strip())
-                        with open(log_file_path, "a") as log_file:
-                            log_file.write(f"Detection: {detection:.2f}\n")
-                        if detection >= DETECTION_THRESHOLD:
-                            # Above threshold - positive detection
-                            os.makedirs(DETECTIONS_DIR, exist_ok=True)
-                            filepath_base = os.path.join(DETECTIONS_DIR, iteration_timestamp)
-                            wavfile.write(filepath_base + ".wav", br, np.stack((left_channel, right_channel), axis=-1))
-                            save_detection_json(filepath_base, trigger_result, None, detection, True)
-                        elif detection >= DETECTION_MIN_THRESHOLD:
-                            # Below threshold but above minimum - save for analysis
-                            os.makedirs(DETECTIONS_BELOW_THRESHOLD_DIR, exist_ok=True)
-                            filepath_base = os.path.join(DETECTIONS_BELOW_THRESHOLD_DIR, iteration_timestamp)
-                            wavfile.write(filepath_base + ".wav", br, np.stack((left_channel, right_channel), axis=-1))
-                            save_detection_json(filepath_base, trigger_result, None, detection, False)
-                            with open(log_file_path, "a") as log_file:
-                                log_file.write(f"Saved below-threshold detection (score: {detection:.2f})\n")
-                    except Exception as e:
-                        with open(log_file_path, "a") as log_file:
-                            log_file.write(f"Error parsing detection result: {e}\n")
-                else:
-                    with open(log_file_path, "a") as log_file:
-                        log_file.write("Detection: ERROR (no response from server)\n")
+                elif trigger_result['action'] == 'left_only':
+                    # Solo il trigger sinistro attivato
+                    logger.info("Left trigger only, detecting on left channel")
+                    logger.info("TDOA Result: N/A (single channel trigger)")
+                    detection_block, detection_stream = detect_left_block, LEFT_STREAM
             
-            elif trigger_result['action'] == 'right_only':
-                # Solo il trigger destro attivato
-                with open(log_file_path, "a") as log_file:
-                    log_file.write("Right trigger only, detecting on right channel\n")
-                    log_file.write("TDOA Result: N/A (single channel trigger)\n")
-                
-                resp = await perform_detection_block(detect_right_block, br)
-                if resp is not None:
-                    try:
-                        detection = float(resp.decode().strip())
-                        with open(log_file_path, "a") as log_file:
-                            log_file.write(f"Detection: {detection:.2f}\n")
-                        if detection >= DETECTION_THRESHOLD:
-                            # Above threshold - positive detection
-                            os.makedirs(DETECTIONS_DIR, exist_ok=True)
-                            filepath_base = os.path.join(DETECTIONS_DIR, iteration_timestamp)
-                            wavfile.write(filepath_base + ".wav", br, np.stack((left_channel, right_channel), axis=-1))
-                            save_detection_json(filepath_base, trigger_result, None, detection, True)
-                        elif detection >= DETECTION_MIN_THRESHOLD:
-                            # Below threshold but above minimum - save for analysis
-                            os.makedirs(DETECTIONS_BELOW_THRESHOLD_DIR, exist_ok=True)
-                            filepath_base = os.path.join(DETECTIONS_BELOW_THRESHOLD_DIR, iteration_timestamp)
-                            wavfile.write(filepath_base + ".wav", br, np.stack((left_channel, right_channel), axis=-1))
-                            save_detection_json(filepath_base, trigger_result, None, detection, False)
-                            with open(log_file_path, "a") as log_file:
-                                log_file.write(f"Saved below-threshold detection (score: {detection:.2f})\n")
-                    except Exception as e:
-                        with open(log_file_path, "a") as log_file:
-                            log_file.write(f"Error parsing detection result: {e}\n")
+                elif trigger_result['action'] == 'right_only':
+                    # Solo il trigger destro attivato
+                    logger.info("Right trigger only, detecting on right channel")
+                    logger.info("TDOA Result: N/A (single channel trigger)")
+                    detection_block, detection_stream = detect_right_block, RIGHT_STREAM
+            
+                if detection_block is None:
+                    log_processing_latency(scheduler, start_time)
                 else:
-                    with open(log_file_path, "a") as log_file:
-                        log_file.write("Detection: ERROR (no response from server)\n")
+                    pending.append({
+                        'block': detection_block, 'stream': detection_stream, 'start_frame': start_frame,
+                        'left': detect_left_block, 'right': detect_right_block,
+                        'trigger_result': trigger_result, 'tdoa_result': tdoa_result,
+                        'iteration_timestamp': iteration_timestamp, 'start_time': start_time,
+                    })
+
+            if pending:
+                # Una richiesta batch per canale invece di una per finestra (un solo invoke per le finestre in recupero)
+                scores = await score_windows(pending, br)
+                for item, score in zip(pending, scores):
+                    detect_and_save(
+                        score, br, item['stream'], item['start_frame'], item['left'], item['right'],
+                        item['trigger_result'], item['tdoa_result'], item['iteration_timestamp'],
+                        scheduler, item['start_time'], clips
+                    )
+            if clips is not None:
+                # Clip il cui post-roll è arrivato (anche da iterazioni precedenti)
+                for clip in clips.pop_ready():
+                    submit_clip(clip, br)
+            # Eventi rari: scrive il blocco parziale dopo EVENT_STORE_FLUSH_SEC
+            event_store.flush(force=False)
             
-            # Calcola e logga la latenza di processing (per tdoa, left_only, right_only)
-            end_time = time.time()
-            latency_ms = (end_time - start_time) * 1000
-            with open(log_file_path, "a") as log_file:
-                log_file.write(f"Processing latency: {latency_ms:.0f} ms\n")
+            if windows and scheduler.windows % SCHEDULER_STATS_EVERY < len(windows):
+                stats = scheduler.stats()
+                logger.info(
+                    f"Scheduler stats: windows={stats['windows']} dropped_hops={stats['dropped_hops']} "
+                    f"overruns={stats['overruns']} catchup={stats['catchup_windows']} "
+                    f"gap_frames={stats['gap_frames']}",
+                    extra=fields(scheduler=stats)
+                )
+                pool_stats = task_pool.stats()
+                logger.info("Task pool: " + ", ".join(
+                    f"{w['port']} req={w['requests']} fail={w['failures']}" for w in pool_stats
+                ), extra=fields(task_pool=pool_stats))
+                if window_archive is not None:
+                    astats = window_archive.stats()
+                    logger.info(
+                        f"Window archive: windows={astats['windows']} segments={astats['segments']} "
+                        f"write_ratio={astats['write_ratio']}",
+                        extra=fields(window_archive=astats)
+                    )
+                if clips is not None:
+                    cstats = clips.stats()
+                    logger.info(
+                        f"Clips: saved={cstats['clips']} truncated={cstats['truncated']} pending={cstats['pending']}",
+                        extra=fields(clips=cstats)
+                    )
+                wstats = writer.stats()
+                logger.info(
+                    f"Writer stats: queued={wstats['queued']} written={wstats['written']} "
+                    f"dropped={wstats['dropped']} errors={wstats['errors']} pending={wstats['pending']} "
+                    f"high_water={wstats['high_water']}",
+                    extra=fields(writer=wstats)
+                )
             
-            # IMPORTANTE: Aspetta l'hop time prima di processare la prossima finestra
-            # Questo garantisce che processiamo esattamente ogni 0.4s (hop time)
-            # senza questo sleep, il loop girerebbe troppo veloce e processerebbe
-            # gli stessi dati più volte o salterebbe finestre
-            await asyncio.sleep(HALF_WINDOW)
+            # Attende solo il tempo necessario perché il ring contenga la prossima finestra
+            # (il periodo resta esattamente HALF_WINDOW, indipendentemente dal tempo di elaborazione)
+            await asyncio.sleep(scheduler.seconds_until_next_window())
+            br, left_channel, right_channel, first_frame = get_sample()
+            stereo = np.stack((left_channel, right_channel), axis=-1)
+            scheduler.push(stereo, first_frame)
+            if clips is not None:
+                clips.push(stereo, first_frame)
     
+    except asyncio.CancelledError:
+        logger.info("Detector stopped by signal")
     except Exception as e:
-        with open(log_file_path, "a") as log_file:
-            log_file.write(f"Exception in main_loop_with_trigger: {e}\n")
+        logger.info(f"Exception in main_loop_with_trigger: {e}")
+    finally:
+        if clips is not None:
+            # Clip ancora in attesa di post-roll: salvate con l'audio disponibile
+            for clip in clips.pop_ready(force=True):
+                submit_clip(clip, br)
+        if window_archive is not None:
+            # Chiusura nel thread del writer, dopo le finestre ancora in coda
+            writer.submit(window_archive.close, droppable=False)
 
 
 if __name__ == "__main__":
     try:
-        format = "%(asctime)s:%(msecs)03s  %(message)s"
-        logging.basicConfig(format=format, level=logging.INFO, datefmt="%H:%M:%S")
+        # Il log va solo su file tramite la coda (setup_logging): nessun handler sincrono sulla console
         asyncio.run(main_loop_with_trigger())
     except KeyboardInterrupt:
-        with open(log_file_path, "a") as log_file:
-            log_file.write("Program interrupted by user\n")
+        logger.info("Program interrupted by user")
     except Exception as e:
-        with open(log_file_path, "a") as log_file:
-            log_file.write(f"Fatal error: {e}\n")
+        logger.info(f"Fatal error: {e}")
+    finally:
+        # Completa i salvataggi e gli eventi ancora in coda, poi svuota la coda del log
+        event_store.close()
+        writer.close(timeout=10)
+        log_listener.stop()
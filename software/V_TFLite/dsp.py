@@ -0,0 +1,257 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+DSP Module
+Front end spettrogramma -> immagine condiviso da task1_v3.py, test_power_trigger.py e show_spectrogram.py.
+
+Lo spettrogramma viene calcolato con un piano precalcolato (finestra Hann e scala in cache,
+vista a passo fisso dei frame, FFT reale float32) e solo i bin della banda MIN_FREQ-MAX_FREQ,
+gli unici usati dall'immagine, vengono scalati, convertiti in modulo e in dB.
+StftCache evita di ricalcolare i frame già visti dalla finestra precedente dello stesso flusso.
+Le operazioni e le precisioni sono le stesse di
+``scipy.signal.spectrogram(..., scaling='density', mode='magnitude')`` (detrend 'constant' incluso),
+quindi per ingressi float32 i valori in banda coincidono bit a bit.
+
+Verifica di parità e tempi contro il percorso scipy originale:
+    python dsp.py [file.wav]
+"""
+
+import functools
+import sys
+import time
+
+import cv2
+import numpy as np
+import scipy.fft
+from PIL import Image
+from scipy.signal import get_window
+
+from config import MIN_FREQ, MAX_FREQ, IMG_WIDTH, IMG_HEIGHT, NFFT, OVERLAP
+
+
+class StftPlan:
+    """
+    Piano STFT ristretto a una banda di frequenze. Immutabile dopo la costruzione,
+    quindi condivisibile tra thread (vedi get_plan).
+    """
+
+    def __init__(self, sample_rate, nfft=NFFT, overlap=OVERLAP, min_f=MIN_FREQ, max_f=MAX_FREQ):
+        """
+        Precalcola finestra, scala e bin di banda.
+
+        Args:
+            sample_rate (int): Frequenza di campionamento (Hz)
+            nfft (int): Lunghezza del frame
+            overlap (float): Sovrapposizione tra frame (0-1)
+            min_f (float): Frequenza minima della banda (Hz)
+            max_f (float): Frequenza massima della banda (Hz)
+        """
+        self.sample_rate = sample_rate
+        self.nfft = nfft
+        self.hop = int(nfft * (1 - overlap))
+
+        # Stessa selezione di spectrogram_to_image sulle frequenze di scipy (righe 0..nfft//2-1)
+        all_freqs = np.fft.rfftfreq(nfft, 1.0 / sample_rate)[: nfft // 2]
+        self.idx_min = int(np.searchsorted(all_freqs, min_f))
+        self.idx_max = int(np.searchsorted(all_freqs, max_f, side='right'))
+        self.freqs = all_freqs[self.idx_min:self.idx_max]
+        self.nbins = len(self.freqs)
+
+        # Hann periodica come scipy, con le stesse precisioni (float32 in ingresso): finestra float32,
+        # scala 'density' in magnitudine sqrt(1 / (fs * sum(win^2))) calcolata in complex64
+        window = get_window('hann', nfft)
+        window_c = window.astype(np.complex64)
+        self._window = window.astype(np.float32)
+        self._scale = np.sqrt(1.0 / (sample_rate * (window_c * window_c).sum()))
+
+    def magnitude(self, signal):
+        """
+        Magnitudine STFT in banda.
+
+        Args:
+            signal (numpy.ndarray): Segnale mono
+
+        Returns:
+            numpy.ndarray: Array (nbins, n_frames) float32
+        """
+        signal = np.asarray(signal, dtype=np.float32)
+        if len(signal) < self.nfft:
+            raise ValueError(f"Signal of {len(signal)} samples is shorter than nfft={self.nfft}")
+        frames = np.lib.stride_tricks.sliding_window_view(signal, self.nfft)[::self.hop]
+        # Detrend 'constant' e finestra come scipy (una sola copia dei frame, poi in place)
+        frames = frames - frames.mean(axis=1, keepdims=True)
+        frames *= self._window
+        # FFT reale float32; scala, modulo e log solo sui bin di banda
+        spec = scipy.fft.rfft(frames, axis=1, overwrite_x=True)[:, self.idx_min:self.idx_max]
+        spec *= self._scale
+        return np.abs(spec).T
+
+    def spectrogram_db(self, signal):
+        """
+        Spettrogramma in dB sulla banda del piano.
+
+        Returns:
+            tuple: (Sxx_db (nbins, n_frames), freqs della banda)
+        """
+        Sxx_db = self.magnitude(signal)
+        Sxx_db += np.float32(1e-12)
+        np.log10(Sxx_db, out=Sxx_db)
+        Sxx_db *= 20
+        return Sxx_db, self.freqs
+
+
+@functools.lru_cache(maxsize=8)
+def get_plan(sample_rate, nfft=NFFT, overlap=OVERLAP, min_f=MIN_FREQ, max_f=MAX_FREQ):
+    """Piano STFT in cache per i parametri dati (costruito una sola volta per processo)."""
+    return StftPlan(sample_rate, nfft=nfft, overlap=overlap, min_f=min_f, max_f=max_f)
+
+
+class StftCache:
+    """
+    STFT incrementale per finestre sovrapposte dello stesso flusso (es. un canale del ring).
+    Per ogni flusso tiene le colonne in dB dell'ultima finestra, indicizzate per frame assoluto:
+    una nuova finestra riusa le colonne già calcolate (50% con hop = mezza finestra) e calcola
+    solo i frame dell'audio nuovo. Ogni colonna dipende solo dal proprio frame, quindi il
+    risultato è identico al calcolo completo. Non thread-safe (una istanza per thread).
+    """
+
+    def __init__(self, nfft=NFFT, overlap=OVERLAP, min_f=MIN_FREQ, max_f=MAX_FREQ):
+        self.nfft = nfft
+        self.overlap = overlap
+        self.min_f = min_f
+        self.max_f = max_f
+        # stream_id -> (sample_rate, frame assoluto della colonna 0, Sxx_db)
+        self._streams = {}
+        self.reused_columns = 0
+        self.computed_columns = 0
+
+    def spectrogram_db(self, signal, sr, stream_id, start_frame):
+        """
+        Spettrogramma in dB della finestra, riusando le colonne in comune con la precedente.
+
+        Args:
+            signal (numpy.ndarray): Finestra mono
+            sr (int): Frequenza di campionamento (Hz)
+            stream_id (int): Identificativo del flusso (es. canale)
+            start_frame (int): Frame assoluto del primo campione (< 0 = sconosciuto, nessun riuso)
+
+        Returns:
+            tuple: (Sxx_db (nbins, n_frames), freqs della banda)
+        """
+        plan = get_plan(int(sr), self.nfft, self.overlap, self.min_f, self.max_f)
+        if start_frame < 0:
+            Sxx_db, freqs = plan.spectrogram_db(signal)
+            self.computed_columns += Sxx_db.shape[1]
+            return Sxx_db, freqs
+
+        n_frames = (len(signal) - plan.nfft) // plan.hop + 1
+        reused = 0
+        cached = self._streams.get(stream_id)
+        if cached is not None and cached[0] == int(sr):
+            _, origin, cached_db = cached
+            delta = start_frame - origin
+            # Riuso solo se la griglia dei frame è la stessa e la finestra inizia dentro la precedente
+            if delta >= 0 and delta % plan.hop == 0 and delta // plan.hop < cached_db.shape[1]:
+                offset = delta // plan.hop
+                reused = min(cached_db.shape[1] - offset, n_frames)
+
+        Sxx_db = np.empty((plan.nbins, n_frames), dtype=np.float32)
+        if reused:
+            Sxx_db[:, :reused] = cached_db[:, offset:offset + reused]
+        if reused < n_frames:
+            Sxx_db[:, reused:], _ = plan.spectrogram_db(signal[reused * plan.hop:])
+        self.reused_columns += reused
+        self.computed_columns += n_frames - reused
+        self._streams[stream_id] = (int(sr), start_frame, Sxx_db)
+        return Sxx_db, plan.freqs
+
+
+def make_spectrogram(signal, sr, nfft=NFFT, overlap=OVERLAP, min_f=MIN_FREQ, max_f=MAX_FREQ):
+    """Spectrogram: waveform -> dB spectrogram (solo la banda min_f-max_f)."""
+    return get_plan(int(sr), nfft, overlap, min_f, max_f).spectrogram_db(signal)
+
+
+def spectrogram_to_image(Sxx_db, freqs, min_f=MIN_FREQ, max_f=MAX_FREQ, w=IMG_WIDTH, h=IMG_HEIGHT):
+    """To grayscale PIL Image."""
+    idx_min = np.searchsorted(freqs, min_f)
+    idx_max = np.searchsorted(freqs, max_f, side='right')
+    block = Sxx_db[idx_min:idx_max]
+    block = block - block.min()
+    denom = block.max() if block.max() != 0 else 1.0
+    block = block / denom
+    img_arr = (255 * block)[::-1].astype(np.uint8)  # flip Y
+    img = Image.fromarray(img_arr, mode='L')
+    return img.resize((w, h), resample=Image.BILINEAR)
+
+
+def apply_sobel_vertical(image):
+    """Sobel filter (vertical)."""
+    arr = np.array(image)
+    sobel = cv2.Sobel(arr, cv2.CV_64F, 0, 1, ksize=7)
+    sobel = cv2.normalize(sobel, None, 0, 255, cv2.NORM_MINMAX)
+    return Image.fromarray(sobel.astype(np.uint8), mode='L')
+
+
+def waveform_to_image(signal, sr, nfft=NFFT, overlap=OVERLAP, min_f=MIN_FREQ, max_f=MAX_FREQ, w=IMG_WIDTH, h=IMG_HEIGHT):
+    Sxx_db, freqs = make_spectrogram(signal, sr, nfft=nfft, overlap=overlap, min_f=min_f, max_f=max_f)
+    return spectrogram_to_image(Sxx_db, freqs, min_f=min_f, max_f=max_f, w=w, h=h)
+
+
+def reference_spectrogram(signal, sr, nfft=NFFT, overlap=OVERLAP):
+    """Percorso scipy originale (intera banda 0-sr/2), usato solo per la verifica di parità."""
+    from scipy.signal import spectrogram
+    hop = int(nfft * (1 - overlap))
+    freqs, times, Sxx = spectrogram(
+        signal, fs=sr, window='hann', nperseg=nfft,
+        noverlap=nfft - hop, scaling='density', mode='magnitude'
+    )
+    Sxx = Sxx[: nfft // 2, :]
+    return 20 * np.log10(Sxx + 1e-12), freqs
+
+
+def _timeit(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    """Confronta il piano in banda con scipy: differenza in dB, pixel dell'immagine e tempi."""
+    if len(sys.argv) > 1:
+        from scipy.io import wavfile
+        sr, data = wavfile.read(sys.argv[1])
+        if data.ndim == 2:
+            data = data[:, 0]
+        signal = data.astype(np.float32)
+    else:
+        # Rumore + fischio sintetico su una finestra WINDOW_SEC a 192 kHz
+        sr = 192000
+        t = np.arange(int(0.8 * sr)) / sr
+        rng = np.random.default_rng(0)
+        signal = (0.05 * rng.standard_normal(len(t)) + 0.2 * np.sin(2 * np.pi * (8000 + 6000 * t) * t)).astype(np.float32)
+
+    ref_db, ref_freqs = reference_spectrogram(signal, sr)
+    band_db, band_freqs = make_spectrogram(signal, sr)
+    plan = get_plan(int(sr))
+    ref_band = ref_db[plan.idx_min:plan.idx_max]
+
+    db_diff = np.abs(ref_band - band_db).max()
+    img_ref = np.array(apply_sobel_vertical(spectrogram_to_image(ref_db, ref_freqs)), dtype=np.int16)
+    img_new = np.array(apply_sobel_vertical(spectrogram_to_image(band_db, band_freqs)), dtype=np.int16)
+    pix_diff = np.abs(img_ref - img_new)
+
+    t_ref = _timeit(lambda: reference_spectrogram(signal, sr))
+    t_new = _timeit(lambda: make_spectrogram(signal, sr))
+    print(f"Samples: {len(signal)} @ {sr} Hz, band bins: {plan.nbins}, frames: {band_db.shape[1]}")
+    print(f"Max |dB| difference: {db_diff:.2e}")
+    print(f"Image (Sobel) pixels differing: {np.count_nonzero(pix_diff)} / {pix_diff.size}, max diff: {pix_diff.max()}")
+    print(f"scipy spectrogram: {t_ref:.2f} ms, band plan: {t_new:.2f} ms ({t_ref / t_new:.1f}x)")
+
+    ok = band_db.shape == ref_band.shape and np.array_equal(band_freqs, ref_freqs[plan.idx_min:plan.idx_max]) \
+        and db_diff < 1e-2 and pix_diff.max() <= 1
+    print("PARITY OK" if ok else "PARITY FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
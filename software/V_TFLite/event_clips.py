@@ -0,0 +1,139 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Event Clips
+Clip audio centrate sull'evento per le detection (DETECTION_CLIP_MODE = "event"):
+CLIP_PRE_ROLL_SEC prima e CLIP_POST_ROLL_SEC dopo il frame dell'evento (inizio finestra + event_offset
+del trigger), invece dell'intera finestra analizzata.
+
+``ClipExtractor`` tiene una storia breve dell'audio del ring indicizzata per frame assoluto
+(gli stessi blocchi passati al WindowScheduler). ``request`` registra una clip e ritorna subito;
+la clip diventa pronta quando il ring ha fornito anche il post-roll e viene restituita da ``pop_ready``,
+senza mai attendere nel loop di detection.
+"""
+
+import numpy as np
+
+from config import CLIP_PRE_ROLL_SEC, CLIP_POST_ROLL_SEC, WINDOW_SEC, HALF_WINDOW, MAX_CATCHUP_HOPS
+
+CHANNELS = 2
+
+
+class ClipExtractor:
+    """
+    Storia audio stereo float32 per frame assoluto del ring e clip in attesa di post-roll.
+    """
+
+    def __init__(self, sample_rate, pre_roll_sec=CLIP_PRE_ROLL_SEC, post_roll_sec=CLIP_POST_ROLL_SEC,
+                 history_sec=None):
+        """
+        Args:
+            sample_rate (int): Frequenza di campionamento (Hz)
+            pre_roll_sec, post_roll_sec (float): Audio prima e dopo il frame dell'evento (s)
+            history_sec (float): Audio conservato; None = quanto basta per un evento all'inizio
+                di una finestra elaborata in recupero (finestra + arretrato + pre/post-roll)
+        """
+        self.sample_rate = sample_rate
+        self.pre_roll = int(round(sample_rate * pre_roll_sec))
+        self.post_roll = int(round(sample_rate * post_roll_sec))
+        if history_sec is None:
+            history_sec = pre_roll_sec + post_roll_sec + WINDOW_SEC + HALF_WINDOW * (MAX_CATCHUP_HOPS + 1)
+        self.capacity = max(self.pre_roll + self.post_roll, int(sample_rate * history_sec))
+        # Doppia capacità: si compatta solo quando la coda raggiunge la fine del buffer
+        self._buf = np.zeros((2 * self.capacity, CHANNELS), dtype=np.float32)
+        self._head = 0           # indice in _buf del frame più vecchio conservato
+        self._len = 0
+        self._start_frame = None  # frame assoluto di _buf[_head]
+        self._pending = []        # (start, end, event_frame, meta) in ordine di richiesta
+        self._ready = []          # clip completate in anticipo (buco nel flusso prima del post-roll)
+
+        self.clips = 0
+        self.truncated = 0        # clip con pre-roll non più disponibile o buchi nel flusso
+
+    @property
+    def end_frame(self):
+        """Frame assoluto successivo all'ultimo frame ricevuto."""
+        return None if self._start_frame is None else self._start_frame + self._len
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def push(self, stereo, first_frame):
+        """
+        Aggiunge audio stereo (N, 2) che inizia al frame assoluto ``first_frame``.
+        Un buco nel flusso o un contatore ripartito azzera la storia.
+        """
+        n = len(stereo)
+        if n == 0:
+            return
+        if self._start_frame is None or first_frame != self.end_frame:
+            # Le clip in attesa non riceveranno più il loro post-roll: si chiudono con l'audio disponibile
+            if self._pending and self._start_frame is not None:
+                self._ready.extend(self._complete(force=True))
+            self._head = 0
+            self._len = 0
+            self._start_frame = first_frame
+        if n > self.capacity:
+            first_frame += n - self.capacity
+            stereo = stereo[-self.capacity:]
+            n = self.capacity
+            self._head, self._len, self._start_frame = 0, 0, first_frame
+        # Scarta il più vecchio oltre la capacità, poi compatta se la coda non entra
+        drop = max(0, self._len + n - self.capacity)
+        self._head += drop
+        self._len -= drop
+        self._start_frame += drop
+        if self._head + self._len + n > len(self._buf):
+            self._buf[:self._len] = self._buf[self._head:self._head + self._len]
+            self._head = 0
+        tail = self._head + self._len
+        self._buf[tail:tail + n] = stereo
+        self._len += n
+
+    def request(self, event_frame, **meta):
+        """
+        Registra una clip attorno a ``event_frame``; i metadati vengono restituiti con la clip.
+        """
+        self._pending.append((event_frame - self.pre_roll, event_frame + self.post_roll, event_frame, meta))
+
+    def _extract(self, start, end):
+        """Copia dei frame [start, end) ancora in storia (eventuale inizio mancante tagliato)."""
+        lo = max(start, self._start_frame)
+        hi = min(end, self.end_frame)
+        if hi <= lo:
+            return lo, np.zeros((0, CHANNELS), dtype=np.float32)
+        offset = self._head + lo - self._start_frame
+        return lo, self._buf[offset:offset + hi - lo].copy()
+
+    def pop_ready(self, force=False):
+        """
+        Clip il cui post-roll è già arrivato (tutte con ``force``, es. in chiusura, anche se incomplete).
+
+        Returns:
+            list: [(clip_start_frame, event_frame, left, right, meta), ...]
+        """
+        ready, self._ready = self._ready, []
+        if self._start_frame is not None:
+            ready.extend(self._complete(force))
+        return ready
+
+    def _complete(self, force):
+        ready, waiting = [], []
+        for start, end, event_frame, meta in self._pending:
+            if end > self.end_frame and not force:
+                waiting.append((start, end, event_frame, meta))
+                continue
+            clip_start, clip = self._extract(start, end)
+            if len(clip) < end - start:
+                self.truncated += 1
+            self.clips += 1
+            ready.append((clip_start, event_frame, clip[:, 0], clip[:, 1], meta))
+        self._pending = waiting
+        return ready
+
+    def stats(self):
+        return {
+            'clips': self.clips,
+            'truncated': self.truncated,
+            'pending': self.pending,
+        }
@@ -0,0 +1,188 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Event Store
+Archivio indicizzato delle detection in SQLite (journal WAL): un record per finestra valutata dal modello
+con score, trigger, direzione, angolo, latenza e percorso del WAV salvato (se presente).
+Sostituisce la scansione dei JSON per-evento in DETECTIONS_DIR / DETECTIONS_BELOW_THRESHOLD_DIR.
+
+Le scritture sono raggruppate: ``add`` accoda in memoria e ogni EVENT_STORE_BATCH eventi
+(o EVENT_STORE_FLUSH_SEC secondi) il blocco viene scritto in un'unica transazione dal BackgroundWriter.
+Le letture (``query_events``, dashboard) usano connessioni proprie: con WAL non bloccano le scritture.
+
+Uso da terminale:
+    python event_store.py [--since SEC] [--min-score S] [--direction D] [--limit N]
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from config import EVENT_DB_PATH, EVENT_STORE_BATCH, EVENT_STORE_FLUSH_SEC
+
+COLUMNS = (
+    "ts", "window", "start_frame", "stream", "score", "detected", "action",
+    "left_triggered", "right_triggered", "event_offset",
+    "direction", "angle", "tdoa_sec", "tdoa_confidence", "latency_ms", "audio_path",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    window TEXT,
+    start_frame INTEGER,
+    stream INTEGER,
+    score REAL,
+    detected INTEGER,
+    action TEXT,
+    left_triggered INTEGER,
+    right_triggered INTEGER,
+    event_offset INTEGER,
+    direction TEXT,
+    angle REAL,
+    tdoa_sec REAL,
+    tdoa_confidence REAL,
+    latency_ms REAL,
+    audio_path TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_score ON events (score);
+CREATE INDEX IF NOT EXISTS events_direction_ts ON events (direction, ts);
+"""
+
+
+def connect(db_path=EVENT_DB_PATH):
+    """Connessione in scrittura con journal WAL (crea lo schema se manca)."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Con WAL, NORMAL non perde la consistenza del database: al più le ultime transazioni in caso di crash
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class EventStore:
+    """
+    Accoda gli eventi e li scrive a blocchi tramite un BackgroundWriter
+    (la connessione SQLite vive nel thread del writer).
+    """
+
+    def __init__(self, writer, db_path=EVENT_DB_PATH, batch_size=EVENT_STORE_BATCH,
+                 flush_sec=EVENT_STORE_FLUSH_SEC):
+        self.writer = writer
+        self.db_path = db_path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_sec = flush_sec
+        self.stored = 0
+        self._conn = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, **event):
+        """
+        Accoda un evento (colonne di COLUMNS; quelle mancanti restano NULL).
+        Il blocco viene inviato al writer quando raggiunge ``batch_size`` o dopo ``flush_sec``.
+        """
+        row = tuple(event.get(column) for column in COLUMNS)
+        with self._lock:
+            self._pending.append(row)
+        self.flush(force=False)
+
+    def flush(self, force=True):
+        """
+        Invia al writer gli eventi accodati (mai scartati).
+        Con ``force=False`` solo se il blocco è pieno o sono passati ``flush_sec`` secondi
+        (da chiamare periodicamente perché gli eventi rari non restino in memoria).
+        """
+        with self._lock:
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_sec)
+            if not (force or due):
+                return
+            rows, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if rows:
+            self.writer.submit(self._write_batch, rows, droppable=False)
+
+    def _write_batch(self, rows):
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        self.stored += len(rows)
+
+    def close(self):
+        """Invia gli ultimi eventi e chiude la connessione nel thread del writer."""
+        self.flush()
+        self.writer.submit(self._close_connection, droppable=False)
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def query_events(db_path=EVENT_DB_PATH, start=None, end=None, min_score=None, max_score=None,
+                 direction=None, detected=None, limit=1000):
+    """
+    Eventi filtrati per intervallo di tempo, score e direzione, dal più recente.
+
+    Args:
+        db_path (str): Database degli eventi
+        start, end (float): Intervallo di tempo (epoch, secondi), estremi inclusi
+        min_score, max_score (float): Intervallo di score
+        direction (str): 'sinistra', 'destra' o 'centro'
+        detected (bool): Solo detection sopra (True) o sotto (False) DETECTION_THRESHOLD
+        limit (int): Numero massimo di eventi
+
+    Returns:
+        list: un dizionario per evento (colonne di COLUMNS più 'id')
+    """
+    conditions, params = [], []
+    for clause, value in (("ts >= ?", start), ("ts <= ?", end), ("score >= ?", min_score),
+                          ("score <= ?", max_score), ("direction = ?", direction),
+                          ("detected = ?", None if detected is None else int(detected))):
+        if value is not None:
+            conditions.append(clause)
+            params.append(value)
+    sql = f"SELECT id, {', '.join(COLUMNS)} FROM events"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY ts DESC LIMIT ?"
+    params.append(int(limit))
+
+    # Sola lettura: non crea il database e non blocca il detector
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interroga l'archivio delle detection")
+    parser.add_argument("--db", default=EVENT_DB_PATH, help="Database degli eventi")
+    parser.add_argument("--since", type=float, help="Solo eventi degli ultimi SEC secondi")
+    parser.add_argument("--min-score", type=float, help="Score minimo")
+    parser.add_argument("--direction", choices=("sinistra", "destra", "centro"), help="Direzione")
+    parser.add_argument("--limit", type=int, default=50, help="Numero massimo di eventi")
+    args = parser.parse_args()
+
+    start = time.time() - args.since if args.since is not None else None
+    for event in query_events(args.db, start=start, min_score=args.min_score,
+                              direction=args.direction, limit=args.limit):
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event['ts']))
+        score = "-" if event['score'] is None else f"{event['score']:.2f}"
+        angle = "" if event['angle'] is None else f" {event['angle']:+.1f}°"
+        print(f"{when}  score={score}  action={event['action']}  "
+              f"dir={event['direction'] or '-'}{angle}  audio={event['audio_path'] or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,17 +7,76 @@ Gestisce la logica di TDOA e detection in base ai trigger attivati.
 """
 
 import numpy as np
+import scipy.fft
 import logging
+from functools import lru_cache
 
-from scipy.signal import butter, filtfilt
+from scipy.signal import butter, sosfiltfilt
 
 from config import (
     PROMINENCE_BAND_MIN_HZ, PROMINENCE_BAND_MAX_HZ, PROMINENCE_THRESHOLD_DB,
+    NOISE_FLOOR_THRESHOLD_DB, NOISE_FLOOR_SUBBANDS, NOISE_FLOOR_ALPHA,
+    NOISE_FLOOR_ALPHA_TRIGGERED, NOISE_FLOOR_WARMUP, TRIGGER_SUBFRAME_SEC,
     MIN_FREQ, MAX_FREQ, SPEED_OF_SOUND, MICROPHONE_DISTANCE,
     HIGH_PASS_CUTOFF_HZ, INVERT_PHASE, TDOA_CENTER_THRESHOLD_SEC,
-    TDOA_METHOD, TDOA_FIRST_ARRIVAL_THRESHOLD
+    TDOA_METHOD, TDOA_FIRST_ARRIVAL_THRESHOLD, TDOA_MODE, TDOA_FRAME_SEC, TDOA_FRAME_HOP_SEC,
+    TDOA_CONFIDENCE_TOLERANCE, TDOA_SUBSAMPLE
 )
 
+class NoiseFloor:
+    """
+    Profilo del rumore di fondo di un canale: livello di picco (dB) per sottobanda,
+    mediato esponenzialmente tra le finestre. Le finestre triggerate aggiornano il profilo
+    solo con ``alpha_triggered``, così gli eventi non vengono appresi come rumore ma un rumore
+    persistente (barca, gamberi) viene comunque assorbito.
+    """
+
+    def __init__(self, n_subbands=NOISE_FLOOR_SUBBANDS, alpha=NOISE_FLOOR_ALPHA,
+                 alpha_triggered=NOISE_FLOOR_ALPHA_TRIGGERED, warmup=NOISE_FLOOR_WARMUP):
+        self.n_subbands = max(1, int(n_subbands))
+        self.alpha = alpha
+        self.alpha_triggered = alpha_triggered
+        self.warmup = warmup
+        self.profile = None
+        self.updates = 0
+        self._n_bins = None
+        self._edges = None
+
+    @property
+    def ready(self):
+        return self.profile is not None and self.updates >= self.warmup
+
+    def levels(self, band_db):
+        """Livello di picco (dB) di ogni sottobanda dello spettro di banda ``band_db``."""
+        m = len(band_db)
+        if m != self._n_bins:
+            # Nuova lunghezza della banda: il profilo precedente non è confrontabile
+            self._n_bins = m
+            self._edges = np.linspace(0, m, min(self.n_subbands, m) + 1).astype(np.intp)[:-1]
+            self.profile = None
+            self.updates = 0
+        return np.maximum.reduceat(band_db, self._edges)
+
+    def prominence(self, levels):
+        """Massimo scarto (dB) delle sottobande sopra il profilo, None durante il warm-up."""
+        if not self.ready:
+            return None
+        return float(np.max(levels - self.profile))
+
+    def update(self, levels, triggered):
+        if self.profile is None:
+            self.profile = levels.astype(np.float64)
+            self.updates = 1
+            return
+        if self.ready:
+            alpha = self.alpha_triggered if triggered else self.alpha
+        else:
+            # Warm-up: media cumulativa, converge in poche finestre
+            alpha = max(self.alpha, 1.0 / (self.updates + 1))
+        self.profile += alpha * (levels - self.profile)
+        self.updates += 1
+
+
 class PowerTrigger:
     """
     Classe per gestire il power trigger su due canali audio.
@@ -25,19 +84,29 @@ class PowerTrigger:
 
     def __init__(self, sample_rate, prominence_threshold_db=PROMINENCE_THRESHOLD_DB,
                  band_min_hz=PROMINENCE_BAND_MIN_HZ, band_max_hz=PROMINENCE_BAND_MAX_HZ,
-                 log_file_path=None):
+                 log_file_path=None, noise_floor_threshold_db=NOISE_FLOOR_THRESHOLD_DB,
+                 subframe_sec=TRIGGER_SUBFRAME_SEC):
         """
         Inizializza il Power Trigger.
 
         Args:
             sample_rate (int): Frequenza di campionamento (Hz)
             log_file_path (str): Percorso del file di log
+            noise_floor_threshold_db (float): Scarto minimo sopra il rumore di fondo appreso
+                per canale (None = solo prominenza sulla mediana della finestra)
+            subframe_sec (float): Durata dei sotto-frame usati per localizzare l'evento
         """
         self.sample_rate = sample_rate
         self.prominence_threshold_db = prominence_threshold_db
+        self.noise_floor_threshold_db = noise_floor_threshold_db
+        self.subframe_len = max(1, int(round(subframe_sec * sample_rate)))
         self.band_min_hz = band_min_hz
         self.band_max_hz = band_max_hz
         self.log_file_path = log_file_path
+        # Finestra e banda in cache per lunghezza del segnale (vedi _band_plan)
+        self._plans = {}
+        # Rumore di fondo appreso, per nome del canale
+        self.noise_floors = {}
 
         # Setup logging
         if log_file_path:
@@ -55,32 +124,163 @@ class PowerTrigger:
         logger.setLevel(logging.INFO)
         return logger
 
+    def _band_plan(self, n):
+        """
+        Finestra di Hann e indici della banda per segnali di lunghezza ``n``,
+        calcolati una sola volta per lunghezza (le finestre del detector hanno sempre la stessa).
+        """
+        plan = self._plans.get(n)
+        if plan is None:
+            freqs = np.fft.rfftfreq(n, 1 / self.sample_rate)
+            # La maschera [band_min_hz, band_max_hz] su frequenze crescenti è un intervallo contiguo
+            lo = int(np.searchsorted(freqs, self.band_min_hz, side='left'))
+            hi = int(np.searchsorted(freqs, self.band_max_hz, side='right'))
+            plan = (np.hanning(n).astype(np.float32), lo, hi, freqs[lo:hi])
+            self._plans[n] = plan
+        return plan
+
+    def _band_spectrum_db(self, signals):
+        """
+        Spettro di ampiezza (dB) nella banda per più canali della stessa lunghezza,
+        con una sola rfft 2-D.
+
+        Returns:
+            tuple: (array (n_canali, n_bin) float32, frequenze dei bin) o (None, None) se la banda è vuota
+        """
+        n = len(signals[0])
+        if n == 0:
+            return None, None
+        window, lo, hi, band_freqs = self._band_plan(n)
+        if hi <= lo:
+            return None, None
+
+        sigw = np.empty((len(signals), n), dtype=np.float32)
+        for i, signal in enumerate(signals):
+            np.multiply(signal, window, out=sigw[i])
+        spec = scipy.fft.rfft(sigw, axis=1, overwrite_x=True)[:, lo:hi]
+        band_mag_db = np.abs(spec)
+        band_mag_db += 1e-12
+        np.log10(band_mag_db, out=band_mag_db)
+        band_mag_db *= 20
+        return band_mag_db, band_freqs
+
+    @staticmethod
+    def _prominence(band_mag_db, band_freqs):
+        """Prominenza del picco sulla mediana della banda, per riga di ``band_mag_db``."""
+        # Mediana per selezione (np.partition) invece dell'ordinamento completo di np.median
+        m = band_mag_db.shape[1]
+        half = m // 2
+        if m % 2:
+            median_db = np.partition(band_mag_db, half, axis=1)[:, half]
+        else:
+            part = np.partition(band_mag_db, (half - 1, half), axis=1)
+            median_db = 0.5 * (part[:, half - 1] + part[:, half])
+        max_idx = np.argmax(band_mag_db, axis=1)
+        rows = np.arange(len(band_mag_db))
+        prom_db = band_mag_db[rows, max_idx] - median_db
+        return [(float(prom_db[i]), float(band_freqs[max_idx[i]])) for i in rows]
+
+    def compute_band_prominence(self, signals):
+        """
+        Prominenza del picco spettrale (dB) nella banda per più canali della stessa lunghezza,
+        con una sola rfft 2-D.
+
+        Args:
+            signals (numpy.ndarray): Array (n_canali, n) o lista di canali di uguale lunghezza
+
+        Returns:
+            list: [(prominence_db, peak_freq_hz), ...] un elemento per canale
+        """
+        band_mag_db, band_freqs = self._band_spectrum_db(signals)
+        if band_mag_db is None:
+            return [(-np.inf, 0.0)] * len(signals)
+        return self._prominence(band_mag_db, band_freqs)
+
     def compute_spectral_prominence(self, signal):
         """
         Calcola la prominenza del picco spettrale (dB) nella banda [band_min_hz, band_max_hz].
         Ritorna (prominence_db, peak_freq_hz).
         """
-        n = len(signal)
-        if n == 0:
-            return -np.inf, 0.0
-        window = np.hanning(n)
-        sigw = signal * window
-        spec = np.fft.rfft(sigw)
-        mag = np.abs(spec)
-        mag_db = 20 * np.log10(mag + 1e-12)
-        freqs = np.fft.rfftfreq(n, 1 / self.sample_rate)
-        mask = (freqs >= self.band_min_hz) & (freqs <= self.band_max_hz)
-        if not np.any(mask):
-            return -np.inf, 0.0
-        band_mag_db = mag_db[mask]
-        band_freqs = freqs[mask]
-        if band_mag_db.size == 0:
-            return -np.inf, 0.0
-        median_db = np.median(band_mag_db)
-        max_idx = int(np.argmax(band_mag_db))
-        prom_db = float(band_mag_db[max_idx] - median_db)
-        peak_freq = float(band_freqs[max_idx])
-        return prom_db, peak_freq
+        return self.compute_band_prominence([signal])[0]
+
+    def _evaluate(self, signals, channel_names):
+        """
+        Trigger di più canali della stessa lunghezza: prominenza sulla mediana della finestra
+        e, se attivo, scarto sopra il rumore di fondo appreso per ciascun canale.
+        """
+        band_mag_db, band_freqs = self._band_spectrum_db(signals)
+        if band_mag_db is None:
+            return [self._trigger_info(-np.inf, 0.0, name) for name in channel_names]
+        infos = []
+        for (prom, peak), band_db, name in zip(self._prominence(band_mag_db, band_freqs),
+                                               band_mag_db, channel_names):
+            infos.append(self._trigger_info(prom, peak, name, band_db))
+        return infos
+
+    def _trigger_info(self, prominence_db, peak_freq, channel_name, band_db=None):
+        triggered = prominence_db >= self.prominence_threshold_db
+        floor_db = None
+        if self.noise_floor_threshold_db is not None and band_db is not None:
+            noise_floor = self.noise_floors.get(channel_name)
+            if noise_floor is None:
+                noise_floor = self.noise_floors[channel_name] = NoiseFloor()
+            levels = noise_floor.levels(band_db)
+            floor_db = noise_floor.prominence(levels)
+            if floor_db is not None:
+                triggered = triggered and floor_db >= self.noise_floor_threshold_db
+            noise_floor.update(levels, triggered)
+        if self.logger:
+            floor_str = "warm-up" if floor_db is None else f"{floor_db:.2f}dB"
+            self.logger.info(
+                f"[{channel_name}] PeakFreq: {peak_freq:.2f}Hz, Prom: {prominence_db:.2f}dB, "
+                f"Floor: {floor_str}, Triggered: {triggered}"
+            )
+        return {
+            'triggered': triggered,
+            'prominence_db': prominence_db,
+            'peak_freq': peak_freq,
+            'floor_prominence_db': floor_db
+        }
+
+    def _subframe_power(self, signals):
+        """Potenza di banda (lineare) di ogni sotto-frame: array (n_canali, n_frame), una sola rfft."""
+        frame_len = self.subframe_len
+        n_frames = len(signals[0]) // frame_len
+        window, lo, hi, _ = self._band_plan(frame_len)
+        if n_frames == 0 or hi <= lo:
+            return np.empty((len(signals), 0), dtype=np.float32)
+        frames = np.empty((len(signals), n_frames, frame_len), dtype=np.float32)
+        for i, signal in enumerate(signals):
+            np.multiply(np.reshape(signal[:n_frames * frame_len], (n_frames, frame_len)), window, out=frames[i])
+        spec = scipy.fft.rfft(frames, axis=-1, overwrite_x=True)[..., lo:hi]
+        power = spec.real ** 2
+        power += spec.imag ** 2
+        return power.sum(axis=-1)
+
+    def subframe_energy_db(self, signals):
+        """
+        Energia nella banda [band_min_hz, band_max_hz] (dB) di ogni sotto-frame, per canale.
+
+        Args:
+            signals (list): Canali di uguale lunghezza
+
+        Returns:
+            numpy.ndarray: Array (n_canali, n_frame) (n_frame = 0 se il segnale è più corto di un frame)
+        """
+        return 10 * np.log10(self._subframe_power(signals) + 1e-12)
+
+    def locate_event(self, signals):
+        """
+        Posizione dell'evento nella finestra: centro del sotto-frame con la massima energia di banda
+        (somma sui canali dati).
+
+        Returns:
+            int: Offset in campioni dall'inizio della finestra, None se la finestra è più corta di un frame
+        """
+        power = self._subframe_power(signals)
+        if power.shape[1] == 0:
+            return None
+        return int(np.argmax(power.sum(axis=0))) * self.subframe_len + self.subframe_len // 2
 
     def check_trigger(self, signal, channel_name=""):
         """
@@ -95,20 +295,11 @@ class PowerTrigger:
                 {
                     'triggered': bool,
                     'prominence_db': float,
-                    'peak_freq': float
+                    'peak_freq': float,
+                    'floor_prominence_db': float (None durante il warm-up o se disattivato)
                 }
         """
-        prominence_db, peak_freq = self.compute_spectral_prominence(signal)
-        triggered = prominence_db >= self.prominence_threshold_db
-        if self.logger:
-            self.logger.info(
-                f"[{channel_name}] PeakFreq: {peak_freq:.2f}Hz, Prom: {prominence_db:.2f}dB, Triggered: {triggered}"
-            )
-        return {
-            'triggered': triggered,
-            'prominence_db': prominence_db,
-            'peak_freq': peak_freq
-        }
+        return self._evaluate([signal], [channel_name])[0]
 
     def process_stereo_buffer(self, left_channel, right_channel):
         """
@@ -126,12 +317,16 @@ class PowerTrigger:
                     'left_info': dict,
                     'right_info': dict,
                     'action': str ('tdoa', 'left_only', 'right_only', 'none'),
-                    'channel_to_analyze': str ('left', 'right', 'both', 'none')
+                    'channel_to_analyze': str ('left', 'right', 'both', 'none'),
+                    'event_offset': int (campione centrale dell'evento, None se nessun trigger)
                 }
         """
-        # Verifica i trigger su entrambi i canali
-        left_info = self.check_trigger(left_channel, "LEFT")
-        right_info = self.check_trigger(right_channel, "RIGHT")
+        # Verifica i trigger su entrambi i canali (una sola rfft 2-D se hanno la stessa lunghezza)
+        if len(left_channel) == len(right_channel):
+            left_info, right_info = self._evaluate([left_channel, right_channel], ["LEFT", "RIGHT"])
+        else:
+            left_info = self.check_trigger(left_channel, "LEFT")
+            right_info = self.check_trigger(right_channel, "RIGHT")
         
         left_triggered = left_info['triggered']
         right_triggered = right_info['triggered']
@@ -157,6 +352,14 @@ class PowerTrigger:
             channel_to_analyze = 'none'
             if self.logger:
                 self.logger.info("No triggers activated -> Skipping detection")
+
+        # Localizza l'evento solo sui canali triggerati (e solo se serve)
+        event_offset = None
+        triggered_channels = [c for c, t in ((left_channel, left_triggered), (right_channel, right_triggered)) if t]
+        if triggered_channels and len(set(len(c) for c in triggered_channels)) == 1:
+            event_offset = self.locate_event(triggered_channels)
+            if self.logger and event_offset is not None:
+                self.logger.info(f"Event offset: {event_offset} samples ({event_offset / self.sample_rate:.3f}s)")
         
         return {
             'left_triggered': left_triggered,
@@ -164,141 +367,285 @@ class PowerTrigger:
             'left_info': left_info,
             'right_info': right_info,
             'action': action,
-            'channel_to_analyze': channel_to_analyze
+            'channel_to_analyze': channel_to_analyze,
+            'event_offset': event_offset
         }
 
 
-def _apply_highpass_filter(signal, sample_rate, cutoff_hz):
+def event_slice(length, event_offset, n):
     """
-    Applica un filtro high-pass Butterworth al segnale.
-    In caso di errore (es. frequenza di taglio troppo alta), ritorna il segnale originale.
-    
-    Args:
-        signal: Segnale audio mono
-        sample_rate: Frequenza di campionamento (Hz)
-        cutoff_hz: Frequenza di taglio del filtro (Hz)
-    
+    Intervallo di ``n`` campioni centrato sull'evento e contenuto in un buffer di ``length`` campioni.
+    Senza evento (None) ritorna gli ultimi ``n`` campioni.
+
     Returns:
-        Segnale filtrato (o originale in caso di errore)
+        slice: da applicare al buffer
     """
-    nyquist = 0.5 * sample_rate
-    # Verifica che la frequenza di taglio sia valida
-    if cutoff_hz >= nyquist or cutoff_hz <= 0:
-        return signal
-    try:
-        normal_cutoff = cutoff_hz / nyquist
-        b, a = butter(4, normal_cutoff, btype='high', analog=False)
-        return filtfilt(b, a, signal)
-    except ValueError:
-        # Se filtfilt fallisce (segnale troppo corto, ecc.), ritorna l'originale
-        return signal
-
-
-def _cross_spectrum_gcc_phat(left_channel, right_channel, sample_rate, max_tdoa_samples):
+    n = min(n, length)
+    if event_offset is None:
+        return slice(length - n, length)
+    start = min(max(0, int(event_offset) - n // 2), length - n)
+    return slice(start, start + n)
+
+
+class TdoaEngine:
     """
-    Calcola TDOA usando GCC-PHAT (Generalized Cross-Correlation with Phase Transform).
-    Applica windowing per ridurre spectral leakage.
-    Supporta due metodi di ricerca del delay:
-    - "max_peak": Trova il picco massimo assoluto (metodo standard)
-    - "first_arrival": Trova il primo picco significativo (robusto alle riflessioni)
-    
-    Args:
-        left_channel: Segnale canale sinistro (già filtrato)
-        right_channel: Segnale canale destro (già filtrato)
-        sample_rate: Frequenza di campionamento (Hz)
-        max_tdoa_samples: Massimo ritardo in campioni
-    
-    Returns:
-        TDOA in secondi
+    GCC-PHAT riutilizzabile per una frequenza di campionamento: filtro high-pass (SOS) progettato
+    una sola volta, finestra, dimensione FFT e banda in cache per lunghezza del segnale,
+    elaborazione in float32 e ricerca del primo arrivo vettorizzata.
+    ``compute`` valuta un'unica slice, ``compute_frames`` molti frame brevi con una sola FFT 2-D.
     """
-    n_samples = len(left_channel)
-    
-    # Applica finestra di Hanning per ridurre spectral leakage
-    window = np.hanning(n_samples)
-    left_windowed = left_channel * window
-    right_windowed = right_channel * window
-    
-    # FFT con padding a potenza di 2
-    n_fft = 2 ** int(np.ceil(np.log2(2 * n_samples)))
-    
-    SIG1 = np.fft.rfft(left_windowed, n=n_fft)
-    SIG2 = np.fft.rfft(right_windowed, n=n_fft)
-    
-    # Filtro frequenziale per eliminare rumori fuori banda
-    freqs = np.fft.rfftfreq(n_fft, d=1/sample_rate)
-    band_mask = (freqs >= MIN_FREQ) & (freqs <= MAX_FREQ)
-    SIG1[~band_mask] = 0
-    SIG2[~band_mask] = 0
-    
-    # Cross-spettro con normalizzazione GCC-PHAT
-    R = SIG1 * np.conj(SIG2)
-    R /= (np.abs(R) + 1e-10)  # Phase transform
-    
-    # Correlazione inversa nel dominio del tempo
-    cc = np.fft.irfft(R, n_fft)
-    cc = np.fft.fftshift(cc)
-    
-    # Limita la correlazione al massimo TDOA fisicamente possibile
-    center = len(cc) // 2
-    cc_limited = cc[center - max_tdoa_samples : center + max_tdoa_samples]
-    
-    # Seleziona metodo di ricerca del delay in base a configurazione
-    if TDOA_METHOD == "first_arrival":
-        # FIRST-ARRIVAL DETECTION: cerca il primo picco significativo
-        # Robusto alle riflessioni in ambienti riverberanti
-        
-        max_peak = np.max(np.abs(cc_limited))
-        threshold = TDOA_FIRST_ARRIVAL_THRESHOLD * max_peak
-        
-        # Cerca primo picco a sinistra del centro (sorgente a destra)
-        delay_right = None
-        peak_right = -np.inf
-        for i in range(max_tdoa_samples - 1, -1, -1):  # Dalla fine verso centro
-            if cc_limited[i] > threshold:
-                delay_right = max_tdoa_samples - i
-                peak_right = cc_limited[i]
-                break
-        
-        # Cerca primo picco a destra del centro (sorgente a sinistra)
-        delay_left = None
-        peak_left = -np.inf
-        for i in range(max_tdoa_samples, len(cc_limited)):  # Dal centro verso fine
-            if cc_limited[i] > threshold:
-                delay_left = i - max_tdoa_samples
-                peak_left = cc_limited[i]
-                break
-        
-        # Scegli il delay col picco più forte tra i due first-arrival
-        if delay_left is not None and delay_right is not None:
-            if peak_left > peak_right:
-                delay = delay_left
-            else:
-                delay = -delay_right
-        elif delay_left is not None:
-            delay = delay_left
-        elif delay_right is not None:
-            delay = -delay_right
-        else:
-            # Fallback: se non trova nessun picco sopra soglia, usa max_peak
-            delay = np.argmax(cc_limited) - max_tdoa_samples
-    
-    else:  # TDOA_METHOD == "max_peak" (default/standard)
-        # MAX PEAK DETECTION: trova il picco massimo assoluto
-        # Metodo standard, può essere influenzato da riflessioni
-        delay = np.argmax(cc_limited) - max_tdoa_samples
-    
-    return delay / sample_rate
 
+    def __init__(self, sample_rate, cutoff_hz=HIGH_PASS_CUTOFF_HZ, method=TDOA_METHOD,
+                 first_arrival_threshold=TDOA_FIRST_ARRIVAL_THRESHOLD,
+                 frame_sec=TDOA_FRAME_SEC, frame_hop_sec=TDOA_FRAME_HOP_SEC,
+                 confidence_tolerance=TDOA_CONFIDENCE_TOLERANCE, subsample=TDOA_SUBSAMPLE):
+        self.sample_rate = sample_rate
+        self.method = method
+        self.first_arrival_threshold = first_arrival_threshold
+        self.frame_len = max(1, int(round(frame_sec * sample_rate)))
+        self.frame_hop = max(1, int(round(frame_hop_sec * sample_rate)))
+        self.confidence_tolerance = confidence_tolerance
+        self.subsample = subsample
+        # Massimo TDOA teorico in campioni
+        self.max_tdoa_samples = int((MICROPHONE_DISTANCE / SPEED_OF_SOUND) * sample_rate) + 1
+        nyquist = 0.5 * sample_rate
+        # Frequenza di taglio non valida: nessun filtro
+        self.sos = None
+        if 0 < cutoff_hz < nyquist:
+            self.sos = butter(4, cutoff_hz / nyquist, btype='high', output='sos').astype(np.float32)
+        self._plans = {}
+
+    def _plan(self, n):
+        """Finestra di Hann, dimensione FFT (potenza di 2 >= 2n, almeno la correlazione limitata) e bin della banda [MIN_FREQ, MAX_FREQ]."""
+        plan = self._plans.get(n)
+        if plan is None:
+            n_fft = 2 ** int(np.ceil(np.log2(2 * max(n, self.max_tdoa_samples))))
+            freqs = np.fft.rfftfreq(n_fft, d=1 / self.sample_rate)
+            lo = int(np.searchsorted(freqs, MIN_FREQ, side='left'))
+            hi = int(np.searchsorted(freqs, MAX_FREQ, side='right'))
+            plan = (np.hanning(n).astype(np.float32), n_fft, lo, hi)
+            self._plans[n] = plan
+        return plan
+
+    def highpass(self, signals):
+        """
+        Filtro high-pass a fase zero (sosfiltfilt) lungo l'ultimo asse.
+        Se il segnale è troppo corto per il filtro ritorna l'originale.
+        """
+        if self.sos is None:
+            return signals
+        try:
+            return sosfiltfilt(self.sos, signals, axis=-1)
+        except ValueError:
+            return signals
+
+    def gcc_phat(self, left, right):
+        """
+        Correlazione GCC-PHAT limitata a ±max_tdoa_samples, lungo l'ultimo asse
+        (``left``/``right`` possono essere array (n_frame, n): una sola rfft per tutti i frame).
+
+        Returns:
+            numpy.ndarray: (..., 2 * max_tdoa_samples) float32, ritardo -max_tdoa_samples all'indice 0
+        """
+        n = left.shape[-1]
+        window, n_fft, lo, hi = self._plan(n)
+        # Una sola rfft per entrambi i canali (finestra di Hann contro lo spectral leakage)
+        spec = scipy.fft.rfft(np.stack((left, right)) * window, n=n_fft, axis=-1)
+        # Cross-spettro con normalizzazione GCC-PHAT, solo nella banda (fuori banda resta zero)
+        R = np.zeros(spec.shape[1:-1] + (n_fft // 2 + 1,), dtype=np.complex64)
+        band = spec[0, ..., lo:hi] * np.conj(spec[1, ..., lo:hi])
+        band /= np.abs(band) + 1e-10  # Phase transform
+        R[..., lo:hi] = band
+        cc = scipy.fft.irfft(R, n_fft, axis=-1)
+        m = self.max_tdoa_samples
+        # Equivale a fftshift(cc)[centro - m : centro + m]
+        return np.concatenate((cc[..., -m:], cc[..., :m]), axis=-1)
+
+    def find_delays(self, cc_limited):
+        """
+        Ritardo (campioni) di ogni riga della correlazione limitata (n_frame, 2m) secondo ``method``.
+
+        Returns:
+            numpy.ndarray: un ritardo intero per riga
+        """
+        m = self.max_tdoa_samples
+        peak_delays = np.argmax(cc_limited, axis=-1) - m
+        if self.method != "first_arrival":
+            # MAX PEAK DETECTION: picco massimo assoluto
+            return peak_delays
+
+        # FIRST-ARRIVAL DETECTION: primo picco sopra soglia su ciascun lato del centro,
+        # robusto alle riflessioni in ambienti riverberanti
+        threshold = self.first_arrival_threshold * np.max(np.abs(cc_limited), axis=-1, keepdims=True)
+        above = cc_limited > threshold
+        rows = np.arange(len(cc_limited))
+        # Sorgente a destra: primo indice sopra soglia procedendo dal centro verso sinistra
+        has_right = above[:, :m].any(axis=-1)
+        i_right = m - 1 - np.argmax(above[:, m - 1::-1], axis=-1)
+        # Sorgente a sinistra: primo indice sopra soglia procedendo dal centro verso destra
+        has_left = above[:, m:].any(axis=-1)
+        i_left = m + np.argmax(above[:, m:], axis=-1)
+        # Con entrambi i first-arrival si sceglie il picco più forte;
+        # fallback: nessun picco sopra soglia, usa max_peak
+        use_left = has_left & (~has_right | (cc_limited[rows, i_left] > cc_limited[rows, i_right]))
+        use_right = has_right & ~use_left
+        return np.where(use_left, i_left - m, np.where(use_right, i_right - m, peak_delays))
+
+    def find_delay(self, cc_limited):
+        """Ritardo (campioni, frazionario se ``subsample``) di una singola correlazione limitata."""
+        cc_limited = cc_limited[np.newaxis]
+        return float(self.refine_delays(cc_limited, self.find_delays(cc_limited))[0])
+
+    def refine_delays(self, cc_limited, delays, max_climb=2):
+        """
+        Ritardi frazionari per interpolazione parabolica sul picco e i due campioni adiacenti
+        (nessun sovracampionamento). Un indice sul fronte di salita del lobo (tipico del
+        first-arrival, primo campione sopra soglia) viene prima spostato sul massimo locale del lobo,
+        al più di ``max_climb`` campioni. Il ritardo resta intero se ``subsample`` è disattivato
+        o se il picco è al bordo della correlazione limitata.
+
+        Returns:
+            numpy.ndarray: un ritardo float per riga
+        """
+        if not self.subsample:
+            return delays.astype(np.float64)
+        m = self.max_tdoa_samples
+        last = cc_limited.shape[-1] - 1
+        rows = np.arange(len(cc_limited))
+        i = delays.astype(np.intp) + m
+        for _ in range(max_climb):
+            left = cc_limited[rows, np.maximum(i - 1, 0)]
+            right = cc_limited[rows, np.minimum(i + 1, last)]
+            here = cc_limited[rows, i]
+            i = np.where((right > here) & (right >= left), np.minimum(i + 1, last),
+                         np.where(left > here, np.maximum(i - 1, 0), i))
+        inner = (i > 0) & (i < last)
+        j = np.clip(i, 1, last - 1)
+        y0 = cc_limited[rows, j - 1]
+        y1 = cc_limited[rows, j]
+        y2 = cc_limited[rows, j + 1]
+        curvature = y0 - 2 * y1 + y2
+        valid = inner & (y1 >= y0) & (y1 >= y2) & (curvature < 0)
+        offset = np.zeros(len(delays))
+        np.divide(0.5 * (y0 - y2), curvature, out=offset, where=valid)
+        return np.where(valid, i - m + np.clip(offset, -0.5, 0.5), delays)
 
-def compute_tdoa_direct(left_channel, right_channel, sample_rate):
+    def _prepare(self, left_channel, right_channel):
+        """Canali in float32 (inversione di fase se configurata) filtrati high-pass in una sola chiamata."""
+        signals = np.empty((2, len(left_channel)), dtype=np.float32)
+        signals[0] = left_channel
+        signals[1] = right_channel
+        # Gestione inversione di fase (se configurata)
+        if INVERT_PHASE:
+            signals[1] *= -1
+        return self.highpass(signals)
+
+    def compute(self, left_channel, right_channel):
+        """
+        TDOA, angolo e direzione di una coppia di buffer della stessa lunghezza.
+        Stesso formato di ritorno di compute_tdoa_direct.
+        """
+        try:
+            left, right = self._prepare(left_channel, right_channel)
+            tdoa = self.find_delay(self.gcc_phat(left, right)) / self.sample_rate
+            return _tdoa_result(tdoa)
+        except Exception as e:
+            return _tdoa_error(e)
+
+    def compute_frames(self, left_channel, right_channel):
+        """
+        TDOA robusto su più frame: il buffer è diviso in frame di ``frame_len`` campioni
+        (hop ``frame_hop``), tutti valutati con una sola FFT 2-D. I ritardi dei frame sono
+        aggregati con una mediana pesata dall'altezza del picco GCC-PHAT (coerenza del frame).
+        Se il buffer è più corto di un frame si usa ``compute``.
+
+        Returns:
+            dict: come compute, più 'confidence' (frazione del peso dei frame entro
+                ``confidence_tolerance`` campioni dal ritardo scelto) e 'n_frames'
+        """
+        if len(left_channel) < self.frame_len:
+            return self.compute(left_channel, right_channel)
+        try:
+            signals = self._prepare(left_channel, right_channel)
+            # Vista (2, n_frame, frame_len) senza copia; la finestra di Hann in gcc_phat crea i frame
+            frames = np.lib.stride_tricks.sliding_window_view(signals, self.frame_len, axis=-1)[:, ::self.frame_hop]
+            cc = self.gcc_phat(frames[0], frames[1])
+            peaks = self.find_delays(cc)
+            weights = np.maximum(cc[np.arange(len(cc)), peaks + self.max_tdoa_samples], 0)
+            if weights.sum() <= 0:
+                weights = np.ones(len(peaks), dtype=np.float32)
+            delays = self.refine_delays(cc, peaks)
+            delay = _weighted_median(delays, weights)
+            agree = np.abs(delays - delay) <= self.confidence_tolerance
+            result = _tdoa_result(delay / self.sample_rate)
+            result['confidence'] = round(float(weights[agree].sum() / weights.sum()), 3)
+            result['n_frames'] = len(delays)
+            return result
+        except Exception as e:
+            return _tdoa_error(e)
+
+
+@lru_cache(maxsize=None)
+def get_tdoa_engine(sample_rate):
+    """TdoaEngine condiviso per frequenza di campionamento."""
+    return TdoaEngine(sample_rate)
+
+
+def _weighted_median(values, weights):
+    """Mediana pesata: primo valore (in ordine crescente) che raggiunge metà del peso totale."""
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    return float(values[order][np.searchsorted(cumulative, 0.5 * cumulative[-1])])
+
+
+def _tdoa_error(e):
+    return {
+        'success': False,
+        'direction': 'unknown',
+        'angle': 0.0,
+        'tdoa_sec': 0.0,
+        'error': str(e)
+    }
+
+
+def _tdoa_result(tdoa):
+    """Angolo (con protezione overflow dell'arcsin) e direzione da un TDOA in secondi."""
+    sin_arg = (tdoa * SPEED_OF_SOUND) / MICROPHONE_DISTANCE
+    sin_arg_clamped = np.clip(sin_arg, -1.0, 1.0)  # Previene domain error
+    angle_rad = np.arcsin(sin_arg_clamped)
+    angle_deg = float(np.degrees(angle_rad))
+
+    # Determina la direzione
+    if abs(tdoa) < TDOA_CENTER_THRESHOLD_SEC:
+        direction = 'centro'
+        angle_deg = 0.0
+    elif tdoa > 0:
+        direction = 'sinistra'
+        angle_deg = -abs(angle_deg)  # Negativo per sinistra
+    else:
+        direction = 'destra'
+        angle_deg = abs(angle_deg)  # Positivo per destra
+
+    return {
+        'success': True,
+        'direction': direction,
+        'angle': round(angle_deg, 2),
+        'tdoa_sec': round(tdoa, 8),
+        'error': ''
+    }
+
+
+def compute_tdoa_direct(left_channel, right_channel, sample_rate, mode=TDOA_MODE):
     """
-    Calcola TDOA direttamente sui buffer audio (senza subprocess).
+    Calcola TDOA direttamente sui buffer audio (senza subprocess), con il TdoaEngine
+    condiviso per ``sample_rate``.
     Gestisce inversione di fase, filtering robusto e overflow dell'arcsin.
     
     Args:
         left_channel: Segnale canale sinistro
         right_channel: Segnale canale destro
         sample_rate: Frequenza di campionamento (Hz)
+        mode: "single" (un solo GCC-PHAT) o "batch" (più frame, vedi TdoaEngine.compute_frames)
     
     Returns:
         dict: {
@@ -306,61 +653,14 @@ def compute_tdoa_direct(left_channel, right_channel, sample_rate):
             'direction': str ('sinistra', 'destra', 'centro'),
             'angle': float (gradi),
             'tdoa_sec': float (ritardo in secondi),
-            'error': str (messaggio errore se success=False)
+            'error': str (messaggio errore se success=False),
+            'confidence', 'n_frames': solo in modalità "batch"
         }
     """
-    try:
-        # Converti in float per elaborazione
-        left = left_channel.astype(np.float64)
-        right = right_channel.astype(np.float64)
-        
-        # Gestione inversione di fase (se configurata)
-        if INVERT_PHASE:
-            right = -right
-        
-        # Applica filtro high-pass (robusto, non fallisce)
-        left = _apply_highpass_filter(left, sample_rate, HIGH_PASS_CUTOFF_HZ)
-        right = _apply_highpass_filter(right, sample_rate, HIGH_PASS_CUTOFF_HZ)
-        
-        # Calcola massimo TDOA teorico in campioni
-        max_tdoa_samples = int((MICROPHONE_DISTANCE / SPEED_OF_SOUND) * sample_rate) + 1
-        
-        # Calcola TDOA con GCC-PHAT
-        tdoa = _cross_spectrum_gcc_phat(left, right, sample_rate, max_tdoa_samples)
-        
-        # Calcola l'angolo con protezione overflow arcsin
-        sin_arg = (tdoa * SPEED_OF_SOUND) / MICROPHONE_DISTANCE
-        sin_arg_clamped = np.clip(sin_arg, -1.0, 1.0)  # Previene domain error
-        angle_rad = np.arcsin(sin_arg_clamped)
-        angle_deg = float(np.degrees(angle_rad))
-        
-        # Determina la direzione
-        if abs(tdoa) < TDOA_CENTER_THRESHOLD_SEC:
-            direction = 'centro'
-            angle_deg = 0.0
-        elif tdoa > 0:
-            direction = 'sinistra'
-            angle_deg = -abs(angle_deg)  # Negativo per sinistra
-        else:
-            direction = 'destra'
-            angle_deg = abs(angle_deg)  # Positivo per destra
-        
-        return {
-            'success': True,
-            'direction': direction,
-            'angle': round(angle_deg, 2),
-            'tdoa_sec': round(tdoa, 5),
-            'error': ''
-        }
-        
-    except Exception as e:
-        return {
-            'success': False,
-            'direction': 'unknown',
-            'angle': 0.0,
-            'tdoa_sec': 0.0,
-            'error': str(e)
-        }
+    engine = get_tdoa_engine(sample_rate)
+    if mode == "batch":
+        return engine.compute_frames(left_channel, right_channel)
+    return engine.compute(left_channel, right_channel)
 
 
 def get_nearest_channel(left_channel, right_channel, direction):
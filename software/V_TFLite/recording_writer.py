@@ -0,0 +1,180 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Recording Writer
+Disaccoppia l'acquisizione dalla scrittura su disco nel recorder continuo.
+Il thread di acquisizione converte ogni blocco in int16 direttamente in un buffer circolare preallocato
+(RECORDING_BUFFER_SEC di audio) e prosegue; un thread dedicato scrive su disco le porzioni pronte
+(SegmentedRecording: WAV o FLAC, rotazione, indice) mentre l'altra parte del buffer si riempie.
+L'header e l'fsync sono aggiornati a tempo (RECORDING_FSYNC_SEC), non a numero di blocchi.
+
+Se il disco resta indietro oltre la capacità del buffer i blocchi nuovi vengono scartati
+(buchi nell'indice) e contati. Metriche: latenza push -> disco, durata di write e fsync,
+occupazione del buffer e suo massimo (high water).
+"""
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+from config import RECORDING_BUFFER_SEC, RECORDING_FSYNC_SEC
+
+CHANNELS = 2
+
+
+class RecordingWriter:
+    """
+    Buffer circolare int16 (frame, 2) preallocato con un thread di scrittura.
+    ``push`` è chiamato solo dal thread di acquisizione; la SegmentedRecording è usata solo dal writer.
+    """
+
+    def __init__(self, recording, buffer_sec=RECORDING_BUFFER_SEC, fsync_sec=RECORDING_FSYNC_SEC,
+                 name="recording-writer"):
+        """
+        Args:
+            recording (SegmentedRecording): Destinazione dei blocchi
+            buffer_sec (float): Capacità del buffer (s di audio)
+            fsync_sec (float): Intervallo tra due sync (header + fsync) del segmento corrente
+        """
+        self.recording = recording
+        self.sample_rate = recording.sample_rate
+        self.capacity = max(1, int(self.sample_rate * buffer_sec))
+        self.fsync_sec = fsync_sec
+        self._buf = np.zeros((self.capacity, CHANNELS), dtype=np.int16)
+        self._tail = 0                      # prossima posizione libera (scritta dall'acquisizione)
+        self._used = 0                      # frame in attesa di scrittura
+        self._blocks = collections.deque()  # (posizione, frame, first_frame, capture_time, push_time, fine blocco)
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Contatori e metriche
+        self.pushed_blocks = 0
+        self.written_blocks = 0
+        self.dropped_blocks = 0
+        self.dropped_frames = 0
+        self.high_water = 0          # massima occupazione del buffer (frame)
+        self.latency_max = 0.0       # push -> scritto su disco (s)
+        self.latency_sum = 0.0
+        self.write_max = 0.0         # durata massima di una write (s)
+        self.syncs = 0
+        self.sync_max = 0.0          # durata massima di header + fsync (s)
+        self.errors = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def push(self, stereo, first_frame, capture_time=None):
+        """
+        Copia un blocco nel buffer (conversione float32 -> int16 sul posto) e ritorna subito.
+
+        Args:
+            stereo (numpy.ndarray): Array (N, 2) float32 in [-1, 1] o int16
+            first_frame (int): Frame assoluto del ring del primo campione
+            capture_time (float): Istante (epoch) del primo campione; None = stimato da ora e dalla durata
+
+        Returns:
+            bool: True se accodato, False se scartato (buffer pieno o writer chiuso)
+        """
+        n = len(stereo)
+        if n == 0:
+            return True
+        now = time.time()
+        if capture_time is None:
+            capture_time = now - n / self.sample_rate
+        with self._cond:
+            if self._closed or n > self.capacity - self._used:
+                self.dropped_blocks += 1
+                self.dropped_frames += n
+                return False
+            tail = self._tail
+        # La copia avviene fuori dal lock: la zona [tail, tail + n) è libera e il writer non la legge
+        # finché il blocco non viene pubblicato
+        first = min(n, self.capacity - tail)
+        for start, stop, pos in ((0, first, tail), (first, n, 0)):
+            if stop > start:
+                if stereo.dtype == np.int16:
+                    self._buf[pos:pos + stop - start] = stereo[start:stop]
+                else:
+                    self._buf[pos:pos + stop - start] = np.clip(stereo[start:stop], -1.0, 1.0) * 32767
+        with self._cond:
+            # Un blocco che attraversa la fine del buffer viene pubblicato come due porzioni contigue
+            self._blocks.append((tail, first, first_frame, capture_time, now, n == first))
+            if n > first:
+                self._blocks.append((0, n - first, first_frame + first,
+                                     capture_time + first / self.sample_rate, now, True))
+            self._tail = (tail + n) % self.capacity
+            self._used += n
+            self.high_water = max(self.high_water, self._used)
+            self.pushed_blocks += 1
+            self._cond.notify_all()
+        return True
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._blocks and not self._closed:
+                    self._cond.wait(timeout=self.fsync_sec)
+                    if time.monotonic() - last_sync >= self.fsync_sec:
+                        break
+                closed = self._closed
+                # Tutte le porzioni pronte: l'acquisizione continua a riempire il resto del buffer
+                batch = list(self._blocks)
+                self._blocks.clear()
+            for pos, n, first_frame, capture_time, push_time, block_end in batch:
+                start = time.monotonic()
+                try:
+                    self.recording.write(self._buf[pos:pos + n], first_frame, capture_time)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"⚠️  Recording writer error: {e}")
+                self.write_max = max(self.write_max, time.monotonic() - start)
+                with self._cond:
+                    self._used -= n
+                if block_end:
+                    latency = time.time() - push_time
+                    self.latency_max = max(self.latency_max, latency)
+                    self.latency_sum += latency
+                    self.written_blocks += 1
+            if time.monotonic() - last_sync >= self.fsync_sec or (closed and batch):
+                start = time.monotonic()
+                try:
+                    self.recording.sync()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"⚠️  Recording sync error: {e}")
+                last_sync = time.monotonic()
+                self.sync_max = max(self.sync_max, last_sync - start)
+                self.syncs += 1
+            if closed and not batch:
+                with self._cond:
+                    if not self._blocks:
+                        return
+
+    def stats(self):
+        """Metriche del writer (tempi in ms, occupazione del buffer in secondi di audio)."""
+        return {
+            'pushed_blocks': self.pushed_blocks,
+            'written_blocks': self.written_blocks,
+            'dropped_blocks': self.dropped_blocks,
+            'dropped_frames': self.dropped_frames,
+            'pending_sec': round(self._used / self.sample_rate, 3),
+            'high_water_sec': round(self.high_water / self.sample_rate, 3),
+            'capacity_sec': round(self.capacity / self.sample_rate, 3),
+            'latency_max_ms': round(self.latency_max * 1000, 1),
+            'latency_avg_ms': round(self.latency_sum / self.written_blocks * 1000, 1) if self.written_blocks else None,
+            'write_max_ms': round(self.write_max * 1000, 1),
+            'syncs': self.syncs,
+            'sync_max_ms': round(self.sync_max * 1000, 1),
+            'errors': self.errors,
+        }
+
+    def close(self, timeout=None):
+        """Scrive i blocchi ancora nel buffer, ferma il thread e finalizza la registrazione."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.recording.close()
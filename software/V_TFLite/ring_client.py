@@ -0,0 +1,395 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Ring Client Module
+Lettori incrementali per il ring buffer di jack-ring-socket-server:
+- RingClient: connessione TCP persistente, ad ogni lettura riceve solo i blocchi
+  arrivati dopo l'ultimo già letto (comando ``since <N>``) invece dell'intero ring (``dump``).
+- ShmRingReader: mappa il ring condiviso in memoria (server avviato con ``--shm``)
+  come vista NumPy, senza socket né copie intermedie.
+- HubClient: subscriber di audio_hub.py, che legge il ring una sola volta per tutti i consumatori.
+Tutti e tre espongono ``read_new()``; ``open_ring()`` sceglie in base a ``RING_TRANSPORT``.
+"""
+
+import mmap
+import os
+import select
+import socket
+import struct
+
+import numpy as np
+
+from config import (
+    RING_HOST, RING_PORT, RING_TRANSPORT, RING_SHM_NAME,
+    AUDIO_HUB_SOCKET, AUDIO_HUB_DROP_POLICY, AUDIO_HUB_MAX_QUEUE_SEC
+)
+
+# Ogni risposta testuale del ring server è un record di 256 byte
+REPLY_SIZE = 256
+SIZE_OF_FLOAT = 4
+CHANNELS = 2
+
+
+class RingClient:
+    """
+    Lettore incrementale del ring buffer stereo float32 esposto dal ring server.
+    """
+
+    def __init__(self, host=RING_HOST, port=RING_PORT):
+        """
+        Inizializza il client (la connessione viene aperta alla prima lettura).
+
+        Args:
+            host (str): Indirizzo del ring server
+            port (int): Porta TCP del ring server
+        """
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.nframes = None
+        self.nblocks = None
+        self.samplerate = None
+        self.seconds = None
+        self.blocksize = None
+        # Progressivo dell'ultimo blocco ricevuto (0 = nessuno)
+        self.last_seq = 0
+        # Blocchi persi perché sovrascritti nel ring prima di essere letti
+        self.dropped_blocks = 0
+
+    def connect(self):
+        """Apre la connessione e legge i parametri del ring (un solo round-trip)."""
+        self.close()
+        self.sock = socket.create_connection((self.host, self.port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.info()
+
+    def close(self):
+        """Chiude la connessione, se aperta."""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+    def _recv_exact(self, size):
+        """Riceve esattamente ``size`` byte (gestisce le letture parziali)."""
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            n = self.sock.recv_into(view[received:], size - received)
+            if n == 0:
+                raise ConnectionError("Ring server closed the connection")
+            received += n
+        return buf
+
+    def _command(self, command):
+        """Invia un comando testuale e ritorna la prima riga della risposta."""
+        self.sock.sendall(command.encode("utf8"))
+        reply = self._recv_exact(REPLY_SIZE)
+        return reply.split(b"\0", 1)[0].decode("utf8").split("\n")[0]
+
+    def info(self):
+        """
+        Legge i parametri del ring con il comando ``info``.
+
+        Returns:
+            dict: {'nframes', 'len', 'rate', 'seconds', 'count'}
+        """
+        nframes, nblocks, rate, seconds, count = map(int, self._command("info").split())
+        self.nframes = nframes
+        self.nblocks = nblocks
+        self.samplerate = rate
+        self.seconds = seconds
+        self.blocksize = SIZE_OF_FLOAT * nframes * CHANNELS
+        if count < self.last_seq:
+            # Il ring server è stato riavviato: riparte da zero
+            self.last_seq = 0
+        return {'nframes': nframes, 'len': nblocks, 'rate': rate, 'seconds': seconds, 'count': count}
+
+    def read_new(self):
+        """
+        Ritorna i blocchi arrivati dopo l'ultima lettura.
+        La prima lettura ritorna tutto il contenuto disponibile del ring.
+        In caso di errore la connessione viene chiusa e riaperta alla lettura successiva.
+
+        Returns:
+            tuple: (samplerate, stereo_data, first_seq, dropped)
+                stereo_data: numpy array (N, 2) float32, vuoto se non ci sono blocchi nuovi
+                first_seq: progressivo del primo blocco ricevuto
+                dropped: blocchi persi tra la lettura precedente e questa
+        """
+        if self.sock is None:
+            self.connect()
+        try:
+            first_seq, count = map(int, self._command(f"since {self.last_seq}").split())
+            data = self._recv_exact(count * self.blocksize)
+        except Exception:
+            self.close()
+            raise
+
+        dropped = 0
+        if self.last_seq > 0 and first_seq > self.last_seq + 1:
+            dropped = first_seq - self.last_seq - 1
+            self.dropped_blocks += dropped
+        if count > 0:
+            self.last_seq = first_seq + count - 1
+
+        stereo_data = np.frombuffer(data, dtype=np.float32).reshape(-1, CHANNELS)
+        return self.samplerate, stereo_data, first_seq, dropped
+
+
+# Header del segmento condiviso (64 byte), vedi shm_ring_header in ringbuffer.h
+SHM_HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'), ('version', '<u4'), ('nframes', '<u4'), ('samplerate', '<u4'),
+    ('len', '<u4'), ('channels', '<u4'), ('count', '<u8'), ('write_index', '<u4'),
+    ('reserved', '<u4', (7,)),
+])
+SHM_RING_MAGIC = 0x474e5244  # "DRNG"
+SHM_RING_VERSION = 1
+
+
+class ShmRingReader:
+    """
+    Lettore del ring condiviso in memoria (POSIX shm) dal ring server.
+    Il blocco con progressivo ``seq`` si trova nello slot ``(seq - 1) % len``.
+    """
+
+    def __init__(self, name=RING_SHM_NAME):
+        """
+        Inizializza il lettore (il segmento viene mappato alla prima lettura).
+
+        Args:
+            name (str): Nome dell'oggetto shared-memory (es. "/delfi_ring")
+        """
+        self.name = name
+        self.path = os.path.join("/dev/shm", name.lstrip("/"))
+        self._mm = None
+        self.inode = None
+        self.header = None
+        self.blocks = None
+        self.nframes = None
+        self.nblocks = None
+        self.samplerate = None
+        self.seconds = None
+        self.last_seq = 0
+        self.dropped_blocks = 0
+
+    def connect(self):
+        """Mappa il segmento in sola lettura e crea le viste NumPy su header e blocchi."""
+        self.close()
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+            self.inode = os.fstat(f.fileno()).st_ino
+        header = np.frombuffer(self._mm, dtype=SHM_HEADER_DTYPE, count=1)
+        if header['magic'][0] != SHM_RING_MAGIC or header['version'][0] != SHM_RING_VERSION:
+            self.close()
+            raise ConnectionError(f"Shared memory ring {self.name} not ready")
+        self.header = header
+        self.nframes = int(header['nframes'][0])
+        self.nblocks = int(header['len'][0])
+        self.samplerate = int(header['samplerate'][0])
+        self.seconds = self.nblocks * self.nframes // max(1, self.samplerate)
+        channels = int(header['channels'][0])
+        self.blocks = np.frombuffer(
+            self._mm, dtype=np.float32, offset=SHM_HEADER_DTYPE.itemsize,
+            count=self.nblocks * self.nframes * channels,
+        ).reshape(self.nblocks, self.nframes, channels)
+        if self.count() < self.last_seq:
+            self.last_seq = 0
+
+    def close(self):
+        """Rilascia le viste e la mappatura."""
+        self.header = None
+        self.blocks = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # qualche vista esportata è ancora viva: la mappatura verrà rilasciata dal GC
+                pass
+            self._mm = None
+
+    def replaced(self):
+        """
+        True se il segmento mappato non è più quello pubblicato con ``name``
+        (ring server riavviato: il vecchio segmento è stato rimosso e non avanza più).
+        """
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def count(self):
+        """Progressivo dell'ultimo blocco scritto dal server."""
+        return int(self.header['count'][0])
+
+    def _oldest_valid(self, count):
+        # Lo slot più vecchio è quello che JACK sta per sovrascrivere: non è affidabile
+        return max(1, count + 2 - self.nblocks)
+
+    def _slots(self, first_seq, n):
+        """Copia n blocchi a partire da first_seq gestendo il giro del ring."""
+        start = (first_seq - 1) % self.nblocks
+        if start + n <= self.nblocks:
+            return self.blocks[start:start + n].copy()
+        head = self.nblocks - start
+        return np.concatenate((self.blocks[start:], self.blocks[:n - head]))
+
+    def latest(self, nblocks):
+        """
+        Ritorna gli ultimi ``nblocks`` blocchi come array (N, 2).
+        Se sono contigui nel segmento la vista è zero-copy (valida finché il server
+        non li sovrascrive, cioè per circa ``len - nblocks`` blocchi).
+        """
+        if self.blocks is None:
+            self.connect()
+        count = self.count()
+        first = max(self._oldest_valid(count), count - nblocks + 1)
+        n = max(0, count - first + 1)
+        start = (first - 1) % self.nblocks
+        if start + n <= self.nblocks:
+            view = self.blocks[start:start + n]
+        else:
+            view = self._slots(first, n)
+        return view.reshape(-1, self.blocks.shape[2])
+
+    def read_new(self):
+        """
+        Ritorna i blocchi arrivati dopo l'ultima lettura (stessa interfaccia di RingClient.read_new).
+        I blocchi sovrascritti dal server durante la copia vengono scartati e contati come persi.
+
+        Returns:
+            tuple: (samplerate, stereo_data, first_seq, dropped)
+        """
+        if self.blocks is None:
+            self.connect()
+        count = self.count()
+        first = self.last_seq + 1
+        oldest = self._oldest_valid(count)
+        if first < oldest:
+            first = oldest
+        n = max(0, count - first + 1)
+        data = self._slots(first, n)
+
+        # Controllo dopo la copia: se il server ha superato i blocchi copiati, sono corrotti
+        overwritten = self._oldest_valid(self.count()) - first
+        if overwritten > 0:
+            overwritten = min(overwritten, n)
+            data = data[overwritten:]
+            first += overwritten
+            n -= overwritten
+
+        dropped = 0
+        if self.last_seq > 0 and first > self.last_seq + 1:
+            dropped = first - self.last_seq - 1
+            self.dropped_blocks += dropped
+        if n > 0:
+            self.last_seq = first + n - 1
+
+        return self.samplerate, data.reshape(-1, self.blocks.shape[2]), first, dropped
+
+
+# Messaggi di audio_hub.py: info iniziale (nframes, len, rate, seconds) e header dei chunk (first_seq, nblocks)
+HUB_INFO = struct.Struct("<IIII")
+HUB_CHUNK = struct.Struct("<QI")
+
+
+class HubClient(RingClient):
+    """
+    Subscriber di audio_hub.py via Unix socket.
+    L'hub spinge i blocchi nuovi: ``read_new()`` ritorna tutto ciò che è già arrivato,
+    senza attendere, fermandosi a un eventuale salto di progressivo.
+    """
+
+    def __init__(self, path=AUDIO_HUB_SOCKET, policy=AUDIO_HUB_DROP_POLICY,
+                 max_queue_sec=AUDIO_HUB_MAX_QUEUE_SEC, history=True):
+        """
+        Args:
+            path (str): Percorso del socket dell'hub
+            policy (str): Politica di drop lato hub (drop_oldest, drop_newest, disconnect)
+            max_queue_sec (float): Audio massimo accodato dall'hub per questo subscriber (s)
+            history (bool): True = alla registrazione l'hub invia l'audio recente (come la prima
+                lettura di RingClient), False = solo i blocchi arrivati dopo
+        """
+        super().__init__()
+        self.path = path
+        self.policy = policy
+        self.max_queue_sec = max_queue_sec
+        self.history = history
+        # Chunk ricevuto ma non ancora restituito (dopo un salto di progressivo)
+        self._pending = None
+
+    def connect(self):
+        """Si registra all'hub e riceve i parametri del ring."""
+        self.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+        self.sock.sendall(f"SUB {self.policy} {self.max_queue_sec} {int(self.history)}\n".encode())
+        nframes, nblocks, rate, seconds = HUB_INFO.unpack(self._recv_exact(HUB_INFO.size))
+        self.nframes = nframes
+        self.nblocks = nblocks
+        self.samplerate = rate
+        self.seconds = seconds
+        self.blocksize = SIZE_OF_FLOAT * nframes * CHANNELS
+        self._pending = None
+
+    def _read_chunk(self):
+        first_seq, nblocks = HUB_CHUNK.unpack(self._recv_exact(HUB_CHUNK.size))
+        return first_seq, nblocks, self._recv_exact(nblocks * self.blocksize)
+
+    def read_new(self):
+        """
+        Ritorna i blocchi ricevuti dall'hub dopo l'ultima lettura (stessa interfaccia di RingClient).
+
+        Returns:
+            tuple: (samplerate, stereo_data, first_seq, dropped)
+        """
+        if self.sock is None:
+            self.connect()
+        chunks = []
+        try:
+            if self._pending is not None:
+                chunks.append(self._pending)
+                self._pending = None
+            while select.select([self.sock], [], [], 0)[0]:
+                chunk = self._read_chunk()
+                if chunks and chunk[0] != chunks[-1][0] + chunks[-1][1]:
+                    # Salto: i dati restituiti devono restare contigui
+                    self._pending = chunk
+                    break
+                chunks.append(chunk)
+        except Exception:
+            self.close()
+            raise
+
+        if not chunks:
+            return self.samplerate, np.empty((0, CHANNELS), dtype=np.float32), self.last_seq + 1, 0
+        first_seq = chunks[0][0]
+        count = sum(c[1] for c in chunks)
+        dropped = 0
+        if self.last_seq > 0 and first_seq > self.last_seq + 1:
+            dropped = first_seq - self.last_seq - 1
+            self.dropped_blocks += dropped
+        self.last_seq = first_seq + count - 1
+        data = chunks[0][2] if len(chunks) == 1 else b"".join(c[2] for c in chunks)
+        stereo_data = np.frombuffer(data, dtype=np.float32).reshape(-1, CHANNELS)
+        return self.samplerate, stereo_data, first_seq, dropped
+
+
+def open_ring(transport=RING_TRANSPORT, history=True):
+    """
+    Crea il lettore del ring audio in base al trasporto configurato.
+
+    Args:
+        transport (str): "tcp" (socket del ring server), "shm" (memoria condivisa)
+            oppure "hub" (subscriber di audio_hub.py)
+        history (bool): Solo per "hub": False = l'hub non invia l'audio recente alla registrazione
+
+    Returns:
+        RingClient | ShmRingReader | HubClient
+    """
+    if transport == "shm":
+        return ShmRingReader(RING_SHM_NAME)
+    if transport == "hub":
+        return HubClient(AUDIO_HUB_SOCKET, history=history)
+    return RingClient(RING_HOST, RING_PORT)
@@ -23,11 +23,17 @@ printf "Jackd started \n"
 sleep 5s
 
 # starting jack-ring-socket-server (porta 8888, seconds ~0.8)
-sudo "$APP_DIR/jack-ring-socket-server/jack-ring-socket-server" --port 8888 --seconds 2 &
-printf "Jack-ring-socket-server started (port 8888)\n"
+# --shm espone anche il ring in memoria condivisa (config.RING_TRANSPORT = "shm")
+sudo "$APP_DIR/jack-ring-socket-server/jack-ring-socket-server" --port 8888 --seconds 2 --shm /delfi_ring &
+printf "Jack-ring-socket-server started (port 8888, shm /delfi_ring)\n"
 
 sleep 10s
 
+# starting audio hub (legge il ring una sola volta e lo distribuisce a recorder e detector)
+printf "Starting audio hub\n"
+/home/delfi/Prova_Delfi/.venv/bin/python3 "$APP_DIR/V_TFLite/audio_hub.py" &
+sleep 2s
+
 # starting continuous audio recorder
 printf "Starting continuous audio recorder\n"
 /home/delfi/Prova_Delfi/.venv/bin/python3 "$APP_DIR/V_TFLite/continuous_recorder.py" &
@@ -38,9 +44,13 @@ printf "Starting continuous audio recorder\n"
 
 # Run Task server e Detector
 printf "Run Tasks \n"
-/home/delfi/Prova_Delfi/.venv/bin/python3 "$APP_DIR/V_TFLite/task1_v3.py" &
-# /usr/bin/python3 /home/pi/V_TFLite/task2_v3.py &
-# /usr/bin/python3 /home/pi/V_TFLite/task3_v3.py &
+# Pool di worker TFLite: config.TASK_WORKERS processi, ciascuno su SERVER_PORT_BASE + indice
+# (INFERENCE_MODE = "local": l'interprete gira nel detector, nessun worker da avviare)
+task_workers=$(cd "$APP_DIR/V_TFLite" && /home/delfi/Prova_Delfi/.venv/bin/python3 -c "from config import TASK_WORKERS, INFERENCE_MODE; print(0 if INFERENCE_MODE == 'local' else TASK_WORKERS)" 2>/dev/null || echo 1)
+for ((i = 0; i < task_workers; i++)); do
+  /home/delfi/Prova_Delfi/.venv/bin/python3 "$APP_DIR/V_TFLite/task1_v3.py" "$i" &
+done
+printf "Started %s task workers\n" "$task_workers"
 sleep 20s
 printf "Run detector\n"
 /home/delfi/Prova_Delfi/.venv/bin/python3 "$APP_DIR/V_TFLite/detector_v3_with_trigger.py" &
@@ -0,0 +1,409 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Segmented Recording
+Registrazione continua in segmenti WAV a rotazione con indice ad accesso casuale.
+
+Ogni avvio del recorder crea una directory ``recording_<timestamp>`` in CONTINUOUS_RECORDING_DIR con:
+    recording.json      formato (sample_rate, canali, "wav" o "flac")
+    segment_000000.wav  WAV int16 stereo, nuovo segmento ogni RECORDING_SEGMENT_SEC o RECORDING_SEGMENT_MAX_BYTES
+    index.bin           record INDEX_DTYPE: frame del ring e istante (epoch) -> (segmento, offset in frame)
+
+I segmenti sono preallocati (RECORDING_PREALLOCATE) e hanno un header di 44 byte scritto da qui:
+la dimensione dei dati nell'header viene aggiornata a ogni ``sync``, quindi dopo un crash il file
+resta leggibile fino all'ultimo sync (la coda preallocata viene ignorata dai lettori).
+Un record di indice viene aggiunto a inizio segmento, a ogni buco nel flusso del ring
+e almeno ogni RECORDING_INDEX_SEC secondi (ancoraggio dell'orologio).
+
+Con RECORDING_FORMAT = "flac" i segmenti sono FLAC lossless (segment_000000.flac, richiede ``soundfile``):
+niente preallocazione né header da aggiornare, leggibili a segmento chiuso.
+
+``RecordingReader`` estrae un intervallo di tempo o di frame come array NumPy (memmap per i WAV,
+lettura con seek per i FLAC), senza scorrere i file.
+"""
+
+import glob
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+try:
+    import soundfile  # Opzionale: solo per RECORDING_FORMAT = "flac"
+except ImportError:
+    soundfile = None
+
+from config import (
+    CONTINUOUS_RECORDING_DIR, RECORDING_SEGMENT_SEC, RECORDING_SEGMENT_MAX_BYTES,
+    RECORDING_PREALLOCATE, RECORDING_INDEX_SEC, RECORDING_FORMAT
+)
+
+FORMATS = ("wav", "flac")
+
+CHANNELS = 2
+SAMPLE_WIDTH = 2  # int16
+FRAME_BYTES = CHANNELS * SAMPLE_WIDTH
+WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+HEADER_BYTES = WAV_HEADER.size  # 44
+
+INDEX_DTYPE = np.dtype([
+    ('frame', '<i8'),     # frame assoluto del ring
+    ('time', '<f8'),      # istante di cattura del frame (epoch)
+    ('segment', '<u4'),   # numero del segmento
+    ('offset', '<i8'),    # frame all'interno del segmento
+])
+
+
+def wav_header(sample_rate, data_bytes, channels=CHANNELS, sample_width=SAMPLE_WIDTH):
+    """Header WAV PCM canonico (44 byte)."""
+    return WAV_HEADER.pack(
+        b'RIFF', 36 + data_bytes, b'WAVE', b'fmt ', 16, 1, channels, sample_rate,
+        sample_rate * channels * sample_width, channels * sample_width, sample_width * 8,
+        b'data', data_bytes)
+
+
+def read_wav_data_bytes(path):
+    """Dimensione dei dati dichiarata nell'header di un segmento (fino all'ultimo sync)."""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_BYTES)
+    if len(header) < HEADER_BYTES:
+        return 0
+    return WAV_HEADER.unpack(header)[-1]
+
+
+def _segment_path(directory, segment, fmt="wav"):
+    return os.path.join(directory, f"segment_{segment:06d}.{fmt}")
+
+
+def to_int16(stereo):
+    """Converte audio float32 [-1, 1] in int16."""
+    if stereo.dtype == np.int16:
+        return stereo
+    return (np.clip(stereo, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class SegmentedRecording:
+    """
+    Scrittore della registrazione segmentata (da usare da un solo thread).
+    """
+
+    def __init__(self, sample_rate, directory=None, segment_sec=RECORDING_SEGMENT_SEC,
+                 segment_max_bytes=RECORDING_SEGMENT_MAX_BYTES, preallocate=RECORDING_PREALLOCATE,
+                 index_sec=RECORDING_INDEX_SEC, fmt=RECORDING_FORMAT):
+        """
+        Args:
+            sample_rate (int): Frequenza di campionamento (Hz)
+            directory (str): Directory della registrazione (None = CONTINUOUS_RECORDING_DIR/recording_<timestamp>)
+            segment_sec (float): Durata massima di un segmento (s)
+            segment_max_bytes (int): Dimensione massima di un segmento (None = solo durata)
+            preallocate (bool): Riserva su disco lo spazio dell'intero segmento all'apertura (solo WAV)
+            index_sec (float): Intervallo massimo tra due record di indice (s)
+            fmt (str): "wav" o "flac"
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown recording format: {fmt} (expected one of {FORMATS})")
+        if fmt == "flac" and soundfile is None:
+            raise ImportError("RECORDING_FORMAT = \"flac\" requires the soundfile package")
+        self.format = fmt
+        self.sample_rate = sample_rate
+        self.directory = directory or os.path.join(
+            CONTINUOUS_RECORDING_DIR, time.strftime("recording_%Y%m%d-%H%M%S"))
+        max_frames = int(sample_rate * segment_sec)
+        if segment_max_bytes:
+            max_frames = min(max_frames, (segment_max_bytes - HEADER_BYTES) // FRAME_BYTES)
+        self.segment_frames = max(1, max_frames)
+        self.preallocate = preallocate
+        self.index_frames = max(1, int(sample_rate * index_sec))
+
+        self.segment = -1
+        self.segment_written = 0   # frame scritti nel segmento corrente
+        self.next_frame = None     # frame del ring atteso dopo l'ultimo scritto
+        self.last_indexed = None   # frame dell'ultimo record di indice
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.segments_closed = []
+        self.disk_bytes_closed = 0  # byte su disco dei segmenti chiusi
+        self._file = None
+        self._encoder = None  # soundfile.SoundFile del segmento FLAC corrente
+        self._index = None
+
+    @property
+    def filepath(self):
+        """Segmento in scrittura (None prima del primo blocco)."""
+        return _segment_path(self.directory, self.segment, self.format) if self.segment >= 0 else None
+
+    def _open_segment(self):
+        self.segment += 1
+        self.segment_written = 0
+        self._file = open(self.filepath, 'wb+')
+        if self.format == "flac":
+            # L'encoder scrive nel file già aperto: flush e fsync restano sotto il nostro controllo
+            self._encoder = soundfile.SoundFile(self._file, 'w', samplerate=self.sample_rate,
+                                                channels=CHANNELS, format='FLAC', subtype='PCM_16')
+            return
+        if self.preallocate and hasattr(os, 'posix_fallocate'):
+            try:
+                # Spazio contiguo riservato subito: meno frammentazione e nessuna sorpresa a disco pieno
+                os.posix_fallocate(self._file.fileno(), 0, HEADER_BYTES + self.segment_frames * FRAME_BYTES)
+            except OSError as e:
+                print(f"⚠️  Segment preallocation failed: {e}")
+        self._file.write(wav_header(self.sample_rate, 0))
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        if self._encoder is not None:
+            self._encoder.close()
+            self._encoder = None
+        else:
+            data_bytes = self.segment_written * FRAME_BYTES
+            self._write_header(data_bytes)
+            # Rimuove la coda preallocata non usata
+            self._file.truncate(HEADER_BYTES + data_bytes)
+        self._file.close()
+        self._file = None
+        self.segments_closed.append(self.filepath)
+        self.disk_bytes_closed += os.path.getsize(self.filepath)
+
+    def _write_header(self, data_bytes):
+        position = self._file.tell()
+        self._file.seek(0)
+        self._file.write(wav_header(self.sample_rate, data_bytes))
+        self._file.seek(position)
+
+    def _add_index(self, frame, capture_time):
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['frame'] = frame
+        record['time'] = capture_time
+        record['segment'] = self.segment
+        record['offset'] = self.segment_written
+        self._index.write(record.tobytes())
+        self.last_indexed = frame
+
+    def write(self, stereo, first_frame, capture_time=None):
+        """
+        Scrive un blocco contiguo di audio.
+
+        Args:
+            stereo (numpy.ndarray): Array (N, 2) float32 o int16
+            first_frame (int): Frame assoluto del ring del primo campione
+            capture_time (float): Istante (epoch) del primo campione; None = stimato da ora e dalla durata
+        """
+        n = len(stereo)
+        if n == 0:
+            return
+        if capture_time is None:
+            capture_time = time.time() - n / self.sample_rate
+        if self._index is None:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, "recording.json"), 'w') as f:
+                json.dump({"sample_rate": self.sample_rate, "channels": CHANNELS, "format": self.format}, f)
+            self._index = open(os.path.join(self.directory, "index.bin"), 'ab')
+        data = to_int16(stereo)
+
+        start = 0
+        while start < n:
+            if self._file is None or self.segment_written >= self.segment_frames:
+                self._close_segment()
+                self._open_segment()
+                self.next_frame = None  # forza un record di indice a inizio segmento
+            frame = first_frame + start
+            chunk = data[start:start + self.segment_frames - self.segment_written]
+            if (self.next_frame is None or frame != self.next_frame
+                    or frame - self.last_indexed >= self.index_frames):
+                self._add_index(frame, capture_time + start / self.sample_rate)
+            if self._encoder is not None:
+                self._encoder.write(chunk)
+            else:
+                self._file.write(chunk.tobytes())
+            self.segment_written += len(chunk)
+            self.frames_written += len(chunk)
+            self.bytes_written += chunk.nbytes
+            self.next_frame = frame + len(chunk)
+            start += len(chunk)
+
+    def sync(self, fsync=True):
+        """Aggiorna l'header con i dati scritti, svuota i buffer e (opzionale) forza la scrittura su disco."""
+        if self._file is None:
+            return
+        if self._encoder is not None:
+            self._encoder.flush()
+        else:
+            self._write_header(self.segment_written * FRAME_BYTES)
+        self._file.flush()
+        self._index.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+            os.fsync(self._index.fileno())
+
+    def close(self):
+        """Finalizza l'ultimo segmento (header definitivo, coda preallocata rimossa)."""
+        self._close_segment()
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def stats(self):
+        """
+        Segmenti, frame e byte PCM scritti, byte su disco e rapporto di compressione (PCM / disco).
+        """
+        current = self._file
+        try:
+            disk_bytes = self.disk_bytes_closed + (current.tell() if current is not None else 0)
+        except ValueError:
+            # Segmento chiuso nel frattempo dal thread di scrittura
+            disk_bytes = self.disk_bytes_closed
+        return {
+            'segments': self.segment + 1,
+            'frames_written': self.frames_written,
+            'bytes_written': self.bytes_written,
+            'disk_bytes': disk_bytes,
+            'compression_ratio': round(self.bytes_written / disk_bytes, 2) if disk_bytes else None,
+        }
+
+
+class RecordingReader:
+    """
+    Accesso casuale a una registrazione segmentata (anche mentre è in scrittura).
+    Gli intervalli non registrati (buchi nel ring) sono restituiti come zeri.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._segments = {}
+        self.refresh()
+
+    def refresh(self):
+        """Rilegge l'indice e le dimensioni dei segmenti."""
+        path = os.path.join(self.directory, "index.bin")
+        count = os.path.getsize(path) // INDEX_DTYPE.itemsize if os.path.exists(path) else 0
+        self.index = np.fromfile(path, dtype=INDEX_DTYPE, count=count) if count else np.zeros(0, INDEX_DTYPE)
+        self._segments = {}
+        with open(os.path.join(self.directory, "recording.json")) as f:
+            info = json.load(f)
+        self.sample_rate = info["sample_rate"]
+        self.format = info.get("format", "wav")
+
+        # Frame coperti da ogni record: fino al record successivo nello stesso segmento o alla fine dei dati
+        segments = self.index['segment'].astype(np.int64)
+        offsets = self.index['offset']
+        ends = np.empty(len(self.index), dtype=np.int64)
+        if len(ends):
+            same = segments[1:] == segments[:-1]
+            ends[:-1] = np.where(same, offsets[1:], -1)
+            ends[-1] = -1
+            last_of_segment = np.flatnonzero(ends < 0)
+            ends[last_of_segment] = [len(self._segment(int(s))) for s in segments[last_of_segment]]
+        self._lengths = np.maximum(0, ends - offsets)
+
+    def _segment(self, segment):
+        """Dati del segmento: memmap (N, 2) int16 limitato all'ultimo sync (WAV) o FlacSegment."""
+        if segment not in self._segments:
+            path = _segment_path(self.directory, segment, self.format)
+            if self.format == "flac":
+                self._segments[segment] = FlacSegment(path)
+                return self._segments[segment]
+            frames = min(read_wav_data_bytes(path), os.path.getsize(path) - HEADER_BYTES) // FRAME_BYTES
+            self._segments[segment] = (
+                np.memmap(path, dtype=np.int16, mode='r', offset=HEADER_BYTES, shape=(frames, CHANNELS))
+                if frames > 0 else np.zeros((0, CHANNELS), dtype=np.int16))
+        return self._segments[segment]
+
+    @property
+    def start_time(self):
+        return float(self.index['time'][0]) if len(self.index) else None
+
+    @property
+    def end_time(self):
+        if not len(self.index):
+            return None
+        return float(self.index['time'][-1] + self._lengths[-1] / self.sample_rate)
+
+    def frame_at(self, t):
+        """Frame del ring all'istante ``t`` (epoch), dal record di indice più vicino che lo precede."""
+        i = max(0, int(np.searchsorted(self.index['time'], t, side='right')) - 1)
+        return int(self.index['frame'][i] + round((t - self.index['time'][i]) * self.sample_rate))
+
+    def time_at(self, frame):
+        """Istante (epoch) del frame del ring ``frame``."""
+        i = max(0, int(np.searchsorted(self.index['frame'], frame, side='right')) - 1)
+        return float(self.index['time'][i] + (frame - self.index['frame'][i]) / self.sample_rate)
+
+    def read_frames(self, start_frame, frames, as_float=True):
+        """
+        Audio dei frame del ring [start_frame, start_frame + frames).
+
+        Returns:
+            numpy.ndarray: (frames, 2) float32 in [-1, 1] (o int16 con ``as_float=False``)
+        """
+        frames = max(0, int(frames))
+        out = np.zeros((frames, CHANNELS), dtype=np.int16)
+        end_frame = start_frame + frames
+        first = max(0, int(np.searchsorted(self.index['frame'], start_frame, side='right')) - 1)
+        last = int(np.searchsorted(self.index['frame'], end_frame, side='left'))
+        for i in range(first, last):
+            run_start = int(self.index['frame'][i])
+            lo = max(start_frame, run_start)
+            hi = min(end_frame, run_start + int(self._lengths[i]))
+            if hi <= lo:
+                continue
+            offset = int(self.index['offset'][i]) + lo - run_start
+            out[lo - start_frame:hi - start_frame] = self._segment(int(self.index['segment'][i]))[
+                offset:offset + hi - lo]
+        if as_float:
+            return out.astype(np.float32) / 32767
+        return out
+
+    def read_range(self, start, end, as_float=True):
+        """
+        Audio tra gli istanti ``start`` e ``end`` (epoch, secondi).
+
+        Returns:
+            numpy.ndarray: (N, 2) con N = (end - start) * sample_rate
+        """
+        start_frame = self.frame_at(start)
+        return self.read_frames(start_frame, int(round((end - start) * self.sample_rate)), as_float)
+
+
+class FlacSegment:
+    """Segmento FLAC indicizzabile come l'array di un WAV (``len`` e slice di frame, int16)."""
+
+    def __init__(self, path):
+        if soundfile is None:
+            raise ImportError("Reading FLAC segments requires the soundfile package")
+        self.path = path
+        try:
+            self.frames = soundfile.info(path).frames
+        except RuntimeError:
+            # Segmento ancora in scrittura (o interrotto) senza STREAMINFO completo
+            self.frames = 0
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, frames):
+        start, stop, _ = frames.indices(self.frames)
+        return soundfile.read(self.path, start=start, stop=stop, dtype='int16', always_2d=True)[0]
+
+
+def list_recordings(directory=CONTINUOUS_RECORDING_DIR):
+    """Directory delle registrazioni segmentate, dalla più vecchia."""
+    return sorted(glob.glob(os.path.join(directory, "recording_*")))
+
+
+def read_range(start, end, directory=CONTINUOUS_RECORDING_DIR, as_float=True):
+    """
+    Audio tra ``start`` e ``end`` (epoch) dalla registrazione che contiene ``start``.
+
+    Returns:
+        numpy.ndarray: (N, 2), None se nessuna registrazione copre l'intervallo
+    """
+    for path in reversed(list_recordings(directory)):
+        try:
+            reader = RecordingReader(path)
+        except (OSError, ValueError, KeyError):
+            continue
+        if reader.start_time is not None and reader.start_time <= start <= reader.end_time:
+            return reader.read_range(start, end, as_float)
+    return None
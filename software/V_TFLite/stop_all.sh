@@ -10,6 +10,16 @@ if pgrep -f "V_TFLite/continuous_recorder.py" > /dev/null 2>&1; then
   sleep 5  # Give it time to close the WAV file (just needs to update header)
 fi
 
+# Detector: SIGTERM lets it flush queued WAVs, events and logs before exiting
+if pgrep -f "V_TFLite/detector_v3_with_trigger.py" > /dev/null 2>&1; then
+  echo "Stopping Detector (flushing queued saves)..."
+  pkill -TERM -f "V_TFLite/detector_v3_with_trigger.py" || true
+  for _ in $(seq 1 12); do
+    pgrep -f "V_TFLite/detector_v3_with_trigger.py" > /dev/null 2>&1 || break
+    sleep 1
+  done
+fi
+
 kill_pattern() {
   local pattern="$1"
   local name="$2"
@@ -30,7 +40,10 @@ kill_pattern() {
 kill_pattern "V_TFLite/detector_v3_with_trigger.py" "Detector"
 
 # TFLite tasks
-kill_pattern "V_TFLite/task1_v3.py" "Task1"
+kill_pattern "V_TFLite/task1_v3.py" "Task workers"
+
+# Audio hub (after its subscribers)
+kill_pattern "V_TFLite/audio_hub.py" "Audio hub"
 
 # Ring buffer server
 kill_pattern "jack-ring-socket-server" "Jack ring socket server"
@@ -1,74 +1,141 @@
 #!/home/delfi/Prova_Delfi/.venv/bin/python3
 import asyncio
+import concurrent.futures
+import sys
 import numpy as np
-from scipy.signal import spectrogram
 from PIL import Image
-import cv2
 import tflite_runtime.interpreter as tf  # Utilizziamo TensorFlow Lite al posto di Keras
-from config import MIN_FREQ, MAX_FREQ, IMG_WIDTH, IMG_HEIGHT, NFFT, OVERLAP, MODEL_PATH, SERVER_PORT_BASE
-
-serverPort = SERVER_PORT_BASE
+from config import MODEL_PATH, SERVER_PORT_BASE, TASK_MAX_BATCH
+from dsp import StftCache, spectrogram_to_image, apply_sobel_vertical
+from task_protocol import read_message, parse_request, write_response, NO_START_FRAME
 
 """
-Task server: riceve un blocco mono, esegue DSP+TFLite e ritorna uno score.
+Task server: riceve blocchi mono su connessione persistente (framing binario, vedi task_protocol.py),
+esegue DSP+TFLite e ritorna uno score per finestra. Più finestre nella stessa richiesta
+vengono valutate con un solo interpreter.invoke() (tensore di input ridimensionato al batch).
+
+Il modulo è anche importabile: InferenceEngine (interprete + pipeline DSP) e LocalInference
+permettono al detector di eseguire l'inferenza nel proprio processo (INFERENCE_MODE = "local").
 """
 
-# Carichiamo il modello TensorFlow Lite
-interpreter = tf.Interpreter(model_path=MODEL_PATH)
-interpreter.allocate_tensors()
-
-def compute(wave, br):
-    # === DSP + Imaging (DiNardo-style) ===
-    img = waveform_to_image(wave.astype(np.float32), br)
-    # === Applica filtro Sobel verticale (come nel training) ===
-    img_sobel = apply_sobel_vertical(img)
-    # === Prepara tensore input per TFLite ===
-    x = _prepare_input(img_sobel)
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-    interpreter.set_tensor(input_details[0]['index'], x)
-    interpreter.invoke()
-    yApp_lite = interpreter.get_tensor(output_details[0]['index'])
-    return yApp_lite
-
-# ===== Inline helpers from former dinardo_adapter =====
-def make_spectrogram(signal, sr, nfft=NFFT, overlap=OVERLAP):
-    hop = int(nfft * (1 - overlap))
-    freqs, times, Sxx = spectrogram(
-        signal, fs=sr, window='hann', nperseg=nfft,
-        noverlap=nfft - hop, scaling='density', mode='magnitude'
-    )
-    Sxx = Sxx[: nfft // 2, :]
-    Sxx_db = 20 * np.log10(Sxx + 1e-12)
-    return Sxx_db, freqs
-
-def spectrogram_to_image(Sxx_db, freqs, min_f=MIN_FREQ, max_f=MAX_FREQ, w=IMG_WIDTH, h=IMG_HEIGHT):
-    idx_min = np.searchsorted(freqs, min_f)
-    idx_max = np.searchsorted(freqs, max_f, side='right')
-    block = Sxx_db[idx_min:idx_max]
-    block = block - block.min()
-    denom = block.max() if block.max() != 0 else 1.0
-    block = block / denom
-    img_arr = (255 * block)[::-1].astype(np.uint8)  # flip Y
-    img = Image.fromarray(img_arr, mode='L')
-    return img.resize((w, h), resample=Image.BILINEAR)
-
-def apply_sobel_vertical(image):
-    """Sobel filter (vertical)."""
-    arr = np.array(image)
-    sobel = cv2.Sobel(arr, cv2.CV_64F, 0, 1, ksize=7)
-    sobel = cv2.normalize(sobel, None, 0, 255, cv2.NORM_MINMAX)
-    return Image.fromarray(sobel.astype(np.uint8), mode='L')
-
-def waveform_to_image(signal, sr, nfft=NFFT, overlap=OVERLAP, min_f=MIN_FREQ, max_f=MAX_FREQ, w=IMG_WIDTH, h=IMG_HEIGHT):
-    Sxx_db, freqs = make_spectrogram(signal, sr, nfft=nfft, overlap=overlap)
-    return spectrogram_to_image(Sxx_db, freqs, min_f=min_f, max_f=max_f, w=w, h=h)
-
-def _prepare_input(image: Image.Image):
-    """Prepara input per TFLite"""
-    input_details = interpreter.get_input_details()[0]
-    input_shape = input_details['shape']
-    
+
+class InferenceEngine:
+    """
+    Interprete TFLite + pipeline spettrogramma -> spectrogram_to_image -> apply_sobel_vertical -> _prepare_input.
+    Lo spettrogramma passa da una StftCache: le finestre sovrapposte dello stesso flusso
+    ricalcolano solo i frame nuovi.
+    Non è thread-safe: ogni istanza va usata da un solo thread alla volta.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, max_batch=TASK_MAX_BATCH):
+        # Carichiamo il modello TensorFlow Lite
+        self.interpreter = tf.Interpreter(model_path=model_path)
+        self.interpreter.allocate_tensors()
+        self.max_batch = max(1, int(max_batch))
+        # Forma di una singola immagine di input (senza la dimensione di batch)
+        self.input_shape = tuple(self.interpreter.get_input_details()[0]['shape'][1:])
+        self._batch_size = 1
+        self._batch_supported = True
+        self.stft_cache = StftCache()
+
+    def _resize_batch(self, n):
+        """Ridimensiona il tensore di input a ``n`` finestre (solo se cambia)."""
+        if n == self._batch_size:
+            return
+        input_index = self.interpreter.get_input_details()[0]['index']
+        self.interpreter.resize_tensor_input(input_index, (n,) + self.input_shape)
+        self.interpreter.allocate_tensors()
+        self._batch_size = n
+
+    def _invoke(self, x):
+        """Esegue il modello su un batch ``x`` (n, ...) e ritorna uno score per riga."""
+        if len(x) > 1 and self._batch_supported:
+            try:
+                self._resize_batch(len(x))
+            except Exception as e:
+                # Modello con batch fisso: si torna a un invoke per finestra
+                print(f"Batch resize not supported by the model, falling back to single invokes: {e}")
+                self._batch_supported = False
+                self._resize_batch(1)
+        if len(x) > 1 and not self._batch_supported:
+            return np.concatenate([self._invoke(row[np.newaxis]) for row in x])
+        if len(x) == 1:
+            self._resize_batch(1)
+        self.interpreter.set_tensor(self.interpreter.get_input_details()[0]['index'], x)
+        self.interpreter.invoke()
+        y = self.interpreter.get_tensor(self.interpreter.get_output_details()[0]['index'])
+        return y.reshape(len(x), -1)[:, 0].copy()
+
+    def _window_input(self, wave, br, stream_id, start_frame):
+        """DSP + Imaging + Sobel di una finestra -> input del modello."""
+        Sxx_db, freqs = self.stft_cache.spectrogram_db(wave.astype(np.float32), br, stream_id, start_frame)
+        return _prepare_input(apply_sobel_vertical(spectrogram_to_image(Sxx_db, freqs)), self.input_shape)
+
+    def compute_batch(self, waves, br, stream_id=0, start_frames=None):
+        """
+        Calcola gli score di più finestre mono della stessa lunghezza.
+
+        Args:
+            waves (numpy.ndarray): Array (n_windows, samples)
+            br (int): Frequenza di campionamento (Hz)
+            stream_id (int): Flusso di provenienza (es. canale) per la cache STFT
+            start_frames (list): Frame assoluto iniziale di ogni finestra (None = nessun riuso)
+
+        Returns:
+            numpy.ndarray: uno score float32 per finestra
+        """
+        if start_frames is None:
+            start_frames = [NO_START_FRAME] * len(waves)
+        # === DSP + Imaging + Sobel per ogni finestra, poi un unico tensore di input ===
+        x = np.stack([
+            self._window_input(wave, br, stream_id, int(start_frame))
+            for wave, start_frame in zip(waves, start_frames)
+        ])
+        scores = [self._invoke(x[i:i + self.max_batch]) for i in range(0, len(x), self.max_batch)]
+        return np.concatenate(scores).astype(np.float32)
+
+    def compute(self, wave, br):
+        # Una sola finestra: batch di dimensione 1
+        return self.compute_batch(wave[np.newaxis, :], br)[:1]
+
+
+class LocalInference:
+    """
+    Inferenza nel processo del detector, stessa interfaccia di TaskClient/TaskPool
+    (``await score(wave, sample_rate)``). L'interprete vive in un thread dedicato:
+    il loop asyncio resta libero e le finestre non vengono serializzate né copiate su socket.
+    """
+
+    def __init__(self, model_path=MODEL_PATH):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="tflite")
+        # L'interprete viene creato nel thread che lo userà
+        self.engine = self._executor.submit(InferenceEngine, model_path).result()
+        self.requests = 0
+        self.failures = 0
+
+    async def score_batch(self, waves, sample_rate, stream_id=0, start_frames=None):
+        """Score di più finestre (n_windows, samples) calcolati nel thread dell'interprete."""
+        self.requests += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.engine.compute_batch, waves, sample_rate, stream_id, start_frames)
+        except Exception:
+            self.failures += 1
+            raise
+
+    async def score(self, wave, sample_rate, stream_id=0, start_frame=NO_START_FRAME):
+        scores = await self.score_batch(wave[np.newaxis, :], sample_rate, stream_id, [start_frame])
+        return float(scores[0])
+
+    def stats(self):
+        return [{'port': 'local', 'requests': self.requests, 'failures': self.failures, 'in_flight': 0}]
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def _prepare_input(image: Image.Image, input_shape):
+    """Prepara input per TFLite (una immagine, senza dimensione di batch)"""
     if image.mode != 'L':
         image = image.convert('L')
 
@@ -77,37 +144,33 @@ def _prepare_input(image: Image.Image):
     return arr
 
 async def handle_client(reader, writer):
-    data = await reader.read(1024)
-    message = data.decode()
     addr = writer.get_extra_info('peername')
-    print(f"Received {message} from {addr}")
-
-    # Dividi il messaggio per ottenere bitrate e dimensione
-    bitrate, file_size, data_size = map(int, message.split(','))
-
-    # Invia ACK al client
-    writer.write(b'ACK')
-    await writer.drain()
-
-    received_data = bytearray()
-
-    # Leggi i dati del file audio
-    while len(received_data) < file_size:
-        chunk = await reader.read(file_size - len(received_data))
-        received_data.extend(chunk)
-    if data_size == 2:
-        received_data = np.frombuffer(received_data, dtype=np.int16)
-    else:
-        received_data = np.frombuffer(received_data, dtype=np.float32)
-
-    yApp_lite = compute(received_data, bitrate)
-    score = float(np.squeeze(yApp_lite))
-    writer.write(f"{score}\n".encode())
+    print(f"Client connected from {addr}")
+
+    # La connessione resta aperta: una richiesta dopo l'altra finché il client non chiude
+    try:
+        while True:
+            message = await read_message(reader)
+            try:
+                request_id, bitrate, windows, stream_id, start_frames = parse_request(message)
+            except Exception as e:
+                print(f"Invalid request from {addr}: {e}")
+                break
+            try:
+                scores = engine.compute_batch(windows, bitrate, stream_id, start_frames)
+            except Exception as e:
+                print(f"Error computing request {request_id}: {e}")
+                scores = None
+            write_response(writer, request_id, scores)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
 
     # Chiudi la connessione
+    print(f"Client {addr} disconnected")
     writer.close()
 
-async def main():
+async def main(serverPort):
     server = await asyncio.start_server(
         handle_client, '127.0.0.1', serverPort)
 
@@ -117,4 +180,8 @@ async def main():
     async with server:
         await server.serve_forever()
 
-asyncio.run(main())
+if __name__ == "__main__":
+    # Indice del worker (task1_v3.py <indice>): ogni worker ha il proprio interprete e ascolta su SERVER_PORT_BASE + indice
+    worker_index = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    engine = InferenceEngine()
+    asyncio.run(main(SERVER_PORT_BASE + worker_index))
@@ -0,0 +1,256 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Task Protocol
+Framing binario tra detector e task server TFLite (task1_v3.py) su connessione persistente.
+
+Ogni messaggio è ``uint32 lunghezza`` (little-endian, byte che seguono) + header + payload:
+- richiesta: REQUEST_HEADER (request_id, sample_rate, sample_width, n_windows, stream_id)
+  + n_windows frame iniziali int64 (frame assoluto del ring, -1 = sconosciuto)
+  + n_windows finestre mono di uguale lunghezza, concatenate (sample_width 2 = int16, 4 = float32)
+  stream_id e frame iniziali permettono al server di riusare l'STFT delle finestre sovrapposte.
+- risposta:  RESPONSE_HEADER (request_id, status, n_scores) + n_scores score float32
+Le risposte portano il request_id della richiesta: più richieste possono essere in volo
+sulla stessa connessione e le letture parziali sono gestite da ``readexactly``.
+TaskPool distribuisce le richieste su più worker (task1_v3.py <indice>) in base al carico.
+"""
+
+import asyncio
+import itertools
+import struct
+
+import numpy as np
+
+LENGTH = struct.Struct("<I")
+REQUEST_HEADER = struct.Struct("<IIBxHI")
+RESPONSE_HEADER = struct.Struct("<IBxH")
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+SAMPLE_DTYPES = {2: np.int16, 4: np.float32}
+
+NO_START_FRAME = -1
+
+
+async def read_message(reader):
+    """Legge un messaggio completo (senza il prefisso di lunghezza)."""
+    size, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(size)
+
+
+def write_message(writer, header, payload=b""):
+    """Accoda sul writer un messaggio con prefisso di lunghezza."""
+    writer.write(LENGTH.pack(len(header) + len(payload)))
+    writer.write(header)
+    if payload:
+        writer.write(payload)
+
+
+def parse_request(message):
+    """
+    Decodifica una richiesta.
+
+    Returns:
+        tuple: (request_id, sample_rate, waves numpy array (n_windows, samples), stream_id, start_frames)
+    """
+    request_id, sample_rate, sample_width, n_windows, stream_id = REQUEST_HEADER.unpack_from(message)
+    dtype = SAMPLE_DTYPES.get(sample_width)
+    if dtype is None:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    if n_windows == 0:
+        raise ValueError("Request without windows")
+    start_frames = np.frombuffer(message, dtype=np.int64, offset=REQUEST_HEADER.size, count=n_windows)
+    waves = np.frombuffer(message, dtype=dtype, offset=REQUEST_HEADER.size + start_frames.nbytes)
+    if len(waves) % n_windows:
+        raise ValueError(f"Payload of {len(waves)} samples does not split into {n_windows} windows")
+    return request_id, sample_rate, waves.reshape(n_windows, -1), stream_id, start_frames
+
+
+def write_response(writer, request_id, scores=None):
+    """Accoda la risposta con uno score per finestra (scores None = errore)."""
+    if scores is None:
+        write_message(writer, RESPONSE_HEADER.pack(request_id, STATUS_ERROR, 0))
+    else:
+        scores = np.asarray(scores, dtype=np.float32).ravel()
+        write_message(writer, RESPONSE_HEADER.pack(request_id, STATUS_OK, len(scores)),
+                      scores.tobytes())
+
+
+class TaskClient:
+    """
+    Client asincrono persistente per il task server.
+    Un task di lettura associa le risposte alle richieste in volo tramite request_id.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._reader_task = None
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    @property
+    def in_flight(self):
+        """Numero di richieste in attesa di risposta."""
+        return len(self._pending)
+
+    async def connect(self):
+        """Apre la connessione e avvia il task di lettura delle risposte."""
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    async def _read_responses(self):
+        try:
+            while True:
+                message = await read_message(self.reader)
+                request_id, status, n_scores = RESPONSE_HEADER.unpack_from(message)
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(np.frombuffer(message, dtype=np.float32,
+                                                    offset=RESPONSE_HEADER.size, count=n_scores))
+                else:
+                    future.set_exception(RuntimeError(f"Task server error on request {request_id}"))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            self._fail_pending(ConnectionError(f"Task server connection lost: {e}"))
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+            self.writer = None
+
+    def _fail_pending(self, exc):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+
+    async def score(self, wave, sample_rate, stream_id=0, start_frame=NO_START_FRAME):
+        """
+        Invia un blocco mono e attende lo score.
+
+        Args:
+            wave (numpy.ndarray): Campioni mono (float32 o int16)
+            sample_rate (int): Frequenza di campionamento (Hz)
+            stream_id (int): Flusso di provenienza (es. canale), per il riuso dell'STFT
+            start_frame (int): Frame assoluto del primo campione (NO_START_FRAME = nessun riuso)
+
+        Returns:
+            float: score del modello
+        """
+        scores = await self.score_batch(wave[np.newaxis, :], sample_rate, stream_id, [start_frame])
+        return float(scores[0])
+
+    async def score_batch(self, waves, sample_rate, stream_id=0, start_frames=None):
+        """
+        Invia più finestre mono della stessa lunghezza in un'unica richiesta
+        (il server le valuta con un solo invoke). Riapre la connessione se necessario.
+
+        Args:
+            waves (numpy.ndarray): Array (n_windows, samples) float32 o int16
+            sample_rate (int): Frequenza di campionamento (Hz)
+            stream_id (int): Flusso di provenienza delle finestre
+            start_frames (list): Frame assoluto iniziale di ogni finestra (None = sconosciuti)
+
+        Returns:
+            numpy.ndarray: uno score float32 per finestra
+        """
+        if not self.connected:
+            async with self._connect_lock:
+                if not self.connected:
+                    await self.connect()
+        request_id = next(self._ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        if start_frames is None:
+            start_frames = [NO_START_FRAME] * len(waves)
+        header = REQUEST_HEADER.pack(request_id, int(sample_rate), waves.itemsize, len(waves), stream_id) \
+            + np.asarray(start_frames, dtype=np.int64).tobytes()
+        payload = memoryview(np.ascontiguousarray(waves)).cast('B')
+        try:
+            write_message(self.writer, header, payload)
+            await self.writer.drain()
+        except BaseException:
+            # Richiesta mai inviata: nessuna risposta arriverà per questo request_id
+            self._pending.pop(request_id, None)
+            raise
+        return await future
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+class TaskPool:
+    """
+    Pool di task server (uno per worker su ``base_port + i``).
+    Ogni richiesta va al worker con meno richieste in volo; a parità di carico resta sul worker
+    che ha servito l'ultima richiesta dello stesso flusso, così la sua cache STFT viene riusata.
+    Un worker irraggiungibile viene escluso per ``retry_sec`` secondi e la richiesta passa al successivo.
+    """
+
+    def __init__(self, host, base_port, n_workers, retry_sec=5.0):
+        self.clients = [TaskClient(host, base_port + i) for i in range(max(1, n_workers))]
+        self.retry_sec = retry_sec
+        self.requests = [0] * len(self.clients)
+        self.failures = [0] * len(self.clients)
+        self._down_until = [0.0] * len(self.clients)
+        self._next = 0
+        self._stream_worker = {}
+
+    def _pick(self, exclude, stream_id):
+        """Indice del worker disponibile meno carico (a parità, quello del flusso, poi round robin)."""
+        now = asyncio.get_running_loop().time()
+        n = len(self.clients)
+        candidates = [(self._next + k) % n for k in range(n)]
+        candidates = [i for i in candidates if i not in exclude]
+        if not candidates:
+            return None
+        available = [i for i in candidates if self._down_until[i] <= now] or candidates
+        best = min(available, key=lambda i: self.clients[i].in_flight)
+        preferred = self._stream_worker.get(stream_id)
+        if preferred in available and self.clients[preferred].in_flight <= self.clients[best].in_flight:
+            best = preferred
+        self._next = (best + 1) % n
+        return best
+
+    async def score(self, wave, sample_rate, stream_id=0, start_frame=NO_START_FRAME):
+        """Come TaskClient.score, sul worker meno carico."""
+        scores = await self.score_batch(wave[np.newaxis, :], sample_rate, stream_id, [start_frame])
+        return float(scores[0])
+
+    async def score_batch(self, waves, sample_rate, stream_id=0, start_frames=None):
+        """Come TaskClient.score_batch, sul worker meno carico; ritenta sugli altri se la connessione cade."""
+        tried = set()
+        while True:
+            i = self._pick(tried, stream_id)
+            if i is None:
+                raise ConnectionError("No task server worker available")
+            tried.add(i)
+            self.requests[i] += 1
+            self._stream_worker[stream_id] = i
+            try:
+                return await self.clients[i].score_batch(waves, sample_rate, stream_id, start_frames)
+            except (ConnectionError, OSError):
+                self.failures[i] += 1
+                self._down_until[i] = asyncio.get_running_loop().time() + self.retry_sec
+
+    def stats(self):
+        """Richieste, errori di connessione e richieste in volo per worker."""
+        return [
+            {'port': c.port, 'requests': self.requests[i], 'failures': self.failures[i], 'in_flight': c.in_flight}
+            for i, c in enumerate(self.clients)
+        ]
+
+    async def close(self):
+        for client in self.clients:
+            await client.close()
@@ -14,12 +14,10 @@ import sys
 import json
 import numpy as np
 from scipy.io import wavfile
-from scipy.signal import spectrogram
-from PIL import Image
-import cv2
 
 # Moduli progetto
 from power_trigger import PowerTrigger, compute_tdoa_direct
+from dsp import make_spectrogram, spectrogram_to_image, apply_sobel_vertical
 from config import (
     PROMINENCE_BAND_MIN_HZ, PROMINENCE_BAND_MAX_HZ, PROMINENCE_THRESHOLD_DB,
     DETECTION_THRESHOLD
@@ -63,36 +61,6 @@ def load_inputs(args):
     raise ValueError("Specificare --stereo <file> oppure --left <file> --right <file>")
 
 
-def make_spectrogram(signal, sr, nfft, overlap):
-    """Spectrogram: waveform -> dB spectrogram."""
-    hop = int(nfft * (1 - overlap))
-    freqs, times, Sxx = spectrogram(signal, fs=sr,
-                                    window='hann', nperseg=nfft,
-                                    noverlap=nfft-hop, scaling='density',
-                                    mode='magnitude')
-    Sxx = Sxx[:nfft//2, :]
-    return 20*np.log10(Sxx + 1e-12), freqs
-
-
-def spectrogram_to_image(Sxx_db, freqs, min_f, max_f, w, h):
-    """To grayscale PIL Image."""
-    idx_min = np.searchsorted(freqs, min_f)
-    idx_max = np.searchsorted(freqs, max_f, side='right')
-    block = Sxx_db[idx_min:idx_max]
-    block -= block.min(); block /= block.max()
-    img_arr = (255 * block)[::-1].astype(np.uint8)  # flip Y
-    img = Image.fromarray(img_arr, mode='L')
-    return img.resize((w, h), resample=Image.BILINEAR)
-
-
-def apply_sobel_vertical(image):
-    """Sobel filter (vertical)."""
-    arr = np.array(image)
-    sobel = cv2.Sobel(arr, cv2.CV_64F, 0, 1, ksize=7)
-    sobel = cv2.normalize(sobel, None, 0, 255, cv2.NORM_MINMAX)
-    return Image.fromarray(sobel.astype(np.uint8), mode='L')
-
-
 def run_detection(signal, sample_rate):
     """
     Esegue detection TFLite direttamente (senza server).
@@ -199,7 +167,9 @@ def main():
         print(f"Success: {tdoa_result['success']}")
         print(f"Direction: {tdoa_result['direction']}")
         print(f"Angle: {tdoa_result['angle']}°")
-        print(f"TDOA: {tdoa_result['tdoa_sec']*1e6:.2f} µs ({int(tdoa_result['tdoa_sec']*fs)} samples)")
+        print(f"TDOA: {tdoa_result['tdoa_sec']*1e6:.2f} µs ({tdoa_result['tdoa_sec']*fs:.2f} samples)")
+        if 'confidence' in tdoa_result:
+            print(f"Confidence: {tdoa_result['confidence']:.2f} ({tdoa_result['n_frames']} frames)")
         if tdoa_result['error']:
             print(f"Error: {tdoa_result['error']}")
     elif res['action'] == 'left_only':
@@ -0,0 +1,288 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Window Archive
+Archivio delle finestre di analisi senza sovrapposizione (WINDOW_SAVE_MODE = "archive").
+Le finestre (WINDOW_SEC, hop HALF_WINDOW) si sovrappongono al 50%: invece di un WAV + JSON per finestra,
+ogni campione viene scritto una sola volta in grandi segmenti append-only (PCM int16 stereo interleaved)
+e un indice binario registra per ogni finestra frame di inizio, segmento, offset, flag del trigger e contatore.
+``WindowArchiveReader`` ricostruisce qualsiasi finestra su richiesta.
+
+Struttura di una directory di archivio (una per avvio del detector):
+    archive.json        formato (sample_rate, canali, frame per finestra/hop)
+    segment_000000.pcm  audio contiguo; nuovo segmento dopo WINDOW_ARCHIVE_SEGMENT_SEC o a un buco nel ring
+    index.bin           un record INDEX_DTYPE per finestra
+
+Uso da terminale:
+    python window_archive.py <directory> [--export N output.wav]
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+from scipy.io import wavfile
+
+from config import WINDOW_SAVES_DIR, WINDOW_SEC, HALF_WINDOW, WINDOW_ARCHIVE_SEGMENT_SEC
+
+CHANNELS = 2
+ACTIONS = ("none", "left_only", "right_only", "tdoa")
+
+# Flag dei trigger nel campo 'flags'
+FLAG_LEFT = 1
+FLAG_RIGHT = 2
+
+INDEX_DTYPE = np.dtype([
+    ('start_frame', '<i8'),   # frame assoluto del ring del primo campione della finestra
+    ('time', '<f8'),          # istante di cattura (epoch)
+    ('counter', '<u4'),       # contatore progressivo della finestra
+    ('segment', '<u4'),       # numero del segmento che contiene la finestra
+    ('offset', '<i8'),        # frame della finestra all'interno del segmento
+    ('frames', '<u4'),        # lunghezza della finestra (frame)
+    ('flags', 'u1'),          # FLAG_LEFT | FLAG_RIGHT
+    ('action', 'u1'),         # indice in ACTIONS
+])
+
+
+def _segment_path(directory, segment):
+    return os.path.join(directory, f"segment_{segment:06d}.pcm")
+
+
+def to_int16(block):
+    """Converte un blocco float32 [-1, 1] in int16 (come save_analysis_window)."""
+    if block.dtype == np.int16:
+        return block
+    return (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class WindowArchive:
+    """
+    Scrittore dell'archivio: ``append`` salva solo la parte della finestra non ancora scritta
+    (un hop nel funzionamento normale). Da usare da un solo thread (il BackgroundWriter).
+    """
+
+    def __init__(self, sample_rate, directory=None, segment_sec=WINDOW_ARCHIVE_SEGMENT_SEC,
+                 window_sec=WINDOW_SEC, hop_sec=HALF_WINDOW):
+        """
+        Args:
+            sample_rate (int): Frequenza di campionamento (Hz)
+            directory (str): Directory dell'archivio (None = WINDOW_SAVES_DIR/archive_<timestamp>)
+            segment_sec (float): Durata massima di un segmento (s)
+            window_sec, hop_sec (float): Geometria delle finestre (solo per archive.json)
+        """
+        self.sample_rate = sample_rate
+        self.directory = directory or os.path.join(
+            WINDOW_SAVES_DIR, time.strftime("archive_%Y%m%d-%H%M%S"))
+        self.segment_frames = max(1, int(sample_rate * segment_sec))
+        self.window_frames = int(round(sample_rate * window_sec))
+        self.hop_frames = int(round(sample_rate * hop_sec))
+
+        self.segment = -1
+        self.segment_start = None  # frame assoluto del primo campione del segmento corrente
+        self.stored_end = None     # frame assoluto successivo all'ultimo campione scritto
+        self.windows = 0
+        self.frames_written = 0
+        self._audio = None
+        self._index = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "archive.json"), 'w') as f:
+            json.dump({
+                "sample_rate": self.sample_rate,
+                "channels": CHANNELS,
+                "dtype": "int16",
+                "window_frames": self.window_frames,
+                "hop_frames": self.hop_frames,
+                "segment_frames": self.segment_frames,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }, f, indent=2)
+        self._index = open(os.path.join(self.directory, "index.bin"), 'ab')
+
+    def _new_segment(self, start_frame):
+        if self._audio is not None:
+            self._audio.close()
+        self.segment += 1
+        self.segment_start = start_frame
+        self.stored_end = start_frame
+        self._audio = open(_segment_path(self.directory, self.segment), 'ab')
+
+    def append(self, start_frame, left_block, right_block, window_counter, trigger_result=None,
+               capture_time=None):
+        """
+        Aggiunge una finestra all'archivio.
+
+        Args:
+            start_frame (int): Frame assoluto di inizio della finestra (WindowScheduler)
+            left_block, right_block: Canali della finestra (float32 o int16)
+            window_counter (int): Contatore progressivo della finestra
+            trigger_result (dict): Risultato del trigger (flag e azione nell'indice)
+            capture_time (float): Istante (epoch) della finestra; None = ora
+        """
+        if self._index is None:
+            self._open()
+        frames = len(left_block)
+        end_frame = start_frame + frames
+        # Nuovo segmento: primo blocco, buco nel flusso (finestre perse), contatore ripartito o segmento pieno
+        if (self.stored_end is None or start_frame > self.stored_end or start_frame < self.segment_start
+                or end_frame - self.segment_start > self.segment_frames):
+            self._new_segment(start_frame)
+
+        if end_frame > self.stored_end:
+            new = slice(self.stored_end - start_frame, frames)
+            stereo = np.empty((frames - new.start, CHANNELS), dtype=np.int16)
+            stereo[:, 0] = to_int16(left_block[new])
+            stereo[:, 1] = to_int16(right_block[new])
+            self._audio.write(stereo.tobytes())
+            self._audio.flush()
+            self.frames_written += len(stereo)
+            self.stored_end = end_frame
+
+        # L'indice viene scritto dopo l'audio: un record punta sempre a campioni già su file
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['start_frame'] = start_frame
+        record['time'] = time.time() if capture_time is None else capture_time
+        record['counter'] = window_counter
+        record['segment'] = self.segment
+        record['offset'] = start_frame - self.segment_start
+        record['frames'] = frames
+        if trigger_result:
+            record['flags'] = (FLAG_LEFT * bool(trigger_result.get('left_triggered'))
+                               | FLAG_RIGHT * bool(trigger_result.get('right_triggered')))
+            action = trigger_result.get('action', 'none')
+            record['action'] = ACTIONS.index(action) if action in ACTIONS else 0
+        self._index.write(record.tobytes())
+        self._index.flush()
+        self.windows += 1
+
+    def stats(self):
+        """Finestre indicizzate, frame scritti e rapporto rispetto al salvataggio di ogni finestra intera."""
+        window_frames = self.windows * self.window_frames
+        return {
+            'windows': self.windows,
+            'segments': self.segment + 1,
+            'frames_written': self.frames_written,
+            'write_ratio': round(self.frames_written / window_frames, 3) if window_frames else None,
+        }
+
+    def close(self):
+        for f in (self._audio, self._index):
+            if f is not None:
+                f.close()
+        self._audio = None
+        self._index = None
+
+
+class WindowArchiveReader:
+    """
+    Lettura di un archivio (anche mentre il detector scrive): indice in memoria,
+    audio dei segmenti tramite memmap.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "archive.json")) as f:
+            self.info = json.load(f)
+        self.sample_rate = self.info["sample_rate"]
+        self.refresh()
+
+    def refresh(self):
+        """Rilegge l'indice (solo i record completi)."""
+        path = os.path.join(self.directory, "index.bin")
+        count = os.path.getsize(path) // INDEX_DTYPE.itemsize if os.path.exists(path) else 0
+        self.index = np.fromfile(path, dtype=INDEX_DTYPE, count=count) if count else np.zeros(0, INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _segment(self, segment):
+        return np.memmap(_segment_path(self.directory, segment), dtype=np.int16, mode='r').reshape(-1, CHANNELS)
+
+    def window(self, i, as_float=True):
+        """
+        Ricostruisce la finestra ``i`` (posizione nell'indice).
+
+        Args:
+            i (int): Posizione nell'indice
+            as_float (bool): True = float32 in [-1, 1], False = int16
+
+        Returns:
+            tuple: (left, right)
+        """
+        record = self.index[i]
+        offset, frames = int(record['offset']), int(record['frames'])
+        stereo = np.array(self._segment(int(record['segment']))[offset:offset + frames])
+        if as_float:
+            stereo = stereo.astype(np.float32) / 32767
+        return stereo[:, 0], stereo[:, 1]
+
+    def find(self, start_frame):
+        """Posizione nell'indice della finestra che inizia a ``start_frame`` (None se assente)."""
+        matches = np.flatnonzero(self.index['start_frame'] == start_frame)
+        return int(matches[-1]) if matches.size else None
+
+    def select(self, start=None, end=None, triggered=None):
+        """
+        Posizioni delle finestre in un intervallo di tempo (epoch, estremi inclusi).
+
+        Args:
+            triggered (bool): True = solo finestre con almeno un trigger, False = solo senza
+        """
+        mask = np.ones(len(self.index), dtype=bool)
+        if start is not None:
+            mask &= self.index['time'] >= start
+        if end is not None:
+            mask &= self.index['time'] <= end
+        if triggered is not None:
+            mask &= (self.index['flags'] != 0) == triggered
+        return np.flatnonzero(mask)
+
+    def record(self, i):
+        """Record dell'indice come dizionario (azione e flag decodificati)."""
+        record = self.index[i]
+        return {
+            'start_frame': int(record['start_frame']),
+            'time': float(record['time']),
+            'counter': int(record['counter']),
+            'segment': int(record['segment']),
+            'frames': int(record['frames']),
+            'left_triggered': bool(record['flags'] & FLAG_LEFT),
+            'right_triggered': bool(record['flags'] & FLAG_RIGHT),
+            'action': ACTIONS[record['action']],
+        }
+
+
+def latest_archive(directory=WINDOW_SAVES_DIR):
+    """Directory di archivio più recente in ``directory`` (None se non ce ne sono)."""
+    archives = sorted(glob.glob(os.path.join(directory, "archive_*")))
+    return archives[-1] if archives else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legge l'archivio delle finestre di analisi")
+    parser.add_argument("directory", nargs="?", help="Directory dell'archivio (default: la più recente)")
+    parser.add_argument("--export", nargs=2, metavar=("N", "WAV"), help="Salva la finestra N come WAV stereo")
+    args = parser.parse_args()
+
+    directory = args.directory or latest_archive()
+    if directory is None:
+        parser.error(f"nessun archivio in {WINDOW_SAVES_DIR}")
+    reader = WindowArchiveReader(directory)
+    if args.export:
+        i, path = int(args.export[0]), args.export[1]
+        left, right = reader.window(i, as_float=False)
+        wavfile.write(path, reader.sample_rate, np.stack((left, right), axis=-1))
+        print(f"Finestra {i} ({reader.record(i)['action']}) salvata in {path}")
+        return
+
+    print(f"{directory}: {len(reader)} finestre, sample rate {reader.sample_rate} Hz")
+    for i in reader.select(triggered=True)[-20:]:
+        record = reader.record(i)
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record['time']))
+        print(f"  #{i} {when} frame={record['start_frame']} counter={record['counter']} action={record['action']}")
+
+
+if __name__ == '__main__':
+    main()
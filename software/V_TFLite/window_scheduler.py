@@ -0,0 +1,162 @@
+#!/home/delfi/Prova_Delfi/.venv/bin/python3
+"""
+Window Scheduler Module
+Costruisce le finestre di analisi (WINDOW_SEC, hop HALF_WINDOW) a partire dal contatore
+di frame del ring, invece che dal tempo trascorso: ogni hop viene analizzato esattamente
+una volta, i buchi (blocchi persi) e i ritardi di elaborazione diventano contatori espliciti.
+"""
+
+import numpy as np
+
+from config import WINDOW_SEC, HALF_WINDOW, MAX_CATCHUP_HOPS
+
+# Margine aggiunto all'attesa per dare tempo al ring di ricevere l'ultimo blocco JACK
+WAIT_MARGIN_SEC = 0.005
+
+
+class WindowScheduler:
+    """
+    Accumula l'audio stereo indicizzato per frame assoluto e restituisce le finestre
+    pronte sulla griglia ``start = start_0 + k * hop``.
+    """
+
+    def __init__(self, sample_rate, window_sec=WINDOW_SEC, hop_sec=HALF_WINDOW,
+                 max_catchup_hops=MAX_CATCHUP_HOPS):
+        """
+        Inizializza lo scheduler.
+
+        Args:
+            sample_rate (int): Frequenza di campionamento (Hz)
+            window_sec (float): Durata della finestra (s)
+            hop_sec (float): Passo tra finestre consecutive (s)
+            max_catchup_hops (int): Finestre arretrate elaborate in un colpo; oltre, le più vecchie sono scartate
+        """
+        self.sample_rate = sample_rate
+        self.window = int(round(sample_rate * window_sec))
+        self.hop = int(round(sample_rate * hop_sec))
+        self.max_catchup_hops = max(1, int(max_catchup_hops))
+
+        capacity = self.window + self.hop * (self.max_catchup_hops + 1)
+        self._buf = np.zeros((capacity, 2), dtype=np.float32)
+        self._head = 0          # indice in _buf del primo frame valido
+        self._len = 0           # frame validi in _buf
+        self._start_frame = 0   # frame assoluto di _buf[_head]
+
+        # Frame assoluto di inizio della prossima finestra (None = griglia non ancora ancorata)
+        self.next_start = None
+
+        # Contatori
+        self.windows = 0            # finestre prodotte
+        self.dropped_hops = 0       # hop mai analizzati (buchi nel ring o arretrato eccessivo)
+        self.catchup_windows = 0    # finestre prodotte in recupero (più di una per lettura)
+        self.overruns = 0           # finestre elaborate in più di un hop
+        self.gap_frames = 0         # frame mancanti nel flusso del ring
+
+    @property
+    def end_frame(self):
+        """Frame assoluto successivo all'ultimo frame ricevuto."""
+        return self._start_frame + self._len
+
+    def _discard_before(self, frame):
+        """Dimentica l'audio precedente a ``frame`` (non serve più a nessuna finestra)."""
+        k = min(max(0, frame - self._start_frame), self._len)
+        self._head += k
+        self._len -= k
+        self._start_frame += k
+
+    def _append(self, stereo):
+        n = len(stereo)
+        if self._head + self._len + n > len(self._buf):
+            # Compatta all'inizio del buffer, se non basta lo allarga
+            if self._len + n > len(self._buf):
+                grown = np.zeros((self._len + n, 2), dtype=np.float32)
+                grown[:self._len] = self._buf[self._head:self._head + self._len]
+                self._buf = grown
+            else:
+                self._buf[:self._len] = self._buf[self._head:self._head + self._len]
+            self._head = 0
+        tail = self._head + self._len
+        self._buf[tail:tail + n] = stereo
+        self._len += n
+
+    def _reset(self, first_frame):
+        self._head = 0
+        self._len = 0
+        self._start_frame = first_frame
+
+    def push(self, stereo, first_frame):
+        """
+        Accoda nuovo audio stereo.
+
+        Args:
+            stereo (numpy.ndarray): Array (N, 2) float32
+            first_frame (int): Frame assoluto del primo campione di ``stereo``
+        """
+        n = len(stereo)
+        if n == 0:
+            return
+        if self.next_start is None or first_frame < self.end_frame:
+            # Primo blocco (o contatore del ring ripartito): la prima finestra termina sull'ultimo frame ricevuto
+            self._reset(first_frame)
+            self.next_start = max(first_frame, first_frame + n - self.window)
+        elif first_frame > self.end_frame:
+            # Buco nel flusso: le finestre che lo contengono non sono ricostruibili
+            self.gap_frames += first_frame - self.end_frame
+            if first_frame > self.next_start:
+                skipped = -(-(first_frame - self.next_start) // self.hop)
+                self.dropped_hops += skipped
+                self.next_start += skipped * self.hop
+            self._reset(first_frame)
+        self._discard_before(self.next_start)
+        self._append(stereo)
+
+    def pop_windows(self):
+        """
+        Ritorna le finestre complete disponibili, in ordine.
+        Se l'arretrato supera ``max_catchup_hops`` le finestre più vecchie vengono scartate.
+
+        Returns:
+            list: [(start_frame, left_block, right_block), ...]
+        """
+        if self.next_start is None or self.end_frame < self.next_start + self.window:
+            return []
+        ready = (self.end_frame - self.window - self.next_start) // self.hop + 1
+        if ready > self.max_catchup_hops:
+            skipped = ready - self.max_catchup_hops
+            self.dropped_hops += skipped
+            self.next_start += skipped * self.hop
+            ready = self.max_catchup_hops
+        if ready > 1:
+            self.catchup_windows += ready - 1
+
+        windows = []
+        for _ in range(ready):
+            offset = self._head + self.next_start - self._start_frame
+            block = self._buf[offset:offset + self.window]
+            windows.append((self.next_start, block[:, 0].copy(), block[:, 1].copy()))
+            self.next_start += self.hop
+            self.windows += 1
+        self._discard_before(self.next_start)
+        return windows
+
+    def record_latency(self, latency_sec):
+        """Registra il tempo di elaborazione di una finestra (overrun se supera l'hop)."""
+        if latency_sec > self.hop / self.sample_rate:
+            self.overruns += 1
+
+    def seconds_until_next_window(self):
+        """Attesa stimata finché il ring contiene l'audio della prossima finestra."""
+        if self.next_start is None:
+            return self.hop / self.sample_rate
+        missing = self.next_start + self.window - self.end_frame
+        return max(0.0, missing / self.sample_rate) + WAIT_MARGIN_SEC
+
+    def stats(self):
+        """Contatori dello scheduler."""
+        return {
+            'windows': self.windows,
+            'dropped_hops': self.dropped_hops,
+            'catchup_windows': self.catchup_windows,
+            'overruns': self.overruns,
+            'gap_frames': self.gap_frames,
+        }
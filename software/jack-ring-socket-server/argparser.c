@@ -25,6 +25,9 @@ error_t parse_opt(int key, char *arg, struct argp_state *state){
         case 'n':
             arguments->name = arg;
             break;
+        case 'm':
+            arguments->shm_name = arg;
+            break;
 
         default:
             return ARGP_ERR_UNKNOWN;
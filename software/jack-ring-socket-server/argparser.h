@@ -16,6 +16,7 @@ static struct argp_option options[] = {
     {"name", 'n', "name", 0, "jack-client name"},
     {"port", 'p', "port", 0, "daemon tcp port"},
     {"seconds", 's', "seconds", 0, "seconds to store in the ringbuffer"},
+    {"shm", 'm', "shm", 0, "also expose the ringbuffer as a POSIX shared-memory object (e.g. /delfi_ring)"},
     {0}
 };
 
@@ -24,6 +25,7 @@ struct arguments{
     int  port;
     int  seconds;
     char *name;
+    char *shm_name;
 };
 
 #endif
@@ -16,6 +16,7 @@
 #include <arpa/inet.h>
 #include <jack/jack.h>
 #include <argp.h>
+#include <pthread.h>
 
 
 #include "jackclient.h"
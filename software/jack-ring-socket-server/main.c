@@ -35,6 +35,7 @@ int main (int argc, char *argv[]) {
         arguments.name="RingServer";
         arguments.port=8888;
         arguments.seconds=2;
+        arguments.shm_name=NULL;
         // parse the cli arguments.so	
         argp_parse(&argp, argc, argv, 0, 0, &arguments);
 
@@ -61,6 +62,12 @@ int main (int argc, char *argv[]) {
 	int nelements = jack_get_sample_rate(client) / jack_get_buffer_size(client) * arguments.seconds;  // manca n seconds!
 	create_sample_ring(&MyRing, nelements, jack_get_sample_rate (client), jack_get_buffer_size(client), arguments.seconds);
 	ring_debug(&MyRing);
+	if (arguments.shm_name != NULL) {
+		if (attach_shm_ring(&MyRing, arguments.shm_name) < 0) {
+			fprintf (stderr, "cannot create shared memory ring %s\n", arguments.shm_name);
+			exit (1);
+		}
+	}
 	/* tell the JACK server to call `process()' whenever
 	   there is work to be done.
 	*/
@@ -166,7 +173,7 @@ int main (int argc, char *argv[]) {
 		puts("Connection accepted");
 		
 	        pthread_t sniffer_thread;
-		new_sock = malloc(1);
+		new_sock = malloc(sizeof(int));
 		*new_sock = new_socket;
 		
 		if( pthread_create( &sniffer_thread , NULL ,  connection_handler , (void*) new_sock) < 0)
@@ -8,6 +8,9 @@
 #include <stdio.h> 
 #include <stdlib.h>
 #include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
 #include "ringbuffer.h"
 
 /** function create_sample_ring
@@ -30,6 +33,8 @@ int create_sample_ring(sample_ring *ring, int nelements, jack_nframes_t samplera
     ring->nframes = nframes;
     ring->samplerate = samplerate;
     ring->seconds = seconds;
+    ring->count = 0;
+    ring->shm = NULL;
     // defining 3 ring element pointers
     ring_node *first,*current,*new;
     // a pointer to the audio data block
@@ -56,9 +61,11 @@ int create_sample_ring(sample_ring *ring, int nelements, jack_nframes_t samplera
              current = new;
         }
         current->data = data;
+        current->seq = 0;
     }
     // closing the ring...
     current->next = first;
+    ring->first = first;
     ring->last = first;
     return 1;
 }
@@ -105,6 +112,115 @@ int add_to_ring(sample_ring *ring, jack_default_audio_sample_t *data){
      ring_node *current;
      current = ring->last;
      memcpy (current->data, data, sizeof (jack_default_audio_sample_t) * ring->nframes * 2);
+     current->seq = ring->count + 1;
      ring->last = current->next;
+     // published last, so readers never see a counter ahead of the data
+     __atomic_store_n(&ring->count, current->seq, __ATOMIC_RELEASE);
+     if (ring->shm != NULL) {
+         ring->shm->write_index = current->seq % ring->len;
+         __atomic_store_n(&ring->shm->count, current->seq, __ATOMIC_RELEASE);
+     }
      return 1;     
 }
+
+
+/** function ring_count
+ *     return the number of blocks written so far (the seq of the newest block)
+ *
+ * Input values:
+ *     sample_ring *ring: a pointer to the global defined ring structure
+ *
+ * returns:
+ *     the progressive number of the last stored block, 0 if the ring is still empty
+ */
+unsigned long long ring_count(sample_ring *ring){
+     return __atomic_load_n(&ring->count, __ATOMIC_ACQUIRE);
+}
+
+
+/** function ring_find
+ *     return the node holding the block with the given progressive number.
+ *     Block ``seq`` is always stored in node ``(seq - 1) % len`` counting from ring->first.
+ *
+ * Input values:
+ *     sample_ring *ring: a pointer to the global defined ring structure
+ *     unsigned long long seq: progressive number of the wanted block (>= 1)
+ *
+ * returns:
+ *     the ring_node pointer (the caller must check node->seq, it may be overwritten)
+ */
+ring_node *ring_find(sample_ring *ring, unsigned long long seq){
+     ring_node *current = ring->first;
+     unsigned long long i;
+     for (i = (seq - 1) % ring->len; i > 0; i--) {
+         current = current->next;
+     }
+     return current;
+}
+
+
+/** function attach_shm_ring
+ *     move the ring data blocks into a POSIX shared-memory segment, so that local
+ *     readers can map the audio without going through the tcp socket.
+ *     Layout: a shm_ring_header followed by ``len`` contiguous blocks, block ``seq``
+ *     is stored in slot ``(seq - 1) % len``. Must be called before the jack client is activated.
+ *
+ * Input values:
+ *     sample_ring *ring: a pointer to the global defined ring structure
+ *     const char *name: shared-memory object name (e.g. "/delfi_ring")
+ *
+ * returns:
+ *     1 in case of success
+ *     -1 otherwise
+ */
+int attach_shm_ring(sample_ring *ring, const char *name){
+    size_t blocksize = sizeof (jack_default_audio_sample_t) * ring->nframes * 2;
+    size_t size = sizeof (shm_ring_header) + blocksize * ring->len;
+
+    // a stale segment from a previous run could have a different size
+    shm_unlink(name);
+    int fd = shm_open(name, O_CREAT | O_RDWR, 0644);
+    if (fd < 0) {
+        perror("shm_open");
+        return -1;
+    }
+    if (ftruncate(fd, size) < 0) {
+        perror("ftruncate");
+        close(fd);
+        return -1;
+    }
+    void *base = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (base == MAP_FAILED) {
+        perror("mmap");
+        return -1;
+    }
+
+    shm_ring_header *header = base;
+    memset(header, 0, sizeof (shm_ring_header));
+    header->nframes = ring->nframes;
+    header->samplerate = ring->samplerate;
+    header->len = ring->len;
+    header->channels = 2;
+    header->count = ring->count;
+    header->write_index = ring->count % ring->len;
+
+    // the nodes keep their order, only the data pointers move into the segment
+    char *blocks = (char *) base + sizeof (shm_ring_header);
+    ring_node *current = ring->first;
+    int i = 0;
+    do {
+        memcpy(blocks + i * blocksize, current->data, blocksize);
+        free(current->data);
+        current->data = (jack_default_audio_sample_t *) (blocks + i * blocksize);
+        current = current->next;
+        i++;
+    } while (current != ring->first);
+
+    header->version = SHM_RING_VERSION;
+    // magic written last: readers wait for it before trusting the header
+    __atomic_store_n(&header->magic, SHM_RING_MAGIC, __ATOMIC_RELEASE);
+    ring->shm = header;
+    printf("Ring shared in memory as %s (%zu bytes)\n", name, size);
+    return 1;
+}
@@ -3,6 +3,7 @@
  */
  
 #include <jack/jack.h> 
+#include <stdint.h>
  
 #ifndef RINGBUFFER
 #define RINGBUFFER
@@ -11,20 +12,45 @@
     jack_default_audio_sample_t *data;
     struct ring_node_t *next;  
     unsigned short int populated; 
+    unsigned long long seq;     // progressive number of the stored block (0 = never written)
 } ring_node, *p_ring_node;
 
 
+// header of the optional POSIX shared-memory segment (64 bytes), followed by
+// ``len`` blocks of ``nframes`` interleaved stereo float32 frames
+#define SHM_RING_MAGIC 0x474e5244   // "DRNG"
+#define SHM_RING_VERSION 1
+
+typedef struct shm_ring_header_t {
+    uint32_t magic;
+    uint32_t version;
+    uint32_t nframes;
+    uint32_t samplerate;
+    uint32_t len;
+    uint32_t channels;
+    uint64_t count;             // progressive number of the newest block
+    uint32_t write_index;       // block slot that will be written next
+    uint32_t reserved[7];
+} shm_ring_header;
+
+
 typedef struct sample_ring_t{
     int len;
     unsigned short int populated;
     jack_nframes_t nframes;
     jack_nframes_t samplerate;
     int seconds;
+    unsigned long long count;   // total number of blocks written since start
+    ring_node *first;
     ring_node *last;  
+    shm_ring_header *shm;       // NULL when the ring is not shared
 } sample_ring;
 
 int create_sample_ring(sample_ring *, int, jack_nframes_t, jack_nframes_t, int);
 int ring_debug(sample_ring *);
 int add_to_ring(sample_ring *, jack_default_audio_sample_t *);
+unsigned long long ring_count(sample_ring *);
+ring_node *ring_find(sample_ring *, unsigned long long);
+int attach_shm_ring(sample_ring *, const char *);
 
 #endif
@@ -1,10 +1,79 @@
 /** @file socketserver.c
- * 
+ *
+ * Text commands (every reply is a fixed 256 bytes record, newline terminated):
+ *     rate, len, nframes, seconds   single value
+ *     info                          "nframes len rate seconds count"
+ *     dump                          the whole ring, oldest block first (raw float32)
+ *     since <N>                     "first count" record followed by the ``count`` raw blocks
+ *                                   with progressive number > N (first is the number of the
+ *                                   first block sent, gaps mean overwritten blocks)
+ *
+ * The connection stays open until the client closes it, so a long-lived client
+ * can poll with ``since`` and receive only the new audio.
  */
- 
- 
+
+
 #include "jack-ring-socket-server.h"
- 
+
+/** function send_all
+ *     send the whole buffer, looping over partial writes
+ *
+ * returns:
+ *     0 in case of success, -1 otherwise
+ */
+static int send_all(int sock, const void *buf, size_t len)
+{
+	const char *p = buf;
+	while (len > 0) {
+		ssize_t sent = send(sock, p, len, MSG_NOSIGNAL);
+		if (sent <= 0) {
+			return -1;
+		}
+		p += sent;
+		len -= sent;
+	}
+	return 0;
+}
+
+/** function send_since
+ *     send the blocks stored after the given progressive number.
+ *     The oldest stored block is skipped because jack is about to overwrite it.
+ */
+static int send_since(int sock, unsigned long long after)
+{
+	char out[256];
+	size_t blocksize = sizeof (jack_default_audio_sample_t) * MyRing.nframes * 2;
+	unsigned long long last = ring_count(&MyRing);
+	unsigned long long first = after + 1;
+	unsigned long long oldest = 1;
+	unsigned long long n = 0;
+
+	if (last + 2 > (unsigned long long) MyRing.len) {
+		oldest = last + 2 - MyRing.len;
+	}
+	if (first < oldest) {
+		first = oldest;
+	}
+	if (last >= first) {
+		n = last - first + 1;
+	}
+	memset(out, 0, sizeof(out));
+	sprintf(out,"%llu %llu\n", first, n);
+	if (send_all(sock, out, sizeof(out)) < 0) {
+		return -1;
+	}
+
+	ring_node *current = ring_find(&MyRing, first);
+	unsigned long long i;
+	for (i = 0; i < n; i++) {
+		if (send_all(sock, current->data, blocksize) < 0) {
+			return -1;
+		}
+		current = current -> next;
+	}
+	return 0;
+}
+
 void *connection_handler(void *socket_desc)
 {
 	//Get the socket descriptor
@@ -12,7 +81,9 @@ void *connection_handler(void *socket_desc)
 	int readed;
 	char client_data[4096];
 	char out[256];
-	while ((readed = recv(sock, client_data, sizeof(client_data),0)) > 0) {
+	while ((readed = recv(sock, client_data, sizeof(client_data) - 1,0)) > 0) {
+            client_data[readed] = '\0';
+            memset(out, 0, sizeof(out));
             if (strncmp(client_data,"rate",4)==0){
                 sprintf(out,"%d\n",MyRing.samplerate);
                 write (sock, out, sizeof(out));            
@@ -29,6 +100,17 @@ void *connection_handler(void *socket_desc)
                 sprintf(out,"%d\n",MyRing.seconds);
                 write (sock, out, sizeof(out));            
             }            
+            if (strncmp(client_data,"info",4)==0){
+                sprintf(out,"%d %d %d %d %llu\n",MyRing.nframes,MyRing.len,MyRing.samplerate,
+                        MyRing.seconds,ring_count(&MyRing));
+                write (sock, out, sizeof(out));
+            }
+            if (strncmp(client_data,"since",5)==0){
+                unsigned long long after = strtoull(client_data + 5, NULL, 10);
+                if (send_since(sock, after) < 0) {
+                    break;
+                }
+            }
             if (strncmp(client_data,"dump",4)==0){
                 ring_node *first,*current;
                 first = current = MyRing.last;
@@ -50,6 +132,7 @@ void *connection_handler(void *socket_desc)
         }
 	
 	//Free the socket pointer
+	close(sock);
 	free(socket_desc);
 	
 	return 0;